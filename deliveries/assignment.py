@@ -0,0 +1,182 @@
+import heapq
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Q
+
+from users.utils import haversine_matrix
+
+# Final auction step in km; the total pickup distance ends up within
+# len(deliveries) * DEFAULT_EPSILON_KM of the optimum
+DEFAULT_EPSILON_KM = 0.01
+
+# Value of covering one delivery, in multiples of the longest usable edge; high
+# enough that the solver prefers covering more deliveries over shorter pickups
+COVERAGE_WEIGHT = 10
+
+ACTIVE_DELIVERY_STATUSES = ['assigned', 'picked_up', 'in_transit']
+
+
+def solve_assignment(distances, capacities, max_distances, epsilon=DEFAULT_EPSILON_KM):
+    """
+    Capacity-aware assignment of deliveries (rows) to volunteers (columns)
+    minimising total distance, using a forward auction
+    An edge is usable only when distances[i, j] <= max_distances[j]; deliveries
+    with no usable edge, or outbid once every volunteer is full, stay unassigned
+    Returns an int array with the volunteer column per delivery, or -1
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    capacities = np.asarray(capacities, dtype=np.int64)
+    max_distances = np.asarray(max_distances, dtype=np.float64)
+    n, m = distances.shape
+
+    feasible = (distances <= max_distances[np.newaxis, :]) & (capacities[np.newaxis, :] > 0)
+    if n == 0 or not feasible.any():
+        return np.full(n, -1, dtype=np.int64)
+
+    # Every assignment is worth `reward` km minus its distance; leaving a
+    # delivery unassigned is worth 0
+    reward = COVERAGE_WEIGHT * (float(distances[feasible].max()) + 1.0)
+    benefit = np.where(feasible, reward - distances, -np.inf)
+
+    # A single phase from zero prices keeps unclaimed seats at the minimum price,
+    # which is what makes the forward auction epsilon-optimal when deliveries may
+    # stay unassigned (epsilon-scaling would need a reverse pass as well)
+    slots = [[(0.0, -1)] * int(max(capacity, 0)) for capacity in capacities]
+    prices = np.where(capacities > 0, 0.0, np.inf)
+    return _auction_phase(benefit, slots, prices, epsilon)
+
+
+def _auction_phase(benefit, slots, prices, step):
+    """
+    Jacobi auction at a fixed bid step
+    slots[j] is a min-heap of (price, delivery) per volunteer seat, and
+    prices[j] mirrors its cheapest seat
+    """
+    n, m = benefit.shape
+    assignment = np.full(n, -1, dtype=np.int64)
+    unassigned = np.flatnonzero(np.isfinite(benefit).any(axis=1))
+
+    while unassigned.size:
+        values = benefit[unassigned] - prices[np.newaxis, :]
+        rows = np.arange(unassigned.size)
+        best_col = np.argmax(values, axis=1)
+        best = values[rows, best_col]
+
+        # Staying unassigned is always worth 0
+        values[rows, best_col] = -np.inf
+        second = np.maximum(values.max(axis=1), 0.0) if m > 1 else np.zeros(unassigned.size)
+
+        # Prices only rise, so a delivery priced out now stays out for the phase
+        bidding = best > 0
+        unassigned, best_col = unassigned[bidding], best_col[bidding]
+        bids = prices[best_col] + (best[bidding] - second[bidding]) + step
+
+        outbid = []
+        for index in np.lexsort((-bids, best_col)):
+            delivery, volunteer, bid = int(unassigned[index]), int(best_col[index]), float(bids[index])
+            seats = slots[volunteer]
+            if bid <= seats[0][0]:
+                outbid.append(delivery)
+                continue
+
+            _, evicted = heapq.heapreplace(seats, (bid, delivery))
+            assignment[delivery] = volunteer
+            prices[volunteer] = seats[0][0]
+            if evicted >= 0:
+                assignment[evicted] = -1
+                outbid.append(evicted)
+
+        unassigned = np.array(outbid, dtype=np.int64)
+
+    return assignment
+
+
+def remaining_capacities(volunteers):
+    """Seats left per VolunteerProfile after deliveries already in progress"""
+    from django.contrib.auth import get_user_model
+
+    active = dict(
+        get_user_model().objects
+        .filter(pk__in=[volunteer.user_id for volunteer in volunteers])
+        .annotate(active=Count(
+            'volunteer_deliveries',
+            filter=Q(volunteer_deliveries__status__in=ACTIVE_DELIVERY_STATUSES),
+        ))
+        .values_list('pk', 'active')
+    )
+    return np.array(
+        [max(volunteer.max_delivery_capacity - active.get(volunteer.user_id, 0), 0) for volunteer in volunteers],
+        dtype=np.int64,
+    )
+
+
+def assign_pending_deliveries(dry_run=False, epsilon=DEFAULT_EPSILON_KM):
+    """
+    Match every payment_confirmed delivery to available volunteers in one pass
+    and write the assignments with one guarded UPDATE in a single transaction
+    Returns a dict with the assigned, unassigned and conflicting (changed meanwhile)
+    delivery ids and total pickup km
+    """
+    from volunteers.spatial_index import volunteers_covering
+    from .models import Delivery
+    from .transitions import assign_many
+
+    with transaction.atomic():
+        deliveries = list(
+            Delivery.objects
+            .select_for_update(skip_locked=True)
+            .filter(status='payment_confirmed', volunteer__isnull=True)
+            .only('id', 'status', 'volunteer_id', 'pickup_latitude', 'pickup_longitude')
+        )
+        # Only volunteers that can reach at least one pickup become matrix columns
+        volunteers = list(
+            volunteers_covering((d.pickup_latitude, d.pickup_longitude) for d in deliveries)
+            .order_by('id')
+            .only('id', 'user_id', 'current_latitude', 'current_longitude',
+                  'max_delivery_capacity', 'service_radius_km')
+        )
+
+        if not deliveries or not volunteers:
+            return {
+                'assigned': {},
+                'unassigned': [d.id for d in deliveries],
+                'conflicts': [],
+                'total_distance_km': 0.0,
+            }
+
+        distances = haversine_matrix(
+            [d.pickup_latitude for d in deliveries],
+            [d.pickup_longitude for d in deliveries],
+            [v.current_latitude for v in volunteers],
+            [v.current_longitude for v in volunteers],
+        )
+        assignment = solve_assignment(
+            distances,
+            remaining_capacities(volunteers),
+            np.array([v.service_radius_km for v in volunteers], dtype=np.float64),
+            epsilon=epsilon,
+        )
+
+        assigned, unassigned, pickup_km = {}, [], {}
+        for index, delivery in enumerate(deliveries):
+            column = assignment[index]
+            if column < 0:
+                unassigned.append(delivery.id)
+                continue
+            assigned[delivery.id] = volunteers[column].user_id
+            pickup_km[delivery.id] = float(distances[index, column])
+
+        # The UPDATE is guarded on the status, so a delivery cancelled or assigned
+        # by someone else meanwhile is reported instead of overwritten
+        conflicts = [] if dry_run else assign_many(assigned)
+        for delivery_id in conflicts:
+            del assigned[delivery_id]
+        total_km = sum(pickup_km[delivery_id] for delivery_id in assigned)
+
+    return {
+        'assigned': assigned,
+        'unassigned': unassigned,
+        'conflicts': conflicts,
+        'total_distance_km': round(total_km, 2),
+    }
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from deliveries.assignment import DEFAULT_EPSILON_KM, assign_pending_deliveries
+
+
+class Command(BaseCommand):
+    help = 'Assign all payment_confirmed deliveries to available volunteers in one batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Solve without writing assignments')
+        parser.add_argument('--epsilon', type=float, default=DEFAULT_EPSILON_KM,
+                            help='Auction bid step in km (optimality gap per delivery)')
+
+    def handle(self, *args, **options):
+        result = assign_pending_deliveries(dry_run=options['dry_run'], epsilon=options['epsilon'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Assigned {len(result['assigned'])} deliveries "
+            f"({result['total_distance_km']} km total pickup), "
+            f"{len(result['unassigned'])} left unassigned, "
+            f"{len(result['conflicts'])} changed by someone else"
+            + (' [dry run]' if options['dry_run'] else '')
+        ))
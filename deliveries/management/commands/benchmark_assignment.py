@@ -0,0 +1,52 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from deliveries.assignment import DEFAULT_EPSILON_KM, solve_assignment
+from users.utils import haversine_matrix
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the batch assignment solver on synthetic deliveries and volunteers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--deliveries', type=int, default=1000)
+        parser.add_argument('--volunteers', type=int, default=1000)
+        parser.add_argument('--span-deg', type=float, default=0.3, help='Side of the square city area in degrees')
+        parser.add_argument('--max-capacity', type=int, default=5)
+        parser.add_argument('--epsilon', type=float, default=DEFAULT_EPSILON_KM)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        n, m, span = options['deliveries'], options['volunteers'], options['span_deg']
+
+        # Centred on Pune, matching the geocoder's default coordinates
+        pickup_lats = 18.5204 + (rng.random(n) - 0.5) * span
+        pickup_lons = 73.8567 + (rng.random(n) - 0.5) * span
+        volunteer_lats = 18.5204 + (rng.random(m) - 0.5) * span
+        volunteer_lons = 73.8567 + (rng.random(m) - 0.5) * span
+        capacities = rng.integers(1, options['max_capacity'] + 1, m)
+        radii = rng.choice([5.0, 10.0, 15.0], m)
+
+        start = time.perf_counter()
+        distances = haversine_matrix(pickup_lats, pickup_lons, volunteer_lats, volunteer_lons)
+        matrix_ms = (time.perf_counter() - start) * 1000
+
+        timings = []
+        for _ in range(options['repeat']):
+            start = time.perf_counter()
+            assignment = solve_assignment(distances, capacities, radii, epsilon=options['epsilon'])
+            timings.append((time.perf_counter() - start) * 1000)
+
+        assigned = np.flatnonzero(assignment >= 0)
+        total_km = distances[assigned, assignment[assigned]].sum()
+
+        self.stdout.write(f'{n} deliveries x {m} volunteers ({capacities.sum()} seats)')
+        self.stdout.write(f'distance matrix: {matrix_ms:.1f} ms')
+        self.stdout.write(f'solver: best {min(timings):.1f} ms, median {float(np.median(timings)):.1f} ms')
+        self.stdout.write(f'assigned {assigned.size}/{n}, total pickup {total_km:.2f} km, '
+                          f'mean {total_km / max(assigned.size, 1):.2f} km, '
+                          f'gap bound {n * options["epsilon"]:.2f} km')
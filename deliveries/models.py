@@ -1,7 +1,7 @@
 from django.db import models
 from django.conf import settings
 from decimal import Decimal
-import random
+import secrets
 import string
 
 class Delivery(models.Model):
@@ -61,16 +61,25 @@ class Delivery(models.Model):
         return f"Delivery #{self.id} - {self.get_status_display()}"
     
     def generate_otp(self):
-        self.delivery_otp = ''.join(random.choices(string.digits, k=6))
-        self.save()
+        """Issue a new OTP; writes only the OTP columns"""
+        self.delivery_otp = ''.join(secrets.choice(string.digits) for _ in range(6))
+        self.otp_verified = False
+        Delivery.objects.filter(id=self.id).update(delivery_otp=self.delivery_otp, otp_verified=False)
         return self.delivery_otp
     
     def verify_otp(self, otp):
-        if self.delivery_otp == otp:
+        """Mark the OTP verified if otp matches, in one conditional UPDATE"""
+        if not otp:
+            return False
+        verified = Delivery.objects.filter(id=self.id, delivery_otp=otp).update(otp_verified=True)
+        if verified:
             self.otp_verified = True
-            self.save()
-            return True
-        return False
+        return bool(verified)
+    
+    def transition_to(self, status, **fields):
+        """See deliveries.transitions.transition"""
+        from .transitions import transition
+        return transition(self, status, **fields)
 
 
 class DeliveryFee(models.Model):
@@ -1,3 +1,198 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from donations.models import Donation
+from users.models import CustomUser
+from users.utils import haversine_distance
+from volunteers.models import VolunteerProfile
+from volunteers import spatial_index
+from volunteers.spatial_index import volunteer_index
+from .assignment import assign_pending_deliveries
+from .models import Delivery
+from .transitions import InvalidTransition, assign, cancel, transition, unassign
+
+
+class DeliveryTransitionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.donor = CustomUser.objects.create(username='donor@example.com', full_name='Donor', role='donor_restaurant')
+        cls.receiver = CustomUser.objects.create(username='ngo@example.com', full_name='NGO', role='receiver_ngo')
+        cls.riders = CustomUser.objects.bulk_create([
+            CustomUser(username=f'rider{i}@example.com', full_name=f'Rider {i}', role='volunteer') for i in range(2)
+        ])
+        cls.donation = Donation.objects.create(
+            donor=cls.donor, food_title='Thali', description='Fresh', quantity='10 plates', pickup_location='Pune',
+            expiry_date=timezone.localdate() + timedelta(days=1),
+        )
+
+    def make_delivery(self, status='payment_confirmed'):
+        return Delivery.objects.create(
+            donation=self.donation, receiver=self.receiver, status=status,
+            pickup_latitude=18.52, pickup_longitude=73.85, pickup_address='Pune',
+            delivery_latitude=18.53, delivery_longitude=73.86, delivery_address='Pune',
+        )
+
+    def test_lifecycle_stamps_each_timestamp(self):
+        delivery = self.make_delivery()
+        with self.assertNumQueries(1):
+            self.assertTrue(assign(delivery, self.riders[0].id))
+        self.assertTrue(transition(delivery, 'picked_up'))
+        otp = delivery.generate_otp()
+        self.assertTrue(delivery.verify_otp(otp))
+        self.assertTrue(transition(delivery, 'delivered'))
+        self.assertTrue(delivery.transition_to('completed'))
+
+        stored = Delivery.objects.get(id=delivery.id)
+        self.assertEqual((stored.status, stored.volunteer_id), ('completed', self.riders[0].id))
+        self.assertTrue(stored.assigned_at <= stored.picked_up_at <= stored.delivered_at <= stored.completed_at)
+        self.assertEqual(stored.completed_at, delivery.completed_at)
+
+    def test_only_one_concurrent_actor_wins(self):
+        delivery = self.make_delivery()
+        first, second = Delivery.objects.get(id=delivery.id), Delivery.objects.get(id=delivery.id)
+
+        self.assertTrue(assign(first, self.riders[0].id))
+        self.assertFalse(assign(second, self.riders[1].id))
+        # The loser now sees the stored row and can decide again
+        self.assertEqual((second.status, second.volunteer_id), ('assigned', self.riders[0].id))
+        self.assertEqual(Delivery.objects.get(id=delivery.id).volunteer_id, self.riders[0].id)
+
+        # The volunteer drops it; now a different volunteer can take it
+        self.assertTrue(unassign(first))
+        stored = Delivery.objects.get(id=delivery.id)
+        self.assertEqual((stored.status, stored.volunteer_id, stored.assigned_at), ('payment_confirmed', None, None))
+        self.assertTrue(assign(stored, self.riders[1].id))
+
+    def test_stale_instance_loses_instead_of_raising(self):
+        delivery = self.make_delivery()
+        stale = Delivery.objects.get(id=delivery.id)
+        assign(delivery, self.riders[0].id)
+        transition(delivery, 'picked_up')
+
+        # payment_confirmed -> picked_up is not a valid move, but the stored status has moved on
+        self.assertFalse(transition(stale, 'picked_up'))
+        self.assertEqual(stale.status, 'picked_up')
+        with self.assertRaises(InvalidTransition):
+            transition(stale, 'assigned', volunteer_id=self.riders[1].id)
+
+    def test_invalid_moves_are_refused(self):
+        delivery = self.make_delivery('requested')
+        with self.assertRaises(InvalidTransition):
+            transition(delivery, 'delivered')
+        with self.assertRaises(InvalidTransition):
+            transition(delivery, 'fee_calculated', volunteer_id=self.riders[0].id)
+        with self.assertRaises(InvalidTransition):
+            assign(self.make_delivery(), None)
+
+        picked_up = self.make_delivery('picked_up')
+        with self.assertRaises(InvalidTransition):
+            cancel(picked_up)
+        # Without a verified OTP the drop-off does not go through
+        self.assertFalse(transition(picked_up, 'delivered'))
+        self.assertEqual(Delivery.objects.get(id=picked_up.id).status, 'picked_up')
+
+    def test_otp_checks_touch_only_otp_columns(self):
+        delivery = self.make_delivery('picked_up')
+        with CaptureQueriesContext(connection) as queries:
+            otp = delivery.generate_otp()
+            self.assertFalse(delivery.verify_otp('x' + otp[1:]))
+            self.assertFalse(delivery.verify_otp(''))
+            self.assertTrue(delivery.verify_otp(otp))
+        self.assertEqual(len(queries), 3)
+        for query in queries:
+            self.assertNotIn('"status"', query['sql'])
+            self.assertNotIn('"delivery_address"', query['sql'])
+        self.assertTrue(Delivery.objects.get(id=delivery.id).otp_verified)
+
+
+class AssignmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        donor = CustomUser.objects.create(username='donor@example.com', full_name='Donor', role='donor_restaurant')
+        cls.receiver = CustomUser.objects.create(username='ngo@example.com', full_name='NGO', role='receiver_ngo')
+        cls.donation = Donation.objects.create(
+            donor=donor, food_title='Thali', description='Fresh', quantity='10 plates', pickup_location='Pune',
+            expiry_date=timezone.localdate() + timedelta(days=1),
+        )
+        cls.profiles = [
+            VolunteerProfile.objects.create(
+                user=CustomUser.objects.create(username=f'rider{i}@example.com', full_name=f'Rider {i}', role='volunteer'),
+                vehicle_type='bike', status='available', is_available=True, max_delivery_capacity=1,
+                current_latitude=lat, current_longitude=73.85,
+            )
+            for i, lat in enumerate([18.521, 18.601, 19.5])
+        ]
+
+    def setUp(self):
+        volunteer_index.rebuild()
+
+    def make_delivery(self, lat):
+        return Delivery.objects.create(
+            donation=self.donation, receiver=self.receiver, status='payment_confirmed',
+            pickup_latitude=lat, pickup_longitude=73.85, pickup_address='Pune',
+            delivery_latitude=18.53, delivery_longitude=73.86, delivery_address='Pune',
+        )
+
+    def test_pickups_go_to_the_nearest_volunteer_in_reach(self):
+        near, north = self.make_delivery(18.52), self.make_delivery(18.60)
+        # Gone offline without the index hearing about it
+        VolunteerProfile.objects.filter(id=self.profiles[1].id).update(is_available=False)
+
+        result = assign_pending_deliveries()
+
+        self.assertEqual(result['assigned'], {near.id: self.profiles[0].user_id})
+        self.assertEqual(result['unassigned'], [north.id])
+        near.refresh_from_db()
+        self.assertEqual((near.status, near.volunteer_id), ('assigned', self.profiles[0].user_id))
+        self.assertIsNotNone(near.assigned_at)
+
+    def test_deliveries_changed_meanwhile_are_counted_not_overwritten(self):
+        delivery = self.make_delivery(18.52)
+        covering = spatial_index.volunteers_covering
+
+        def cancel_then_cover(points):
+            # The receiver cancels while the solver is running
+            Delivery.objects.filter(id=delivery.id).update(status='cancelled')
+            return covering(points)
+
+        with mock.patch.object(spatial_index, 'volunteers_covering', cancel_then_cover):
+            result = assign_pending_deliveries()
+
+        self.assertEqual((result['assigned'], result['conflicts']), ({}, [delivery.id]))
+        delivery.refresh_from_db()
+        self.assertEqual((delivery.status, delivery.volunteer_id), ('cancelled', None))
+
+    def test_assignments_are_written_by_one_update(self):
+        near, north = self.make_delivery(18.52), self.make_delivery(18.60)
+        covering = spatial_index.volunteers_covering
+
+        def cancel_then_cover(points):
+            Delivery.objects.filter(id=north.id).update(status='cancelled')
+            return covering(points)
+
+        with mock.patch.object(spatial_index, 'volunteers_covering', cancel_then_cover), \
+                CaptureQueriesContext(connection) as queries:
+            result = assign_pending_deliveries()
+
+        # The cancellation above is an UPDATE too; count only the ones that assign
+        updates = [q['sql'] for q in queries.captured_queries
+                   if q['sql'].startswith(f'UPDATE "{Delivery._meta.db_table}"') and '"assigned_at"' in q['sql']]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(result['assigned'], {near.id: self.profiles[0].user_id})
+        self.assertEqual(result['conflicts'], [north.id])
+        self.assertEqual(result['total_distance_km'], float(haversine_distance(18.52, 73.85, 18.521, 73.85)))
+        self.assertEqual(
+            list(Delivery.objects.filter(id__in=[near.id, north.id]).order_by('id').values_list('status', 'volunteer_id')),
+            [('assigned', self.profiles[0].user_id), ('cancelled', None)],
+        )
 
-# Create your tests here.
+    def test_dry_run_writes_nothing(self):
+        delivery = self.make_delivery(18.52)
+        result = assign_pending_deliveries(dry_run=True)
+        self.assertEqual(result['assigned'], {delivery.id: self.profiles[0].user_id})
+        self.assertEqual(Delivery.objects.get(id=delivery.id).status, 'payment_confirmed')
@@ -0,0 +1,133 @@
+from django.db.models import Case, IntegerField, Value, When
+from django.utils import timezone
+
+from .models import Delivery
+
+# status -> statuses it may move to
+TRANSITIONS = {
+    'requested': {'fee_calculated', 'cancelled'},
+    'fee_calculated': {'payment_confirmed', 'cancelled'},
+    'payment_confirmed': {'assigned', 'cancelled'},
+    # Back to payment_confirmed when the volunteer drops the delivery before pickup
+    'assigned': {'picked_up', 'payment_confirmed', 'cancelled'},
+    'picked_up': {'in_transit', 'delivered'},
+    'in_transit': {'delivered'},
+    'delivered': {'completed'},
+    'completed': set(),
+    'cancelled': set(),
+}
+
+# Timestamp column stamped when a delivery enters the status
+TIMESTAMPS = {
+    'assigned': 'assigned_at',
+    'picked_up': 'picked_up_at',
+    'delivered': 'delivered_at',
+    'completed': 'completed_at',
+}
+
+# Extra conditions the row must meet for the move to win
+GUARDS = {
+    'assigned': {'volunteer__isnull': True},
+    # The receiver's OTP must have been checked before a drop-off counts
+    'delivered': {'otp_verified': True},
+}
+
+# Columns a transition may set besides status and its timestamp
+FIELDS = {
+    'assigned': {'volunteer_id'},
+    'cancelled': {'cancellation_reason'},
+}
+
+# Columns reset on the way back to a previous status
+RESETS = {
+    ('assigned', 'payment_confirmed'): {'volunteer_id': None, 'assigned_at': None},
+}
+
+
+class InvalidTransition(Exception):
+    """A move the state machine does not allow; the message is shown to the user"""
+
+
+def _refresh(delivery):
+    """Reload what a lost race may have changed, so the caller can decide again"""
+    delivery.refresh_from_db(fields=['status', 'volunteer', 'otp_verified', *TIMESTAMPS.values()])
+
+
+def transition(delivery, to_status, **fields):
+    """
+    Move delivery from its current status to to_status with one conditional
+    UPDATE ... WHERE id = ? AND status = <current>, stamping the status's timestamp
+    Returns True if this call made the move, False if the row had already changed
+    (another actor won); either way the instance reflects the stored row afterwards
+    Raises InvalidTransition only for moves the stored status does not allow
+    """
+    unexpected = set(fields) - FIELDS.get(to_status, set())
+    if unexpected:
+        raise InvalidTransition(f'{", ".join(sorted(unexpected))} cannot be set when moving to {to_status}')
+    if to_status == 'assigned' and not fields.get('volunteer_id'):
+        raise InvalidTransition('A volunteer is required to assign a delivery')
+
+    from_status = delivery.status
+    if to_status not in TRANSITIONS.get(from_status, ()):
+        # The instance may just be out of date: a status that moved on is a lost race, not a bad call
+        stored = Delivery.objects.filter(id=delivery.id).values_list('status', flat=True).first()
+        if stored is not None and stored != from_status:
+            _refresh(delivery)
+            return False
+        raise InvalidTransition(f'A delivery cannot go from {from_status} to {to_status}')
+
+    changes = {'status': to_status, **RESETS.get((from_status, to_status), {}), **fields}
+    if to_status in TIMESTAMPS:
+        changes[TIMESTAMPS[to_status]] = timezone.now()
+
+    won = Delivery.objects.filter(
+        id=delivery.id, status=from_status, **GUARDS.get(to_status, {}),
+    ).update(**changes)
+    if not won:
+        _refresh(delivery)
+        return False
+    for field, value in changes.items():
+        setattr(delivery, field, value)
+    return True
+
+
+def assign(delivery, volunteer_id):
+    return transition(delivery, 'assigned', volunteer_id=volunteer_id)
+
+
+def unassign(delivery):
+    return transition(delivery, 'payment_confirmed')
+
+
+def cancel(delivery, reason=''):
+    return transition(delivery, 'cancelled', cancellation_reason=reason)
+
+
+def assign_many(pairs):
+    """
+    Assign {delivery_id: volunteer_id} in one conditional UPDATE guarded like
+    assign(), so rows cancelled or assigned elsewhere meanwhile are left alone
+    Returns the delivery ids that statement did not write
+    """
+    if not pairs:
+        return []
+    assigned_at = timezone.now()
+    written = Delivery.objects.filter(
+        id__in=pairs, status='payment_confirmed', **GUARDS['assigned'],
+    ).update(
+        status='assigned',
+        volunteer_id=Case(
+            *[When(id=delivery_id, then=Value(volunteer_id)) for delivery_id, volunteer_id in pairs.items()],
+            output_field=IntegerField(),
+        ),
+        **{TIMESTAMPS['assigned']: assigned_at},
+    )
+    if written == len(pairs):
+        return []
+    # The timestamp is this statement's own, so it tells its rows apart from anyone else's
+    won = set(
+        Delivery.objects
+        .filter(id__in=pairs, status='assigned', **{TIMESTAMPS['assigned']: assigned_at})
+        .values_list('id', flat=True)
+    )
+    return [delivery_id for delivery_id in pairs if delivery_id not in won]
@@ -0,0 +1,124 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .counters import record_removed, record_transitions
+from .models import ArchivedDonation, ArchivedRequest, Donation, Request
+from .search import build_search_document
+
+DEFAULT_BATCH_SIZE = 500
+
+DONATION_FIELDS = [
+    'id', 'donor_id', 'food_title', 'description', 'quantity', 'pickup_location',
+    'pickup_latitude', 'pickup_longitude', 'expiry_date', 'food_image', 'category',
+    'pickup_time_start', 'pickup_time_end', 'created_at', 'units_available', 'claimed_at',
+    'image_width', 'image_height', 'image_thumb_webp', 'image_card_webp', 'image_card_jpeg',
+    'image_processed_at', 'card_version',
+]
+
+REQUEST_FIELDS = [
+    'id', 'donation_id', 'receiver_id', 'status', 'is_read', 'notes', 'units', 'created_at', 'updated_at',
+]
+
+
+def archivable_donations(grace_days=0):
+    """
+    Expired donations that can leave the hot table
+    Donations with deliveries stay, since Delivery rows cascade from them
+    """
+    cutoff = timezone.localdate() - timedelta(days=grace_days)
+    return Donation.objects.filter(expiry_date__lt=cutoff, deliveries__isnull=True)
+
+
+def archive_batch(donation_ids, grace_days=0):
+    """
+    Move one batch of donations and their requests to the archive tables
+    Runs in its own transaction so a long archival never holds locks for long
+    """
+    with transaction.atomic():
+        # Re-check under lock in case a donor extended the expiry date meanwhile
+        donations = list(
+            archivable_donations(grace_days)
+            .select_for_update(of=('self',))
+            .filter(id__in=donation_ids)
+            .values(*DONATION_FIELDS)
+        )
+        if not donations:
+            return 0, 0
+        ids = [donation['id'] for donation in donations]
+        requests = list(Request.objects.filter(donation_id__in=ids).values(*REQUEST_FIELDS))
+        donors = {donation['id']: donation['donor_id'] for donation in donations}
+        record_removed(dict(request, donor_id=donors[request['donation_id']]) for request in requests)
+
+        ArchivedDonation.objects.bulk_create(
+            [ArchivedDonation(**donation) for donation in donations], ignore_conflicts=True
+        )
+        ArchivedRequest.objects.bulk_create(
+            [ArchivedRequest(**request) for request in requests], ignore_conflicts=True
+        )
+
+        Request.objects.filter(donation_id__in=ids).delete()
+        Donation.objects.filter(id__in=ids).delete()
+
+    return len(donations), len(requests)
+
+
+def archive_expired_donations(batch_size=DEFAULT_BATCH_SIZE, grace_days=0, max_batches=None):
+    """
+    Archive expired donations batch by batch until none are left
+    Returns (donations_archived, requests_archived)
+    """
+    total_donations = total_requests = batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = list(
+            archivable_donations(grace_days).order_by('expiry_date', 'id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        donations, requests = archive_batch(ids, grace_days)
+        total_donations += donations
+        total_requests += requests
+        batches += 1
+    return total_donations, total_requests
+
+
+def restore_batch(donation_ids):
+    """
+    Move archived donations and their requests back to the live tables, as they were
+    Returns (donations_restored, requests_restored)
+    """
+    with transaction.atomic():
+        archived = list(
+            ArchivedDonation.objects.select_for_update().filter(id__in=donation_ids).values(*DONATION_FIELDS)
+        )
+        if not archived:
+            return 0, 0
+        ids = [donation['id'] for donation in archived]
+        archived_requests = list(ArchivedRequest.objects.filter(donation_id__in=ids).values(*REQUEST_FIELDS))
+
+        donations = [Donation(**donation) for donation in archived]
+        for donation in donations:
+            donation.search_document = build_search_document(
+                donation.food_title, donation.description, donation.pickup_location,
+            )
+        requests = [Request(**request) for request in archived_requests]
+        Donation.objects.bulk_create(donations)
+        Request.objects.bulk_create(requests)
+        # auto_now/auto_now_add stamp the insert time; put the archived timestamps back
+        for donation, row in zip(donations, archived):
+            donation.created_at = row['created_at']
+        for request, row in zip(requests, archived_requests):
+            request.created_at, request.updated_at = row['created_at'], row['updated_at']
+        Donation.objects.bulk_update(donations, ['created_at'], batch_size=DEFAULT_BATCH_SIZE)
+        Request.objects.bulk_update(requests, ['created_at', 'updated_at'], batch_size=DEFAULT_BATCH_SIZE)
+
+        donors = {donation['id']: donation['donor_id'] for donation in archived}
+        record_transitions(
+            (donors[row['donation_id']], row['receiver_id'], None, (row['status'], row['is_read']))
+            for row in archived_requests
+        )
+        ArchivedRequest.objects.filter(donation_id__in=ids).delete()
+        ArchivedDonation.objects.filter(id__in=ids).delete()
+
+    return len(archived), len(archived_requests)
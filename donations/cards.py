@@ -0,0 +1,29 @@
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+# Must match the {% cache %} tags in donor_dashboard.html and receiver_donation_cards.html
+DONOR_CARD_FRAGMENT = 'donor_donation_card'
+RECEIVER_CARD_FRAGMENT = 'receiver_donation_card'
+
+
+def card_fragment_keys(donation):
+    return [
+        make_template_fragment_key(DONOR_CARD_FRAGMENT, [donation.id, donation.card_version]),
+        make_template_fragment_key(
+            RECEIVER_CARD_FRAGMENT, [donation.id, donation.card_version, donation.donor.updated_at]
+        ),
+    ]
+
+
+def bump_card_version(donation):
+    """
+    Move the donation to a new card version before saving it
+    The old fragments are dropped from this process's cache; other processes
+    simply never ask for the old version again
+    """
+    cache.delete_many(card_fragment_keys(donation))
+    donation.card_version += 1
+
+
+def drop_card_fragments(donation):
+    cache.delete_many(card_fragment_keys(donation))
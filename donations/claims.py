@@ -0,0 +1,253 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, When
+from django.utils import timezone
+
+from .counters import record_transition, record_transitions
+from .events import publish_on_commit, request_created_payload, request_status_payload
+from .models import Donation, Request
+
+
+class ClaimError(Exception):
+    """A claim or decision that cannot go through; the message is shown to the user"""
+
+
+def _claim_units(donation, units):
+    """Validate units against the donation's state; returns the units to record"""
+    if donation.claimed_at is not None:
+        raise ClaimError('This donation has already been claimed')
+    if donation.units_available is None:
+        return None
+    try:
+        units = int(units or 1)
+    except (TypeError, ValueError):
+        raise ClaimError('Units must be a whole number')
+    if units < 1:
+        raise ClaimError('Units must be at least 1')
+    if units > donation.units_available:
+        raise ClaimError(f'Only {donation.units_available} units are left')
+    return units
+
+
+def claim_donation(donation, receiver, notes='', units=None):
+    """
+    Create a pending request for donation
+    units only applies to donations that track units_available (default 1)
+    Returns the new Request or raises ClaimError
+    """
+    units = _claim_units(donation, units)
+
+    # A plain INSERT: the unique (donation, receiver) constraint settles concurrent
+    # duplicates, instead of get_or_create's SELECT-then-INSERT
+    try:
+        with transaction.atomic():
+            # The instance may be stale: re-check on the row with a conditional UPDATE,
+            # which also holds the row lock (against approvals) until the INSERT commits
+            guard = Donation.objects.filter(id=donation.id, claimed_at__isnull=True)
+            if units is not None:
+                guard = guard.filter(units_available__gte=units)
+            if not guard.update(units_available=F('units_available')):
+                donation.refresh_from_db(fields=['claimed_at', 'units_available'])
+                _claim_units(donation, units)
+                raise ClaimError('This donation is no longer available')
+            claim = Request.objects.create(donation=donation, receiver=receiver, notes=notes, units=units)
+            record_transition(donation.donor_id, receiver.pk, None, ('pending', False))
+            publish_on_commit(donation.donor_id, 'request_created', request_created_payload(claim))
+    except IntegrityError:
+        raise ClaimError('You have already requested this donation')
+    return claim
+
+
+def _reserve(donation_id, units, now):
+    """
+    Compare-and-set allocation on the donation row; False if it can no longer cover units
+    The UPDATE also serialises concurrent approvals for the same donation on that row
+    """
+    donations = Donation.objects.filter(id=donation_id, claimed_at__isnull=True)
+    if units is None:
+        # The whole donation goes to this request
+        return donations.update(claimed_at=now) == 1
+    return donations.filter(units_available__gte=units).update(
+        units_available=F('units_available') - units,
+        # SET expressions see the pre-update row, so this fires when the last units go
+        claimed_at=Case(When(units_available=units, then=now), default=None),
+    ) == 1
+
+
+def _decide(request_ids, status, now):
+    """pending -> status for the given requests; returns how many were still pending"""
+    return Request.objects.filter(id__in=request_ids, status='pending').update(status=status, updated_at=now)
+
+
+def _reject_unfillable(donation, now):
+    """
+    Reject, in one UPDATE, every pending request the donation can no longer cover
+    Returns the rejected requests (with status/updated_at set to match the database)
+    """
+    claimed_at, remaining = (
+        Donation.objects.filter(id=donation.id).values_list('claimed_at', 'units_available').get()
+    )
+    pending = Request.objects.select_for_update().filter(donation_id=donation.id, status='pending')
+    if claimed_at is None:
+        pending = pending.filter(units__gt=remaining)
+    rejected = list(pending.only('id', 'receiver_id', 'is_read', 'status', 'donation_id'))
+    if rejected:
+        _decide([req.id for req in rejected], 'rejected', now)
+    for req in rejected:
+        req.status, req.updated_at, req.donation = 'rejected', now, donation
+    return rejected
+
+
+def _publish_decisions(requests):
+    for req in requests:
+        publish_on_commit(req.receiver_id, 'request_status', request_status_payload(req))
+
+
+def approve_request(claim):
+    """
+    Approve a pending request if the donation can still cover it
+    Competing requests that no longer fit are auto-rejected in the same transaction
+    Returns the auto-rejected requests; raises ClaimError if the request was
+    already decided or the donation is exhausted (the request is then rejected)
+    """
+    if claim.status != 'pending':
+        raise ClaimError('This request has already been decided')
+    donation = claim.donation
+    now = timezone.now()
+    with transaction.atomic():
+        # Lock order is always donation row, then request rows
+        reserved = _reserve(donation.id, claim.units, now)
+        if reserved:
+            if not _decide([claim.id], 'approved', now):
+                # Raising out of the atomic block undoes the reservation
+                raise ClaimError('This request has already been decided')
+            rejected = _reject_unfillable(donation, now)
+            record_transitions(
+                [(donation.donor_id, claim.receiver_id, ('pending', claim.is_read), ('approved', claim.is_read))]
+                + [(donation.donor_id, req.receiver_id, ('pending', req.is_read), ('rejected', req.is_read))
+                   for req in rejected]
+            )
+            claim.status, claim.updated_at = 'approved', now
+            _publish_decisions([claim] + rejected)
+            return rejected
+
+    # The donation ran out before this approval; the request can never be met now
+    try:
+        reject_request(claim)
+    except ClaimError:
+        pass
+    raise ClaimError('This donation has already been claimed')
+
+
+def reject_request(claim):
+    """pending -> rejected; raises ClaimError if the request was already decided"""
+    now = timezone.now()
+    with transaction.atomic():
+        if not _decide([claim.id], 'rejected', now):
+            raise ClaimError('This request has already been decided')
+        record_transition(
+            claim.donation.donor_id, claim.receiver_id, ('pending', claim.is_read), ('rejected', claim.is_read)
+        )
+        claim.status, claim.updated_at = 'rejected', now
+        _publish_decisions([claim])
+
+
+def _allocate(donation, units, now):
+    """In-memory twin of _reserve for a donation row already locked by the caller"""
+    if donation.claimed_at is not None:
+        return False
+    if units is None or donation.units_available is None:
+        donation.claimed_at = now
+        return True
+    if units > donation.units_available:
+        return False
+    donation.units_available -= units
+    if donation.units_available == 0:
+        donation.claimed_at = now
+    return True
+
+
+def _fits(req, donation):
+    if donation.claimed_at is not None:
+        return False
+    return donation.units_available is None or (req.units or 0) <= donation.units_available
+
+
+def decide_requests(donor, decisions):
+    """
+    Apply many {request_id: 'approved' | 'rejected'} decisions for donor's requests at once
+    Only requests on the donor's own donations are touched. Donations are locked
+    and allocated in memory, then written back with a handful of set-based UPDATEs;
+    pending requests that no longer fit are auto-rejected as in approve_request.
+    Each receiver gets one consolidated request_statuses event.
+    Returns (results, auto_rejected): results maps each id to one of 'approved',
+    'rejected', 'unavailable' (rejected because the donation ran out),
+    'already_decided' or 'not_found'
+    """
+    results = dict.fromkeys(decisions, 'not_found')
+    now = timezone.now()
+    with transaction.atomic():
+        # Same lock order as approve_request: donation rows, then request rows
+        donations = {
+            donation.id: donation
+            for donation in Donation.objects.select_for_update().filter(
+                donor=donor, id__in=Request.objects.filter(id__in=list(decisions)).values('donation_id')
+            ).only('id', 'donor_id', 'food_title', 'units_available', 'claimed_at').order_by('id')
+        }
+        requests = {
+            req.id: req
+            for req in Request.objects.select_for_update().filter(id__in=list(decisions), donation_id__in=donations)
+            .only('id', 'donation_id', 'receiver_id', 'status', 'is_read', 'units')
+        }
+
+        approved, rejected, changed = [], [], set()
+        for request_id, status in decisions.items():
+            req = requests.get(request_id)
+            if req is None:
+                continue
+            if req.status != 'pending':
+                results[request_id] = 'already_decided'
+                continue
+            req.donation = donations[req.donation_id]
+            if status == 'approved' and _allocate(req.donation, req.units, now):
+                approved.append(req)
+                changed.add(req.donation_id)
+                results[request_id] = 'approved'
+            else:
+                rejected.append(req)
+                results[request_id] = 'rejected' if status == 'rejected' else 'unavailable'
+
+        auto_rejected = []
+        if changed:
+            Donation.objects.bulk_update([donations[donation_id] for donation_id in changed],
+                                         ['units_available', 'claimed_at'])
+            competitors = (
+                Request.objects.select_for_update()
+                .filter(donation_id__in=changed, status='pending')
+                .exclude(id__in=[req.id for req in approved + rejected])
+                .only('id', 'donation_id', 'receiver_id', 'status', 'is_read', 'units')
+            )
+            for req in competitors:
+                req.donation = donations[req.donation_id]
+                if not _fits(req, req.donation):
+                    auto_rejected.append(req)
+
+        if approved:
+            _decide([req.id for req in approved], 'approved', now)
+        if rejected or auto_rejected:
+            _decide([req.id for req in rejected + auto_rejected], 'rejected', now)
+
+        decided = [(req, 'approved') for req in approved] + [(req, 'rejected') for req in rejected + auto_rejected]
+        record_transitions(
+            (donor.pk, req.receiver_id, ('pending', req.is_read), (status, req.is_read)) for req, status in decided
+        )
+
+        by_receiver = defaultdict(list)
+        for req, status in decided:
+            req.status, req.updated_at = status, now
+            by_receiver[req.receiver_id].append(request_status_payload(req))
+        for receiver_id, payloads in by_receiver.items():
+            publish_on_commit(receiver_id, 'request_statuses', {'requests': payloads})
+
+    return results, auto_rejected
@@ -0,0 +1,157 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import NotificationCounter, Request
+
+COUNTER_FIELDS = ('pending_requests', 'unread_approved', 'rejected')
+
+
+def _contribution(donor_id, receiver_id, status, is_read):
+    """Counter cells a single request in this state adds 1 to"""
+    if status == 'pending':
+        return [(donor_id, 'pending_requests')]
+    if status == 'rejected':
+        return [(receiver_id, 'rejected')]
+    if status == 'approved' and not is_read:
+        return [(receiver_id, 'unread_approved')]
+    return []
+
+
+def apply_deltas(deltas):
+    """
+    Apply {user_id: {field: delta}} with one F-expression UPDATE per user
+    Any change also bumps the user's version; counter rows are created on first use
+    """
+    now = timezone.now()
+    # Always lock counter rows in user id order, so concurrent writers cannot deadlock
+    for user_id, changes in sorted(deltas.items()):
+        changes = {field: delta for field, delta in changes.items() if delta}
+        if not changes:
+            continue
+        changes.setdefault('version', 1)
+        updates = {field: F(field) + delta for field, delta in changes.items()}
+        updates['updated_at'] = now
+        if not NotificationCounter.objects.filter(user_id=user_id).update(**updates):
+            NotificationCounter.objects.bulk_create([NotificationCounter(user_id=user_id)], ignore_conflicts=True)
+            NotificationCounter.objects.filter(user_id=user_id).update(**updates)
+
+
+def record_transitions(transitions):
+    """
+    Update counters for many requests at once
+    transitions is an iterable of (donor_id, receiver_id, old_state, new_state)
+    where a state is (status, is_read), or None for a row that does not exist
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    for donor_id, receiver_id, old_state, new_state in transitions:
+        if old_state != new_state:
+            # Both sides list the request, even when no badge count moves
+            deltas[donor_id]['version'] += 1
+            deltas[receiver_id]['version'] += 1
+        if old_state is not None:
+            for user_id, field in _contribution(donor_id, receiver_id, *old_state):
+                deltas[user_id][field] -= 1
+        if new_state is not None:
+            for user_id, field in _contribution(donor_id, receiver_id, *new_state):
+                deltas[user_id][field] += 1
+    apply_deltas(deltas)
+
+
+def record_transition(donor_id, receiver_id, old_state, new_state):
+    record_transitions([(donor_id, receiver_id, old_state, new_state)])
+
+
+def record_removed(requests):
+    """Counters for requests about to be deleted; rows need donor_id, receiver_id, status, is_read"""
+    record_transitions(
+        (row['donor_id'], row['receiver_id'], (row['status'], row['is_read']), None) for row in requests
+    )
+
+
+def bump_versions(user_ids):
+    """Invalidate cached notification lists for users, e.g. after a donation title changes"""
+    user_ids = set(user_ids)
+    now = timezone.now()
+    NotificationCounter.objects.filter(user_id__in=user_ids).update(version=F('version') + 1, updated_at=now)
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(user_id=user_id, version=1, updated_at=now) for user_id in user_ids],
+        ignore_conflicts=True,
+    )
+
+
+def get_counter(user):
+    """The user's counter row (one primary-key lookup), or an empty unsaved one"""
+    return NotificationCounter.objects.filter(user_id=user.pk).first() or NotificationCounter(user_id=user.pk)
+
+
+def _count_requests():
+    """{user_id: {field: count}} for every user with a non-zero counter, from the Request table"""
+    totals = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+
+    pending = (
+        Request.objects.filter(status='pending')
+        .values('donation__donor_id').annotate(total=Count('id')).order_by()
+    )
+    for row in pending:
+        totals[row['donation__donor_id']]['pending_requests'] = row['total']
+
+    received = (
+        Request.objects.exclude(status='pending')
+        .values('receiver_id')
+        .annotate(
+            rejected=Count('id', filter=Q(status='rejected')),
+            unread_approved=Count('id', filter=Q(status='approved', is_read=False)),
+        )
+        .order_by()
+    )
+    for row in received:
+        totals[row['receiver_id']]['rejected'] = row['rejected']
+        totals[row['receiver_id']]['unread_approved'] = row['unread_approved']
+    return totals
+
+
+def rebuild_counters():
+    """Recompute every counter from the Request table; returns the number of users with counts"""
+    with transaction.atomic():
+        # Users with requests but no counter row get one first, so the zeroing
+        # below locks it too
+        users = set(
+            Request.objects.filter(status='pending').values_list('donation__donor_id', flat=True).distinct()
+        ) | set(
+            Request.objects.exclude(status='pending').values_list('receiver_id', flat=True).distinct()
+        )
+        NotificationCounter.objects.bulk_create(
+            [NotificationCounter(user_id=user_id) for user_id in users], ignore_conflicts=True, batch_size=1000,
+        )
+
+        # Zeroing locks every counter row, so request writes that would adjust
+        # them wait for the rebuild instead of being counted twice or lost
+        stamp = timezone.now()
+        NotificationCounter.objects.update(
+            version=F('version') + 1, updated_at=stamp, **dict.fromkeys(COUNTER_FIELDS, 0)
+        )
+        locked = set(NotificationCounter.objects.filter(updated_at=stamp).values_list('user_id', flat=True))
+
+        totals = _count_requests()
+
+        # A row created after the zeroing belongs to a user whose first request
+        # arrived meanwhile; its writer keeps it current, so it is only filled
+        # in if it is still missing, never overwritten
+        NotificationCounter.objects.bulk_create(
+            [NotificationCounter(user_id=user_id, version=1, **fields)
+             for user_id, fields in totals.items() if user_id in locked],
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=list(COUNTER_FIELDS),
+            batch_size=1000,
+        )
+        NotificationCounter.objects.bulk_create(
+            [NotificationCounter(user_id=user_id, version=1, **fields)
+             for user_id, fields in totals.items() if user_id not in locked],
+            ignore_conflicts=True,
+            batch_size=1000,
+        )
+    return len(totals)
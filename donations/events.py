@@ -0,0 +1,184 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .notifications import NOTIFICATION_CURSOR_OVERLAP, changed_requests
+
+# Events kept per idle connection before the oldest are dropped; also the most
+# requests replayed to a reconnecting stream
+SUBSCRIBER_QUEUE_SIZE = 100
+
+HEARTBEAT_SECONDS = 20
+
+# A stream ends itself after this long; the browser reconnects after the retry delay
+MAX_STREAM_SECONDS = 5 * 60
+
+RETRY_MILLISECONDS = 5000
+
+
+class Subscription:
+    """One open stream: a queue living on the event loop that serves it"""
+
+    def __init__(self, broker, user_id, loop):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def deliver(self, event):
+        # Runs on self.loop; a slow client loses its oldest events, never blocks publishers
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+
+class NotificationBroker:
+    """
+    In-process pub/sub keyed by user id
+    publish() may be called from any thread (sync views run in a thread pool
+    under ASGI); delivery is handed to each subscriber's event loop
+    Only subscribers connected to the same worker process receive an event;
+    event ids are publish-time cursors, so a reconnecting client catches up
+    from the database through replay_events()
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, user_id, event_type, payload):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        event = {'id': timezone.now().isoformat(), 'type': event_type, 'data': payload}
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # Loop already closed; the stream's cleanup will unsubscribe it
+                pass
+
+
+broker = NotificationBroker()
+
+
+def publish_on_commit(user_id, event_type, payload):
+    """Publish once the surrounding transaction commits, so clients never see rolled-back state"""
+    transaction.on_commit(lambda: broker.publish(user_id, event_type, payload))
+
+
+def format_event(event):
+    data = json.dumps(event['data'], cls=DjangoJSONEncoder)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+def streaming_supported(request):
+    """
+    Whether this request is served by an ASGI server
+    Under WSGI every open stream would pin a worker thread, so pages poll instead
+    """
+    return isinstance(request, ASGIRequest)
+
+
+def replay_events(user, last_event_id, cursor):
+    """
+    Events a stream missed after last_event_id (the cursor an earlier event
+    carried), rebuilt from the database so they survive worker restarts and
+    reconnects to another worker; every event gets cursor as its id
+    Returns [] for a missing or malformed id
+    """
+    try:
+        since = parse_datetime(last_event_id or '')
+    except ValueError:
+        return []
+    if since is None or timezone.is_naive(since):
+        return []
+
+    # The newest SUBSCRIBER_QUEUE_SIZE, oldest first, like a live queue that overflowed
+    changed = list(
+        changed_requests(user, since - NOTIFICATION_CURSOR_OVERLAP)
+        .order_by('-updated_at', '-id')[:SUBSCRIBER_QUEUE_SIZE]
+    )[::-1]
+    event_id = cursor.isoformat()
+    if user.role.startswith('donor'):
+        return [
+            {'id': event_id, 'type': 'request_created', 'data': request_created_payload(req)}
+            for req in changed if req.status == 'pending'
+        ]
+    if not changed:
+        return []
+    payloads = [request_status_payload(req) for req in changed]
+    return [{'id': event_id, 'type': 'request_statuses', 'data': {'requests': payloads}}]
+
+
+async def event_stream(subscription, max_seconds=None, cursor=None, replay=()):
+    """
+    Server-Sent Events body for one subscription, with keep-alives, closed after max_seconds
+    cursor is sent as the first id so the browser has a Last-Event-ID to resume
+    from even if no event arrives; replay is sent before live events
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + (MAX_STREAM_SECONDS if max_seconds is None else max_seconds)
+    try:
+        yield f'retry: {RETRY_MILLISECONDS}\n\n'
+        if cursor is not None:
+            yield f'id: {cursor.isoformat()}\n\n'
+        for event in replay:
+            yield format_event(event)
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), min(HEARTBEAT_SECONDS, remaining))
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+            yield format_event(event)
+    finally:
+        subscription.broker.unsubscribe(subscription)
+
+
+def request_created_payload(req):
+    """Donor-side event, shaped like a donor entry from get_notifications"""
+    return {
+        'id': req.id,
+        'receiver_name': req.receiver.full_name,
+        'donation_title': req.donation.food_title,
+        'status': req.status,
+        'created_at': req.created_at.strftime('%Y-%m-%d %H:%M'),
+    }
+
+
+def request_status_payload(req):
+    """Receiver-side event, shaped like a receiver entry from get_notifications"""
+    return {
+        'id': req.id,
+        'donation_title': req.donation.food_title,
+        'status': req.status,
+        'updated_at': req.updated_at.strftime('%Y-%m-%d %H:%M'),
+    }
@@ -0,0 +1,146 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Donation
+
+logger = logging.getLogger(__name__)
+
+# (field, max width in px, format); cards are ~320 CSS px wide, so 640 covers 2x screens
+VARIANTS = (
+    ('image_thumb_webp', 320, 'WEBP'),
+    ('image_card_webp', 640, 'WEBP'),
+    ('image_card_jpeg', 640, 'JPEG'),
+)
+
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+SAVE_OPTIONS = {
+    'WEBP': {'quality': 80, 'method': 4},
+    'JPEG': {'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+VARIANT_FIELDS = [field for field, _, _ in VARIANTS]
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='donation-images')
+
+
+def _encode(image, max_width, fmt):
+    variant = image.copy()
+    # thumbnail() keeps the aspect ratio and never upscales
+    variant.thumbnail((max_width, max_width * 4), Image.LANCZOS)
+    if fmt == 'JPEG' and variant.mode != 'RGB':
+        variant = variant.convert('RGB')
+    buffer = BytesIO()
+    variant.save(buffer, fmt, **SAVE_OPTIONS[fmt])
+    return buffer.getvalue()
+
+
+def _strip_exif(image, fmt):
+    """Re-encode the upright original without metadata (EXIF can carry GPS position)"""
+    buffer = BytesIO()
+    options = {'quality': 90} if fmt in ('JPEG', 'WEBP') else {}
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def strip_metadata(upload):
+    """
+    The uploaded photo, upright and re-encoded without EXIF, ready for its first
+    save so the original with the camera's GPS position is never stored
+    Uploads without EXIF, or that are not images, are returned as they came
+    """
+    if not upload:
+        return upload
+    try:
+        source = Image.open(upload)
+        fmt = source.format
+        if not source.getexif():
+            return upload
+        image = ImageOps.exif_transpose(source)
+        image.load()
+    except (OSError, ValueError):
+        return upload
+    finally:
+        upload.seek(0)
+    return ContentFile(_strip_exif(image, fmt), name=upload.name)
+
+
+def process_donation_image(donation_id):
+    """
+    Build the resized WebP/JPEG variants for one donation's photo and record its
+    dimensions; the original was already stripped by strip_metadata() on upload
+    Bumps card_version so cached cards pick up the new markup
+    Returns False if there was nothing to do
+    """
+    donation = Donation.objects.filter(id=donation_id).only('id', 'food_image').first()
+    if donation is None or not donation.food_image:
+        return False
+
+    original_name = donation.food_image.name
+    storage = donation.food_image.storage
+    with storage.open(original_name, 'rb') as handle:
+        image = ImageOps.exif_transpose(Image.open(handle))
+        image.load()
+
+    stem = os.path.splitext(os.path.basename(original_name))[0]
+    upload_dir = Donation._meta.get_field('image_card_webp').upload_to
+    saved = []
+    updates = {'image_width': image.width, 'image_height': image.height}
+    for field, max_width, variant_format in VARIANTS:
+        name = f'{upload_dir}{stem}_{max_width}.{EXTENSIONS[variant_format]}'
+        name = storage.save(name, ContentFile(_encode(image, max_width, variant_format)))
+        saved.append(name)
+        updates[field] = name
+
+    # Only apply if the photo was not replaced while we were working
+    applied = Donation.objects.filter(id=donation_id, food_image=original_name).update(
+        image_processed_at=timezone.now(), card_version=F('card_version') + 1, **updates
+    )
+    if not applied:
+        for name in saved:
+            storage.delete(name)
+        return False
+    return True
+
+
+def _run(donation_id):
+    try:
+        process_donation_image(donation_id)
+    except Exception:
+        logger.exception('Processing image for donation %s failed', donation_id)
+    finally:
+        # Worker threads get their own connection; don't leave it open between jobs
+        connection.close()
+
+
+def schedule_image_processing(donation_id):
+    """Process the photo in a worker thread once the current transaction commits"""
+    transaction.on_commit(lambda: _executor.submit(_run, donation_id))
+
+
+def reset_image_variants(donation):
+    """Clear derived image data on an instance whose photo is being replaced"""
+    stale = [getattr(donation, field) for field in VARIANT_FIELDS]
+    stale = [(file.storage, file.name) for file in stale if file]
+
+    def delete_stale():
+        for storage, name in stale:
+            storage.delete(name)
+
+    transaction.on_commit(delete_stale)
+    for field in VARIANT_FIELDS:
+        setattr(donation, field, None)
+    donation.image_width = donation.image_height = donation.image_processed_at = None
+
+
+def unprocessed_donations():
+    """Donations with a photo the pipeline has not handled yet (e.g. lost on a restart)"""
+    return Donation.objects.exclude(food_image='').filter(food_image__isnull=False, image_processed_at__isnull=True)
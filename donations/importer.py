@@ -0,0 +1,154 @@
+import csv
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from subscriptions.usage import consume
+from users.geocoding import geocode_addresses
+from .models import Donation
+from .search import build_search_document
+
+DEFAULT_CHUNK_SIZE = 1000
+
+MAX_IMPORT_ROWS = 5000
+
+REQUIRED_FIELDS = ('food_title', 'description', 'quantity', 'pickup_location', 'expiry_date')
+
+OPTIONAL_FIELDS = ('category', 'pickup_time_start', 'pickup_time_end', 'units_available')
+
+IMPORT_FIELDS = REQUIRED_FIELDS + OPTIONAL_FIELDS
+
+FORMATS = ('csv', 'jsonl')
+
+
+class DonationImportError(Exception):
+    """The payload as a whole cannot be imported (bad format, too many rows)"""
+
+
+def detect_format(content_type='', filename=''):
+    """Guess the payload format from a content type or file name; None if unknown"""
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    filename = (filename or '').lower()
+    if content_type in ('text/csv', 'application/csv') or filename.endswith('.csv'):
+        return 'csv'
+    if content_type in ('application/x-ndjson', 'application/jsonl', 'application/x-jsonlines') \
+            or filename.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return None
+
+
+def iter_rows(lines, fmt):
+    """
+    Yield (row_number, row) from an iterable of text lines without reading it all
+    row is a dict, or an error message if the line could not be parsed
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for number, row in enumerate(reader, start=1):
+            if None in row:
+                yield number, 'Row has more columns than the header'
+            else:
+                yield number, row
+    elif fmt == 'jsonl':
+        number = 0
+        for line in lines:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield number, f'Invalid JSON: {exc}'
+                continue
+            yield number, row if isinstance(row, dict) else 'Each line must be a JSON object'
+    else:
+        raise DonationImportError(f'Unsupported format {fmt!r}; use one of {", ".join(FORMATS)}')
+
+
+def validate_row(row):
+    """
+    Clean one row with the model fields' own validation
+    Returns (values, errors) where errors maps field name to message
+    """
+    values, errors = {}, {}
+    for name in IMPORT_FIELDS:
+        raw = row.get(name)
+        if isinstance(raw, str):
+            raw = raw.strip()
+        if raw in (None, ''):
+            if name in REQUIRED_FIELDS:
+                errors[name] = 'This field is required.'
+            continue
+        field = Donation._meta.get_field(name)
+        try:
+            values[name] = field.clean(raw, None)
+        except ValidationError as exc:
+            errors[name] = ' '.join(exc.messages)
+    start, end = values.get('pickup_time_start'), values.get('pickup_time_end')
+    if start and end and end < start:
+        errors['pickup_time_end'] = 'Pickup window ends before it starts.'
+    return values, errors
+
+
+def _insert_chunk(donor, chunk):
+    """
+    Count a chunk against the donor's monthly quota, then geocode it in one batch
+    and insert it with one bulk_create
+    Raises QuotaExceeded, before any work, if the chunk does not fit the quota
+    """
+    consume(donor, 'donations', len(chunk))
+    # bulk_create skips Donation.save(), so fields it maintains are filled in here
+    locations = geocode_addresses([values['pickup_location'] for values in chunk])
+    donations = []
+    for values, location in zip(chunk, locations):
+        location = location or {}
+        donations.append(Donation(
+            donor=donor,
+            pickup_latitude=location.get('latitude'),
+            pickup_longitude=location.get('longitude'),
+            search_document=build_search_document(
+                values['food_title'], values['description'], values['pickup_location']
+            ),
+            **values,
+        ))
+    Donation.objects.bulk_create(donations)
+    return len(donations)
+
+
+def import_donations(donor, lines, fmt, chunk_size=DEFAULT_CHUNK_SIZE, partial=False, max_rows=MAX_IMPORT_ROWS):
+    """
+    Stream rows from lines, validating as they arrive and inserting valid ones in chunks
+    Everything runs in one transaction. Unless partial is set, any invalid row
+    rolls the whole import back so it can be fixed and resent
+    Each chunk is counted against the donor's donation quota; a chunk over the
+    quota raises QuotaExceeded and the whole import is rolled back
+    Returns (created, errors) where errors is a list of {'row': n, 'errors': {...}}
+    """
+    created = 0
+    errors = []
+    chunk = []
+    with transaction.atomic():
+        for number, row in iter_rows(lines, fmt):
+            if number > max_rows:
+                raise DonationImportError(f'Imports are limited to {max_rows} rows')
+            if isinstance(row, str):
+                errors.append({'row': number, 'errors': {'__all__': row}})
+                continue
+            values, row_errors = validate_row(row)
+            if row_errors:
+                errors.append({'row': number, 'errors': row_errors})
+                continue
+            # Once an all-or-nothing import has failed, keep validating but stop inserting
+            if errors and not partial:
+                continue
+            chunk.append(values)
+            if len(chunk) >= chunk_size:
+                created += _insert_chunk(donor, chunk)
+                chunk = []
+        if errors and not partial:
+            transaction.set_rollback(True)
+            return 0, errors
+        if chunk:
+            created += _insert_chunk(donor, chunk)
+    return created, errors
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from donations.archival import DEFAULT_BATCH_SIZE, archive_expired_donations
+
+
+class Command(BaseCommand):
+    help = 'Move expired donations and their requests into the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--grace-days', type=int, default=0,
+                            help='Only archive donations expired at least this many days ago')
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Stop after this many batches (for time-boxed scheduled runs)')
+
+    def handle(self, *args, **options):
+        donations, requests = archive_expired_donations(
+            batch_size=options['batch_size'],
+            grace_days=options['grace_days'],
+            max_batches=options['max_batches'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {donations} donations and {requests} requests'
+        ))
@@ -0,0 +1,46 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from donations.importer import DEFAULT_CHUNK_SIZE, FORMATS, DonationImportError, detect_format, import_donations
+from subscriptions.usage import QuotaExceeded
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Import donations for one donor from a CSV or JSON Lines file ("-" reads stdin)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--donor', required=True, help='Email of the donating account')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--partial', action='store_true',
+                            help='Import valid rows even if some rows fail validation')
+
+    def handle(self, *args, **options):
+        donor = CustomUser.objects.filter(email=options['donor']).first()
+        if donor is None or not donor.role.startswith('donor'):
+            raise CommandError(f"No donor account with email {options['donor']}")
+
+        path = options['path']
+        fmt = options['format'] or detect_format(filename=path)
+        if fmt is None:
+            raise CommandError('Could not tell the format from the file name; pass --format')
+
+        handle = sys.stdin if path == '-' else open(path, encoding='utf-8-sig', newline='')
+        try:
+            created, errors = import_donations(
+                donor, handle, fmt, chunk_size=options['chunk_size'], partial=options['partial']
+            )
+        except (DonationImportError, QuotaExceeded) as exc:
+            raise CommandError(str(exc))
+        finally:
+            if handle is not sys.stdin:
+                handle.close()
+
+        for error in errors:
+            details = '; '.join(f'{field}: {message}' for field, message in error['errors'].items())
+            self.stderr.write(f"Row {error['row']}: {details}")
+        style = self.style.WARNING if errors else self.style.SUCCESS
+        self.stdout.write(style(f'Imported {created} donations ({len(errors)} rows with errors)'))
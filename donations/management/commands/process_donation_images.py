@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from donations.images import process_donation_image, unprocessed_donations
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP/JPEG variants for donation photos that have not been processed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Process at most this many donations')
+
+    def handle(self, *args, **options):
+        ids = unprocessed_donations().order_by('id').values_list('id', flat=True)
+        if options['limit'] is not None:
+            ids = ids[:options['limit']]
+        processed = failed = 0
+        for donation_id in list(ids):
+            try:
+                if process_donation_image(donation_id):
+                    processed += 1
+            except Exception as exc:
+                failed += 1
+                self.stderr.write(f'Donation {donation_id}: {exc}')
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} images ({failed} failed)'))
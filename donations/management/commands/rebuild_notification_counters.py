@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from donations.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute per-user notification counters from the Request table'
+
+    def handle(self, *args, **options):
+        users = rebuild_counters()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt notification counters for {users} users'))
@@ -0,0 +1,59 @@
+# Generated by Django 5.0.1 on 2026-10-18 07:36
+
+from django.db import migrations, models
+
+
+def backfill_search_document(apps, schema_editor):
+    from donations.search import build_search_document
+
+    Donation = apps.get_model('donations', 'Donation')
+    batch = []
+    for donation in Donation.objects.only('id', 'food_title', 'description', 'pickup_location').iterator(chunk_size=1000):
+        donation.search_document = build_search_document(
+            donation.food_title, donation.description, donation.pickup_location
+        )
+        batch.append(donation)
+        if len(batch) >= 1000:
+            Donation.objects.bulk_update(batch, ['search_document'])
+            batch = []
+    if batch:
+        Donation.objects.bulk_update(batch, ['search_document'])
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # Same expression django.contrib.postgres' SearchVector('search_document', config='english') emits
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS donations_search_fts_idx ON donations_donation "
+        "USING GIN (to_tsvector('english'::regconfig, COALESCE(search_document, '')))"
+    )
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS donations_search_trgm_idx ON donations_donation "
+        "USING GIN (search_document gin_trgm_ops)"
+    )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS donations_search_fts_idx')
+    schema_editor.execute('DROP INDEX IF EXISTS donations_search_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0003_donation_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='donation',
+            name='search_document',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(backfill_search_document, migrations.RunPython.noop),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
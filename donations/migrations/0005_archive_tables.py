@@ -0,0 +1,62 @@
+# Generated by Django 5.0.1 on 2026-10-18 07:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0004_donation_search_document'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedDonation',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('food_title', models.CharField(max_length=255)),
+                ('description', models.TextField()),
+                ('quantity', models.CharField(max_length=100)),
+                ('pickup_location', models.CharField(max_length=500)),
+                ('pickup_latitude', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('pickup_longitude', models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True)),
+                ('expiry_date', models.DateField()),
+                ('food_image', models.ImageField(blank=True, null=True, upload_to='donation_images/')),
+                ('category', models.CharField(choices=[('vegetarian', 'Vegetarian'), ('vegan', 'Vegan'), ('non_veg', 'Non-Vegetarian'), ('halal', 'Halal'), ('kosher', 'Kosher'), ('gluten_free', 'Gluten Free'), ('dairy_free', 'Dairy Free'), ('other', 'Other')], default='other', max_length=20)),
+                ('pickup_time_start', models.TimeField(blank=True, null=True)),
+                ('pickup_time_end', models.TimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('donor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_donations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'archived_donations',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedRequest',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('rejected', 'Rejected')], max_length=10)),
+                ('is_read', models.BooleanField(default=False)),
+                ('notes', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('donation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='requests', to='donations.archiveddonation')),
+                ('receiver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_requests', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'archived_requests',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archiveddonation',
+            index=models.Index(fields=['donor', '-created_at'], name='archived_do_donor_i_15c0ce_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-18 07:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0006_notificationcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='donation',
+            name='card_version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
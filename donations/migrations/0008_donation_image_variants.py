@@ -0,0 +1,43 @@
+# Generated by Django 5.0.1 on 2026-10-18 07:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0007_donation_card_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='donation',
+            name='image_card_jpeg',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='donation_images/variants/'),
+        ),
+        migrations.AddField(
+            model_name='donation',
+            name='image_card_webp',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='donation_images/variants/'),
+        ),
+        migrations.AddField(
+            model_name='donation',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='donation',
+            name='image_processed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='donation',
+            name='image_thumb_webp',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to='donation_images/variants/'),
+        ),
+        migrations.AddField(
+            model_name='donation',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.1 on 2026-10-18 07:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0009_notification_counter_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='donation',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='donation',
+            name='units_available',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='request',
+            name='units',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.0.1 on 2026-10-18 08:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0010_donation_claims'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archiveddonation',
+            name='card_version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='archiveddonation',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='archiveddonation',
+            name='image_card_jpeg',
+            field=models.ImageField(blank=True, null=True, upload_to='donation_images/variants/'),
+        ),
+        migrations.AddField(
+            model_name='archiveddonation',
+            name='image_card_webp',
+            field=models.ImageField(blank=True, null=True, upload_to='donation_images/variants/'),
+        ),
+        migrations.AddField(
+            model_name='archiveddonation',
+            name='image_height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='archiveddonation',
+            name='image_processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='archiveddonation',
+            name='image_thumb_webp',
+            field=models.ImageField(blank=True, null=True, upload_to='donation_images/variants/'),
+        ),
+        migrations.AddField(
+            model_name='archiveddonation',
+            name='image_width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='archiveddonation',
+            name='units_available',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='archivedrequest',
+            name='units',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.1 on 2026-10-18 08:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('donations', '0011_archive_claim_and_image_fields'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(fields=['receiver', '-updated_at', '-id'], name='donations_r_receive_8d040a_idx'),
+        ),
+    ]
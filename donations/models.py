@@ -1,5 +1,15 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
+
+from .search import build_search_document
+
+class ActiveDonationManager(models.Manager):
+    """Donations that can still be claimed (not past their expiry date)"""
+    
+    def get_queryset(self):
+        return super().get_queryset().filter(expiry_date__gte=timezone.localdate())
+
 
 class Donation(models.Model):
     CATEGORY_CHOICES = [
@@ -29,15 +39,46 @@ class Donation(models.Model):
     pickup_time_end = models.TimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
+    # Optional divisible stock: approvals reserve units from it (see donations.claims).
+    # Left empty, the donation goes whole to the first approved request
+    units_available = models.PositiveIntegerField(null=True, blank=True)
+    # Set once nothing is left to allocate
+    claimed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    # Filled in off the request path by donations.images
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_thumb_webp = models.ImageField(upload_to='donation_images/variants/', null=True, blank=True, editable=False)
+    image_card_webp = models.ImageField(upload_to='donation_images/variants/', null=True, blank=True, editable=False)
+    image_card_jpeg = models.ImageField(upload_to='donation_images/variants/', null=True, blank=True, editable=False)
+    image_processed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    # Maintained on save; full-text and trigram indexes are built on it (see donations.search)
+    search_document = models.TextField(blank=True, editable=False)
+    
+    # Part of the cached card fragment key; bump whenever the card's content changes
+    card_version = models.PositiveIntegerField(default=1, editable=False)
+    
+    objects = models.Manager()
+    active = ActiveDonationManager()
+    
     def __str__(self):
         return self.food_title
     
+    def save(self, *args, **kwargs):
+        self.search_document = build_search_document(self.food_title, self.description, self.pickup_location)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'search_document' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['search_document']
+        super().save(*args, **kwargs)
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['pickup_latitude', 'pickup_longitude']),
             models.Index(fields=['category']),
             models.Index(fields=['expiry_date']),
+            models.Index(fields=['-created_at', '-id']),
         ]
 
 
@@ -52,6 +93,8 @@ class Request(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     is_read = models.BooleanField(default=False)
     notes = models.TextField(blank=True, null=True)
+    # Units asked for when the donation tracks units_available
+    units = models.PositiveIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -61,3 +104,96 @@ class Request(models.Model):
     class Meta:
         ordering = ['-created_at']
         unique_together = ['donation', 'receiver']
+        indexes = [
+            # Receiver notification pages (donations.notifications)
+            models.Index(fields=['receiver', '-updated_at', '-id']),
+        ]
+
+
+class ArchivedDonation(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    donor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_donations')
+    food_title = models.CharField(max_length=255)
+    description = models.TextField()
+    quantity = models.CharField(max_length=100)
+    pickup_location = models.CharField(max_length=500)
+    
+    pickup_latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    pickup_longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    
+    expiry_date = models.DateField()
+    food_image = models.ImageField(upload_to='donation_images/', null=True, blank=True)
+    category = models.CharField(max_length=20, choices=Donation.CATEGORY_CHOICES, default='other')
+    pickup_time_start = models.TimeField(null=True, blank=True)
+    pickup_time_end = models.TimeField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    
+    units_available = models.PositiveIntegerField(null=True, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    
+    image_width = models.PositiveIntegerField(null=True, blank=True)
+    image_height = models.PositiveIntegerField(null=True, blank=True)
+    image_thumb_webp = models.ImageField(upload_to='donation_images/variants/', null=True, blank=True)
+    image_card_webp = models.ImageField(upload_to='donation_images/variants/', null=True, blank=True)
+    image_card_jpeg = models.ImageField(upload_to='donation_images/variants/', null=True, blank=True)
+    image_processed_at = models.DateTimeField(null=True, blank=True)
+    
+    card_version = models.PositiveIntegerField(default=1)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return self.food_title
+    
+    class Meta:
+        db_table = 'archived_donations'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['donor', '-created_at']),
+        ]
+
+
+class ArchivedRequest(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    donation = models.ForeignKey(ArchivedDonation, on_delete=models.CASCADE, related_name='requests')
+    receiver = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_requests')
+    status = models.CharField(max_length=10, choices=Request.STATUS_CHOICES)
+    is_read = models.BooleanField(default=False)
+    notes = models.TextField(blank=True, null=True)
+    units = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Archived request #{self.id} for {self.donation.food_title}"
+    
+    class Meta:
+        db_table = 'archived_requests'
+        ordering = ['-created_at']
+
+
+class NotificationCounter(models.Model):
+    """
+    Per-user badge counts kept current on every Request write (see donations.counters)
+    pending_requests is the donor-side badge; receivers see rejected + unread_approved
+    version/updated_at change whenever anything in the user's notification list does
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name='notification_counter')
+    pending_requests = models.IntegerField(default=0)
+    unread_approved = models.IntegerField(default=0)
+    rejected = models.IntegerField(default=0)
+    
+    # Bumped on every change to the user's notifications; validates client caches (ETag)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        db_table = 'notification_counters'
+    
+    def __str__(self):
+        return f"Counters for user #{self.user_id}"
+    
+    @property
+    def receiver_badge(self):
+        return self.rejected + self.unread_approved
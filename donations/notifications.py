@@ -0,0 +1,72 @@
+from datetime import timedelta
+
+from django.utils.functional import cached_property
+
+from .models import Request
+from .pagination import keyset_page
+
+# Answered requests per page of a receiver's notifications
+NOTIFICATION_PAGE_SIZE = 50
+
+NOTIFICATION_ORDERING = ('updated_at', 'id')
+
+# Cursors are moved back this much so rows whose transaction committed late are not missed
+NOTIFICATION_CURSOR_OVERLAP = timedelta(seconds=2)
+
+
+def changed_requests(user, since):
+    """
+    Requests in the user's notification feed changed at or after since
+    Donors get every changed request on their donations (including ones that
+    left 'pending'); receivers get the ones the donor has answered
+    """
+    if user.role.startswith('donor'):
+        return (
+            Request.objects.filter(donation__donor=user, updated_at__gte=since)
+            .select_related('donation', 'receiver')
+        )
+    return (
+        Request.objects.filter(receiver=user, updated_at__gte=since)
+        .exclude(status='pending').select_related('donation')
+    )
+
+
+class ReceiverNotifications:
+    """
+    Read-model over one keyset page of a receiver's answered requests, newest
+    change first, loaded with a single query
+    Rejected requests always show as notifications; approved ones until read
+    """
+
+    def __init__(self, user, cursor=None, page_size=None):
+        self.user = user
+        self.requests, self.next_cursor = keyset_page(
+            Request.objects.filter(receiver=user).exclude(status='pending').select_related('donation__donor'),
+            cursor=cursor, page_size=page_size or NOTIFICATION_PAGE_SIZE, ordering=NOTIFICATION_ORDERING,
+        )
+
+    @cached_property
+    def requested_count(self):
+        """All of the receiver's requests, pending ones included"""
+        return Request.objects.filter(receiver=self.user).count()
+
+    @property
+    def rejected(self):
+        return [req for req in self.requests if req.status == 'rejected']
+
+    @property
+    def approved(self):
+        return [req for req in self.requests if req.status == 'approved']
+
+    @property
+    def unread_approved(self):
+        return [req for req in self.approved if not req.is_read]
+
+    @property
+    def notifications(self):
+        return self.rejected + self.unread_approved
+
+    @property
+    def decided(self):
+        """Requests the donor has answered (approved or rejected)"""
+        return self.requests
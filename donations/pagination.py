@@ -0,0 +1,82 @@
+import base64
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 24
+
+DEFAULT_ORDERING = ('created_at', 'id')
+
+
+def _cursor_value(value):
+    # isoformat() keeps microseconds; DjangoJSONEncoder would cut them to milliseconds
+    # and the seek would then skip rows created within the same millisecond
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(obj, ordering=DEFAULT_ORDERING):
+    """Opaque cursor pointing just after obj in descending `ordering` order"""
+    values = [_cursor_value(getattr(obj, field)) for field in ordering]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def _ordering_fields(queryset, ordering):
+    """The model field or annotation output field behind each ordering name"""
+    annotations = queryset.query.annotations
+    return [
+        annotations[name].output_field if name in annotations else queryset.model._meta.get_field(name)
+        for name in ordering
+    ]
+
+
+def decode_cursor(cursor, queryset, ordering=DEFAULT_ORDERING):
+    """
+    Return the ordering values stored in a cursor, converted with each field's
+    to_python, or None if it is missing or malformed (the caller starts over)
+    """
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(values, list) or len(values) != len(ordering):
+            return None
+        values = [field.to_python(value) for field, value in zip(_ordering_fields(queryset, ordering), values)]
+    except (ValidationError, TypeError, ValueError, UnicodeDecodeError):
+        return None
+    if any(value is None for value in values):
+        return None
+    return values
+
+
+def _after(ordering, values):
+    """WHERE clause for rows strictly after values in descending tuple order"""
+    condition = Q()
+    for index in reversed(range(len(ordering))):
+        ties = {field: value for field, value in zip(ordering[:index], values[:index])}
+        step = Q(**{f'{ordering[index]}__lt': values[index]}, **ties)
+        condition = step if index == len(ordering) - 1 else step | condition
+    return condition
+
+
+def keyset_page(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE, ordering=DEFAULT_ORDERING):
+    """
+    One page of queryset in descending `ordering` order, starting after cursor
+    Seeks with WHERE (a, b, ...) < cursor instead of OFFSET, so every page costs
+    the same however deep it is; the last ordering field must be unique
+    Returns (items, next_cursor); next_cursor is None on the last page
+    """
+    queryset = queryset.order_by(*[f'-{field}' for field in ordering])
+
+    position = decode_cursor(cursor, queryset, ordering)
+    if position is not None:
+        queryset = queryset.filter(_after(ordering, position))
+
+    items = list(queryset[:page_size + 1])
+    if len(items) > page_size:
+        items = items[:page_size]
+        return items, encode_cursor(items[-1], ordering)
+    return items, None
@@ -0,0 +1,72 @@
+import re
+
+from django.db import connection
+from django.db.models import Case, F, FloatField, IntegerField, Q, Value, When
+from django.db.models.functions import Cast
+
+SEARCH_CONFIG = 'english'
+
+SEARCH_ORDERING = ('search_rank', 'created_at', 'id')
+
+
+def build_search_document(*parts):
+    """Lowercased, whitespace-collapsed text that the search indexes are built on"""
+    return ' '.join(' '.join(part or '' for part in parts).lower().split())
+
+
+def search_terms(query):
+    return re.findall(r'\w+', (query or '').lower())
+
+
+def _postgres_search(queryset, query):
+    from django.contrib.postgres.lookups import TrigramWordSimilar
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+    from django.db.models import TextField
+
+    # The lookup is normally registered by django.contrib.postgres' AppConfig,
+    # which the project does not install so SQLite setups keep working.
+    # Matches use pg_trgm.word_similarity_threshold (0.6 by default)
+    TextField.register_lookup(TrigramWordSimilar)
+
+    text = ' '.join(search_terms(query))
+    # Must match the expression in the GIN index created by the migration
+    vector = SearchVector('search_document', config=SEARCH_CONFIG)
+    ts_query = SearchQuery(text, config=SEARCH_CONFIG)
+
+    return (
+        queryset
+        .annotate(search_vector=vector)
+        .filter(Q(search_vector=ts_query) | Q(search_document__trigram_word_similar=text))
+        .annotate(search_rank=Cast(
+            SearchRank(F('search_vector'), ts_query) + TrigramWordSimilarity(text, 'search_document'),
+            FloatField(),
+        ))
+    )
+
+
+def _portable_search(queryset, query):
+    terms = search_terms(query)
+    for term in terms:
+        queryset = queryset.filter(search_document__contains=term)
+
+    # Rank by how many terms appear in the title
+    title_hits = [
+        Case(When(food_title__icontains=term, then=Value(1)), default=Value(0), output_field=IntegerField())
+        for term in terms
+    ]
+    rank = sum(title_hits[1:], title_hits[0]) if title_hits else Value(0)
+    return queryset.annotate(search_rank=Cast(rank, FloatField()))
+
+
+def search_donations(queryset, query):
+    """
+    Restrict queryset to donations matching query, annotated with search_rank
+    PostgreSQL uses the full-text and trigram GIN indexes on search_document;
+    other databases fall back to substring matching on the same column
+    Order with SEARCH_ORDERING (descending) to get best matches first
+    """
+    if not search_terms(query):
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+    if connection.vendor == 'postgresql':
+        return _postgres_search(queryset, query)
+    return _portable_search(queryset, query)
@@ -0,0 +1,953 @@
+import asyncio
+import base64
+import io
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from subscriptions.entitlements import invalidate_plans
+from subscriptions.models import SubscriptionPlan, UsageCounter
+from subscriptions.usage import current_period
+from users.models import CustomUser
+from . import counters, events, notifications, views
+from .archival import DONATION_FIELDS, REQUEST_FIELDS, archive_expired_donations, restore_batch
+from .claims import ClaimError, approve_request, claim_donation, decide_requests
+from .counters import get_counter, rebuild_counters, record_transition
+from .events import NotificationBroker, event_stream
+from .images import process_donation_image, strip_metadata
+from .models import ArchivedDonation, ArchivedRequest, Donation, NotificationCounter, Request
+from .pagination import keyset_page
+from .search import SEARCH_ORDERING, search_donations
+
+
+class CounterAssertionsMixin:
+    def counter_counts(self):
+        """{user_id: (pending_requests, unread_approved, rejected)} for users with any count"""
+        rows = NotificationCounter.objects.values_list('user_id', 'pending_requests', 'unread_approved', 'rejected')
+        return {user_id: tuple(counts) for user_id, *counts in rows if any(counts)}
+
+    def assertCountersMatchRebuild(self):
+        maintained = self.counter_counts()
+        rebuild_counters()
+        self.assertEqual(maintained, self.counter_counts())
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        donor = CustomUser.objects.create(username='donor@example.com', full_name='Donor', role='donor_restaurant')
+        expiry = timezone.localdate() + timedelta(days=1)
+        Donation.objects.bulk_create([
+            Donation(donor=donor, food_title=f'Meal {i}', description='Fresh', quantity='1',
+                     pickup_location='Pune', expiry_date=expiry)
+            for i in range(200)
+        ])
+        # Half share one timestamp exactly, the rest sit within the same millisecond
+        moment = timezone.now().replace(microsecond=123456)
+        ids = list(Donation.objects.order_by('id').values_list('id', flat=True))
+        Donation.objects.filter(id__in=ids[:100]).update(created_at=moment)
+        for offset, donation_id in enumerate(ids[100:]):
+            Donation.objects.filter(id=donation_id).update(created_at=moment + timedelta(microseconds=offset % 7))
+
+    def test_pages_cover_rows_with_identical_timestamps(self):
+        seen, cursor = [], None
+        while True:
+            page, cursor = keyset_page(Donation.objects.all(), cursor=cursor, page_size=7)
+            seen.extend((donation.created_at, donation.id) for donation in page)
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 200)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_malformed_cursors_start_from_the_first_page(self):
+        first, _ = keyset_page(Donation.objects.all(), page_size=7)
+        for values in (['garbage', 1], [{'a': 1}, 'x'], ['2026-01-01T00:00:00+00:00', 'abc'], [None, 1], [1]):
+            cursor = base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+            with self.subTest(values=values):
+                page, _ = keyset_page(Donation.objects.all(), cursor=cursor, page_size=7)
+                self.assertEqual(page, first)
+        self.assertEqual(keyset_page(Donation.objects.all(), cursor='%%%', page_size=7)[0], first)
+
+    def test_search_cursor_is_checked_against_the_rank_annotation(self):
+        # bulk_create skipped save(), which fills search_document
+        Donation.objects.update(search_document='meal fresh pune')
+        results = search_donations(Donation.objects.all(), 'meal')
+        _, cursor = keyset_page(results, page_size=7, ordering=SEARCH_ORDERING)
+        self.assertEqual(len(keyset_page(results, cursor=cursor, page_size=7, ordering=SEARCH_ORDERING)[0]), 7)
+        cursor = base64.urlsafe_b64encode(json.dumps(['high', 'x', 1]).encode()).decode()
+        page, _ = keyset_page(results, cursor=cursor, page_size=7, ordering=SEARCH_ORDERING)
+        self.assertEqual(len(page), 7)
+
+        self.client.force_login(CustomUser.objects.create(username='receiver@example.com', role='receiver_ngo'))
+        response = self.client.get(reverse('receiver_donations_page'), {'cursor': cursor, 'search': 'meal'})
+        self.assertEqual(response.status_code, 200)
+
+
+class ReceiverNotificationQueryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.donor = CustomUser.objects.create_user(
+            username='donor@example.com', password='x', full_name='Donor', role='donor_restaurant'
+        )
+        cls.receiver = CustomUser.objects.create_user(
+            username='receiver@example.com', password='x', full_name='Receiver', role='receiver_ngo'
+        )
+        expiry = timezone.localdate() + timedelta(days=3)
+        statuses = ['pending', 'approved', 'rejected']
+        for i in range(12):
+            donation = Donation.objects.create(
+                donor=cls.donor, food_title=f'Meal {i}', description='Fresh', quantity='5',
+                pickup_location='Pune', expiry_date=expiry,
+            )
+            Request.objects.create(
+                donation=donation, receiver=cls.receiver, status=statuses[i % 3], is_read=i % 2 == 0
+            )
+        rebuild_counters()
+
+    def setUp(self):
+        self.client.force_login(self.receiver)
+
+    def test_dashboard_query_count_is_fixed(self):
+        # session, user, donation page, answered requests, request count
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('receiver_dashboard'))
+
+        self.assertEqual(response.status_code, 200)
+        notifications = response.context['notifications']
+        self.assertEqual([req.status for req in notifications], ['rejected'] * 4 + ['approved'] * 2)
+        self.assertEqual(len(response.context['approved_requests']), 4)
+        self.assertEqual(response.context['my_requests_count'], 12)
+
+    def test_dashboard_query_count_does_not_grow_with_requests(self):
+        for i in range(10):
+            donation = Donation.objects.create(
+                donor=self.donor, food_title=f'Extra {i}', description='Fresh', quantity='1',
+                pickup_location='Pune', expiry_date=timezone.localdate(),
+            )
+            Request.objects.create(donation=donation, receiver=self.receiver, status='approved')
+
+        with self.assertNumQueries(5):
+            self.client.get(reverse('receiver_dashboard'))
+
+    def test_available_card_counts_past_the_first_page(self):
+        expiry = timezone.localdate() + timedelta(days=3)
+        Donation.objects.bulk_create([
+            Donation(donor=self.donor, food_title=f'Soup {i}', description='Fresh', quantity='1',
+                     pickup_location='Pune', expiry_date=expiry)
+            for i in range(30)
+        ])
+        available = Donation.active.filter(claimed_at__isnull=True).count()
+
+        response = self.client.get(reverse('receiver_dashboard'))
+        self.assertEqual(len(response.context['donations']), 24)
+        self.assertEqual(response.context['donations_count'], available)
+        self.assertFalse(response.context['donations_count_capped'])
+
+        with mock.patch.object(views, 'AVAILABLE_COUNT_CAP', 25):
+            response = self.client.get(reverse('receiver_dashboard'))
+        self.assertEqual(response.context['donations_count'], 25)
+        self.assertContains(response, '25+')
+
+    def test_get_notifications_uses_one_request_query(self):
+        # session, user, counter (for the ETag), requests
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('get_notifications'))
+
+        data = response.json()
+        self.assertEqual(data['count'], 8)
+        self.assertNotIn('pending', {item['status'] for item in data['notifications']})
+
+    def test_answered_requests_are_paged_newest_first(self):
+        url = reverse('get_notifications')
+        with mock.patch.object(notifications, 'NOTIFICATION_PAGE_SIZE', 5):
+            first = self.client.get(url).json()
+            second = self.client.get(url, {'page': first['next_page']}).json()
+
+        self.assertEqual((first['count'], second['count'], second['next_page']), (5, 3, None))
+        ids = [item['id'] for item in first['notifications'] + second['notifications']]
+        expected = (
+            Request.objects.filter(receiver=self.receiver).exclude(status='pending')
+            .order_by('-updated_at', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(ids, list(expected))
+
+        response = self.client.get(url)
+        # The stored ETag of the first page does not answer for the second
+        response = self.client.get(url, {'page': first['next_page']}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_mark_notifications_read(self):
+        # session, user, savepoint, mark read, counter update, release, counter read
+        with self.assertNumQueries(7):
+            response = self.client.post(reverse('mark_notifications_read'))
+
+        self.assertEqual(response.json()['unread_count'], 0)
+        self.assertFalse(
+            Request.objects.filter(receiver=self.receiver, status='approved', is_read=False).exists()
+        )
+
+
+class NotificationCounterTests(CounterAssertionsMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.donor = CustomUser.objects.create_user(
+            username='donor@example.com', password='x', full_name='Donor', role='donor_individual'
+        )
+        cls.receivers = [
+            CustomUser.objects.create_user(
+                username=f'receiver{i}@example.com', password='x', full_name=f'Receiver {i}', role='receiver_shelter'
+            )
+            for i in range(2)
+        ]
+        cls.donation = Donation.objects.create(
+            donor=cls.donor, food_title='Rice', description='Fresh', quantity='5',
+            pickup_location='Pune', expiry_date=timezone.localdate() + timedelta(days=1),
+        )
+
+    def request_donation(self, receiver):
+        self.client.force_login(receiver)
+        self.client.post(reverse('request_donation', args=[self.donation.id]), {}, content_type='application/json')
+
+    def set_status(self, req, status):
+        self.client.force_login(self.donor)
+        self.client.post(reverse('update_request_status', args=[req.id]), {'status': status},
+                         content_type='application/json')
+
+    def test_counters_follow_request_lifecycle(self):
+        first, second = self.receivers
+        self.request_donation(first)
+        self.request_donation(second)
+        self.request_donation(second)  # duplicate request is not counted twice
+        self.assertEqual(get_counter(self.donor).pending_requests, 2)
+
+        self.set_status(Request.objects.get(receiver=first), 'approved')
+        self.set_status(Request.objects.get(receiver=second), 'rejected')
+        self.assertEqual(get_counter(self.donor).pending_requests, 0)
+        self.assertEqual(get_counter(first).receiver_badge, 1)
+        self.assertEqual(get_counter(second).rejected, 1)
+        self.assertCountersMatchRebuild()
+
+        self.client.force_login(first)
+        response = self.client.post(reverse('mark_notifications_read'))
+        self.assertEqual(response.json()['unread_count'], 0)
+        self.assertEqual(get_counter(first).unread_approved, 0)
+        self.assertCountersMatchRebuild()
+
+    def test_deleting_donation_releases_pending_count(self):
+        self.request_donation(self.receivers[0])
+        self.client.force_login(self.donor)
+        self.client.post(reverse('delete_donation', args=[self.donation.id]))
+        self.assertEqual(get_counter(self.donor).pending_requests, 0)
+
+    def test_rebuild_does_not_overwrite_a_counter_created_meanwhile(self):
+        receiver = self.receivers[0]
+        count_requests = counters._count_requests
+
+        def reject(title):
+            donation = Donation.objects.create(
+                donor=self.donor, food_title=title, description='Fresh', quantity='1',
+                pickup_location='Pune', expiry_date=timezone.localdate() + timedelta(days=1),
+            )
+            Request.objects.create(donation=donation, receiver=receiver, status='rejected')
+            record_transition(self.donor.pk, receiver.pk, None, ('rejected', False))
+
+        def writes_around_the_count():
+            # The receiver's first request lands after the zeroing, creating
+            # their counter row, and a second one after the count
+            reject('Soup')
+            totals = count_requests()
+            reject('Bread')
+            return totals
+
+        with mock.patch.object(counters, '_count_requests', writes_around_the_count):
+            rebuild_counters()
+        self.assertEqual(get_counter(receiver).rejected, 2)
+        self.assertCountersMatchRebuild()
+
+    def test_rebuild_fills_in_missing_counter_rows(self):
+        self.request_donation(self.receivers[0])
+        NotificationCounter.objects.all().delete()
+        rebuild_counters()
+        self.assertEqual(get_counter(self.donor).pending_requests, 1)
+
+    def test_donor_badge_is_one_lookup(self):
+        self.request_donation(self.receivers[0])
+        with self.assertNumQueries(1):
+            self.assertEqual(get_counter(self.donor).pending_requests, 1)
+
+
+class ImagePipelineTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def photo_with_exif(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotated 90 degrees
+        exif[0x010f] = 'Camera'
+        buffer = io.BytesIO()
+        Image.new('RGB', (2000, 1500), 'green').save(buffer, 'JPEG', exif=exif)
+        return SimpleUploadedFile('rice.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_upload_is_stripped_before_it_is_stored(self):
+        donor = CustomUser.objects.create_user(
+            username='photo@example.com', password='x', full_name='Donor', role='donor_individual'
+        )
+        self.client.force_login(donor)
+        with mock.patch.object(views, 'schedule_image_processing') as schedule:
+            self.client.post(reverse('add_donation'), {
+                'food_title': 'Rice', 'description': 'Fresh', 'quantity': '5', 'pickup_location': 'Pune',
+                'expiry_date': timezone.localdate().isoformat(), 'food_image': self.photo_with_exif(),
+            })
+
+        # Nothing has been processed yet, and the stored original is already clean
+        donation = Donation.objects.get(donor=donor)
+        schedule.assert_called_once_with(donation.id)
+        with Image.open(donation.food_image.path) as image:
+            self.assertEqual(image.size, (1500, 2000))
+            self.assertFalse(image.getexif())
+
+    def test_variants_are_resized_and_stripped(self):
+        donor = CustomUser.objects.create_user(
+            username='photo@example.com', password='x', full_name='Donor', role='donor_individual'
+        )
+        donation = Donation.objects.create(
+            donor=donor, food_title='Rice', description='Fresh', quantity='5', pickup_location='Pune',
+            expiry_date=timezone.localdate(), food_image=strip_metadata(self.photo_with_exif()),
+        )
+
+        self.assertTrue(process_donation_image(donation.id))
+        donation.refresh_from_db()
+
+        self.assertEqual((donation.image_width, donation.image_height), (1500, 2000))
+        self.assertEqual(donation.card_version, 2)
+        for field, size in [('food_image', (1500, 2000)), ('image_thumb_webp', (320, 427)),
+                            ('image_card_webp', (640, 853)), ('image_card_jpeg', (640, 853))]:
+            with Image.open(getattr(donation, field).path) as image:
+                self.assertEqual(image.size, size)
+                self.assertFalse(image.getexif())
+
+
+class BulkImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.donor = CustomUser.objects.create_user(
+            username='restaurant@example.com', password='x', full_name='Restaurant', role='donor_restaurant'
+        )
+
+    def setUp(self):
+        self.client.force_login(self.donor)
+        self.expiry = (timezone.localdate() + timedelta(days=1)).isoformat()
+
+    def test_csv_import_uses_a_fixed_number_of_queries(self):
+        lines = ['food_title,description,quantity,pickup_location,expiry_date,category']
+        lines += [f'Tray {i},Dal rice,{i} kg,Kitchen {i % 5},{self.expiry},vegan' for i in range(1000)]
+        body = '\r\n'.join(lines).encode()
+
+        # One INSERT for all rows, unless the backend caps parameters per query (SQLite)
+        fields = [field for field in Donation._meta.concrete_fields if not field.primary_key]
+        inserts = math.ceil(1000 / connection.ops.bulk_batch_size(fields, range(1000)))
+        # session, user, savepoint, release, then quota: subscription, plans,
+        # counter update, first-of-month insert, retried update (no geocoding
+        # provider is configured, so the geocode table is not touched)
+        with self.assertNumQueries(9 + inserts):
+            response = self.client.post(
+                reverse('bulk_import_donations'), body, content_type='text/csv'
+            )
+
+        self.assertEqual(response.json()['created'], 1000)
+        donation = Donation.objects.get(food_title='Tray 7')
+        self.assertEqual(donation.search_document, 'tray 7 dal rice kitchen 2')
+        # Without a geocoding provider no coordinates are made up
+        self.assertIsNone(donation.pickup_latitude)
+
+    def test_invalid_row_rolls_back_unless_partial(self):
+        body = '\n'.join([
+            json.dumps({'food_title': 'Soup', 'description': 'Hot', 'quantity': '3',
+                        'pickup_location': 'Pune', 'expiry_date': self.expiry}),
+            json.dumps({'food_title': 'Bread', 'description': 'Day old', 'quantity': '2',
+                        'pickup_location': 'Pune', 'expiry_date': 'tomorrow', 'category': 'pastry'}),
+        ]).encode()
+        url = reverse('bulk_import_donations')
+
+        response = self.client.post(url, body, content_type='application/x-ndjson').json()
+        self.assertEqual(response['created'], 0)
+        self.assertEqual(response['errors'][0]['row'], 2)
+        self.assertEqual(set(response['errors'][0]['errors']), {'expiry_date', 'category'})
+        self.assertFalse(Donation.objects.exists())
+
+        response = self.client.post(url + '?partial=1', body, content_type='application/x-ndjson').json()
+        self.assertEqual(response['created'], 1)
+        self.assertEqual(Donation.objects.get().food_title, 'Soup')
+
+    def test_imports_are_counted_against_the_quota_per_chunk(self):
+        SubscriptionPlan.objects.create(
+            tier='free', name='Free', description='', price_monthly=0, price_yearly=0, max_donations_per_month=3,
+        )
+        invalidate_plans()
+        self.addCleanup(invalidate_plans)
+        CustomUser.objects.filter(id=self.donor.id).update(email='restaurant@example.com')
+        header = 'food_title,description,quantity,pickup_location,expiry_date'
+        rows = [f'Tray {i},Dal rice,1 kg,Kitchen,{self.expiry}' for i in range(4)]
+
+        response = self.client.post(
+            reverse('bulk_import_donations'), '\n'.join([header, *rows[:2]]).encode(), content_type='text/csv'
+        ).json()
+        self.assertEqual(response['created'], 2)
+
+        # The second chunk of two goes over the quota of three; nothing from this run is kept
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as handle:
+            handle.write('\n'.join([header, *rows[2:]]))
+        self.addCleanup(os.remove, handle.name)
+        with self.assertRaisesMessage(CommandError, 'allows 3 donations per month'):
+            call_command('import_donations', handle.name, donor='restaurant@example.com', chunk_size=1)
+        self.assertEqual(Donation.objects.count(), 2)
+
+        response = self.client.post(
+            reverse('bulk_import_donations'), '\n'.join([header, *rows[2:]]).encode(), content_type='text/csv'
+        ).json()
+        self.assertEqual((response['success'], response['created']), (False, 0))
+        self.assertEqual(Donation.objects.count(), 2)
+        self.assertEqual(UsageCounter.objects.get(user=self.donor, period=current_period()).donations, 2)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.donor = CustomUser.objects.create_user(
+            username='donor@example.com', password='x', full_name='Donor', role='donor_restaurant'
+        )
+        cls.donations = {
+            title: Donation.objects.create(
+                donor=cls.donor, food_title=title, description=description, quantity='5',
+                pickup_location=location, expiry_date=timezone.localdate() + timedelta(days=1),
+            )
+            for title, description, location in (
+                ('Veg Biryani', 'Fresh  rice with vegetables', 'Koregaon Park'),
+                ('Dal Rice', 'Lentils and biryani-style rice', 'Kothrud'),
+                ('Bread', 'Day old loaves', 'Baner'),
+            )
+        }
+
+    def titles(self, query):
+        results = search_donations(Donation.objects.all(), query).order_by('-search_rank', '-created_at', '-id')
+        return [donation.food_title for donation in results]
+
+    def test_search_document_follows_saves(self):
+        donation = self.donations['Bread']
+        self.assertEqual(donation.search_document, 'bread day old loaves baner')
+        donation.food_title = 'Sourdough'
+        donation.save(update_fields=['food_title'])
+        self.assertEqual(Donation.objects.get(id=donation.id).search_document, 'sourdough day old loaves baner')
+
+    def test_every_term_must_match_and_title_hits_rank_first(self):
+        self.assertEqual(self.titles('biryani'), ['Veg Biryani', 'Dal Rice'])
+        # One title hit each: the rank ties and the newer donation comes first
+        self.assertEqual(self.titles('RICE biryani'), ['Dal Rice', 'Veg Biryani'])
+        self.assertEqual(self.titles('kothrud lentils'), ['Dal Rice'])
+        self.assertEqual(self.titles('pizza'), [])
+        self.assertEqual(len(self.titles('  ')), 3)
+
+
+class ArchivalTests(CounterAssertionsMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.donor = CustomUser.objects.create_user(
+            username='donor@example.com', password='x', full_name='Donor', role='donor_restaurant'
+        )
+        cls.receivers = CustomUser.objects.bulk_create([
+            CustomUser(username=f'receiver{i}@example.com', full_name=f'Receiver {i}', role='receiver_ngo')
+            for i in range(2)
+        ])
+
+    def row(self, obj):
+        return {field.attname: getattr(obj, field.attname) for field in obj._meta.concrete_fields}
+
+    def test_archive_copies_every_live_column(self):
+        self.assertEqual(
+            set(DONATION_FIELDS), {field.attname for field in Donation._meta.concrete_fields} - {'search_document'}
+        )
+        self.assertEqual(set(REQUEST_FIELDS), {field.attname for field in Request._meta.concrete_fields})
+
+    def test_expired_donations_leave_the_receiver_view_but_not_the_owner_view(self):
+        expired = Donation.objects.create(
+            donor=self.donor, food_title='Yesterday', description='Fresh', quantity='1',
+            pickup_location='Pune', expiry_date=timezone.localdate() - timedelta(days=1),
+        )
+        self.client.force_login(self.donor)
+        self.assertEqual(list(self.client.get(reverse('donor_dashboard')).context['donations']), [expired])
+
+        self.client.force_login(CustomUser.objects.create_user(
+            username='shelter@example.com', password='x', full_name='Shelter', role='receiver_shelter'
+        ))
+        self.assertEqual(list(self.client.get(reverse('receiver_dashboard')).context['donations']), [])
+
+    def test_archive_and_restore_round_trip(self):
+        donation = Donation.objects.create(
+            donor=self.donor, food_title='Biryani', description='Fresh', quantity='20 plates',
+            pickup_location='Pune', pickup_latitude='18.520400', pickup_longitude='73.856700',
+            expiry_date=timezone.localdate() - timedelta(days=2), food_image='donation_images/biryani.jpg',
+            category='halal', units_available=2, image_width=640, image_height=480,
+            image_thumb_webp='donation_images/variants/biryani_thumb.webp',
+            image_card_webp='donation_images/variants/biryani_card.webp',
+            image_card_jpeg='donation_images/variants/biryani_card.jpg',
+            image_processed_at=timezone.now(),
+        )
+        Donation.objects.filter(id=donation.id).update(
+            card_version=4, claimed_at=timezone.now(), created_at=timezone.now() - timedelta(days=3),
+        )
+        approved = Request.objects.create(donation=donation, receiver=self.receivers[0], units=3, notes='Two trips')
+        Request.objects.create(donation=donation, receiver=self.receivers[1], units=1)
+        Request.objects.filter(id=approved.id).update(
+            status='approved', updated_at=timezone.now() - timedelta(days=1),
+        )
+        before = (
+            self.row(Donation.objects.get(id=donation.id)),
+            [self.row(req) for req in Request.objects.order_by('id')],
+        )
+        rebuild_counters()
+        counters = self.counter_counts()
+
+        self.assertEqual(archive_expired_donations(), (1, 2))
+        self.assertFalse(Donation.objects.exists())
+        self.assertEqual(ArchivedRequest.objects.get(id=approved.id).units, 3)
+        self.assertEqual(ArchivedDonation.objects.get(id=donation.id).card_version, 4)
+
+        self.assertEqual(restore_batch([donation.id]), (1, 2))
+        after = (
+            self.row(Donation.objects.get(id=donation.id)),
+            [self.row(req) for req in Request.objects.order_by('id')],
+        )
+        self.assertEqual(after, before)
+        self.assertFalse(ArchivedDonation.objects.exists())
+        self.assertEqual(self.counter_counts(), counters)
+
+
+class ConditionalNotificationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.donor = CustomUser.objects.create_user(
+            username='donor@example.com', password='x', full_name='Donor', role='donor_individual'
+        )
+        cls.receiver = CustomUser.objects.create_user(
+            username='receiver@example.com', password='x', full_name='Receiver', role='receiver_ngo'
+        )
+        cls.donation = Donation.objects.create(
+            donor=cls.donor, food_title='Rice', description='Fresh', quantity='5',
+            pickup_location='Pune', expiry_date=timezone.localdate() + timedelta(days=1),
+        )
+
+    def test_unchanged_notifications_answer_304(self):
+        self.client.force_login(self.donor)
+        url = reverse('get_notifications')
+        etag = self.client.get(url)['ETag']
+
+        # session, user, counter
+        with self.assertNumQueries(3):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.force_login(self.receiver)
+        self.client.post(reverse('request_donation', args=[self.donation.id]), {}, content_type='application/json')
+
+        self.client.force_login(self.donor)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 1)
+
+    def test_polling_with_since_and_the_stored_etag_answers_304(self):
+        # What the dashboard poller does: a fresh cursor every time, the last ETag sent back
+        self.client.force_login(self.donor)
+        url = reverse('get_notifications')
+        first = self.client.get(url, {'since': timezone.now().isoformat()})
+        etag, cursor = first['ETag'], first.json()['cursor']
+
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {'since': cursor}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        claim_donation(self.donation, self.receiver)
+        response = self.client.get(url, {'since': cursor}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['receiver_name'] for item in response.json()['notifications']], ['Receiver'])
+        etag, cursor = response['ETag'], response.json()['cursor']
+
+        response = self.client.get(url, {'since': cursor}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_since_returns_only_changed_requests(self):
+        self.client.force_login(self.receiver)
+        url = reverse('get_notifications')
+        old = Request.objects.create(donation=self.donation, receiver=self.receiver, status='rejected')
+        Request.objects.filter(id=old.id).update(updated_at=timezone.now() - timedelta(hours=1))
+        cursor = self.client.get(url).json()['cursor']
+
+        other = Donation.objects.create(
+            donor=self.donor, food_title='Bread', description='Fresh', quantity='2',
+            pickup_location='Pune', expiry_date=timezone.localdate() + timedelta(days=1),
+        )
+        Request.objects.create(donation=other, receiver=self.receiver, status='approved')
+
+        data = self.client.get(url, {'since': cursor}).json()
+        self.assertTrue(data['delta'])
+        self.assertEqual([item['donation_title'] for item in data['notifications']], ['Bread'])
+
+
+class ClaimTests(CounterAssertionsMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.donor = CustomUser.objects.create_user(
+            username='donor@example.com', password='x', full_name='Donor', role='donor_restaurant'
+        )
+        cls.receivers = CustomUser.objects.bulk_create([
+            CustomUser(username=f'receiver{i}@example.com', full_name=f'Receiver {i}', role='receiver_ngo')
+            for i in range(3)
+        ])
+
+    def make_donation(self, **fields):
+        return Donation.objects.create(
+            donor=self.donor, food_title='Biryani', description='Fresh', quantity='20 plates',
+            pickup_location='Pune', expiry_date=timezone.localdate() + timedelta(days=1), **fields
+        )
+
+    def test_approval_rejects_competing_requests(self):
+        donation = self.make_donation()
+        claims = [claim_donation(donation, receiver) for receiver in self.receivers]
+
+        rejected = approve_request(Request.objects.select_related('donation').get(id=claims[0].id))
+
+        self.assertEqual({req.id for req in rejected}, {claims[1].id, claims[2].id})
+        self.assertEqual(
+            dict(Request.objects.values_list('receiver_id', 'status')),
+            {self.receivers[0].pk: 'approved', self.receivers[1].pk: 'rejected', self.receivers[2].pk: 'rejected'},
+        )
+        donation.refresh_from_db()
+        self.assertIsNotNone(donation.claimed_at)
+        with self.assertRaises(ClaimError):
+            claim_donation(donation, self.receivers[1])
+        self.assertCountersMatchRebuild()
+
+    def test_stale_donation_instance_is_rechecked(self):
+        donation = self.make_donation(units_available=5)
+        stale = Donation.objects.get(id=donation.id)
+        first = claim_donation(donation, self.receivers[0], units=4)
+        approve_request(Request.objects.select_related('donation').get(id=first.id))
+
+        # stale still says 5 units are left; the row says 1
+        with self.assertRaisesMessage(ClaimError, 'Only 1 units are left'):
+            claim_donation(stale, self.receivers[1], units=2)
+        self.assertEqual(stale.units_available, 1)
+        claim_donation(stale, self.receivers[1], units=1)
+
+        whole = self.make_donation()
+        stale = Donation.objects.get(id=whole.id)
+        approve_request(claim_donation(whole, self.receivers[0]))
+        with self.assertRaisesMessage(ClaimError, 'already been claimed'):
+            claim_donation(stale, self.receivers[2])
+        self.assertFalse(Request.objects.filter(donation=whole, receiver=self.receivers[2]).exists())
+        self.assertCountersMatchRebuild()
+
+    def test_units_are_reserved_until_exhausted(self):
+        donation = self.make_donation(units_available=5)
+        big, small, large = [
+            claim_donation(donation, receiver, units=units) for receiver, units in zip(self.receivers, (3, 2, 4))
+        ]
+
+        rejected = approve_request(Request.objects.select_related('donation').get(id=big.id))
+        self.assertEqual([req.id for req in rejected], [large.id])
+        donation.refresh_from_db()
+        self.assertEqual(donation.units_available, 2)
+        self.assertIsNone(donation.claimed_at)
+
+        approve_request(Request.objects.select_related('donation').get(id=small.id))
+        donation.refresh_from_db()
+        self.assertEqual(donation.units_available, 0)
+        self.assertIsNotNone(donation.claimed_at)
+
+        with self.assertRaises(ClaimError):
+            approve_request(Request.objects.select_related('donation').get(id=small.id))
+        self.assertCountersMatchRebuild()
+
+    def test_bulk_decisions(self):
+        single = self.make_donation()
+        shared = self.make_donation(units_available=4)
+        first, second, third = [claim_donation(single, receiver) for receiver in self.receivers]
+        fits, too_big = [claim_donation(shared, receiver, units=units)
+                         for receiver, units in zip(self.receivers, (3, 2))]
+        stranger = CustomUser.objects.create(username='other@example.com', role='donor_individual')
+        foreign = claim_donation(
+            Donation.objects.create(donor=stranger, food_title='Other', description='x', quantity='1',
+                                    pickup_location='Pune', expiry_date=timezone.localdate()),
+            self.receivers[2],
+        )
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            results, auto_rejected = decide_requests(self.donor, {
+                first.id: 'approved', second.id: 'approved', fits.id: 'approved', foreign.id: 'rejected',
+            })
+
+        self.assertEqual(results, {
+            first.id: 'approved', second.id: 'unavailable', fits.id: 'approved', foreign.id: 'not_found',
+        })
+        self.assertEqual({req.id for req in auto_rejected}, {third.id, too_big.id})
+        self.assertEqual(Request.objects.get(id=foreign.id).status, 'pending')
+        self.assertFalse(Request.objects.filter(donation__donor=self.donor, status='pending').exists())
+        # One consolidated event per receiver
+        self.assertEqual(len(callbacks), 3)
+        self.assertCountersMatchRebuild()
+
+        response = self.client.post(reverse('update_request_statuses'), {'ids': [first.id], 'status': 'rejected'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 302)
+        self.client.force_login(self.donor)
+        response = self.client.post(reverse('update_request_statuses'), {'ids': [first.id], 'status': 'rejected'},
+                                    content_type='application/json').json()
+        self.assertEqual(response['results'], {str(first.id): 'already_decided'})
+
+    def test_malformed_bulk_payloads_are_refused(self):
+        claim = claim_donation(self.make_donation(), self.receivers[0])
+        self.client.force_login(self.donor)
+        url = reverse('update_request_statuses')
+        for body in (
+            {'ids': claim.id, 'status': 'approved'},
+            {'ids': [str(claim.id)], 'status': 'approved'},
+            {'ids': [True], 'status': 'approved'},
+            {'decisions': {'id': claim.id, 'status': 'approved'}},
+            {'decisions': [claim.id]},
+            {'decisions': [{'id': [claim.id], 'status': 'approved'}]},
+            [claim.id],
+        ):
+            with self.subTest(body=body):
+                response = self.client.post(url, body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.json()['success'])
+        response = self.client.post(url, '{"ids": [', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Request.objects.get(id=claim.id).status, 'pending')
+
+    def test_duplicate_claim_is_refused(self):
+        donation = self.make_donation()
+        claim_donation(donation, self.receivers[0])
+        with self.assertRaises(ClaimError):
+            claim_donation(donation, self.receivers[0])
+        self.assertEqual(get_counter(self.donor).pending_requests, 1)
+
+    def test_retried_claim_replays_the_first_response(self):
+        donation = self.make_donation()
+        self.client.force_login(self.receivers[0])
+        url = reverse('request_donation', args=[donation.id])
+
+        first = self.client.post(url, {'notes': 'Tonight'}, content_type='application/json',
+                                 HTTP_IDEMPOTENCY_KEY='claim-1')
+        # Just the session and user lookups; the view does not run again
+        with self.assertNumQueries(2):
+            retry = self.client.post(url, {'notes': 'Tonight'}, content_type='application/json',
+                                     HTTP_IDEMPOTENCY_KEY='claim-1')
+
+        self.assertTrue(first.json()['success'])
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Request.objects.filter(donation=donation).count(), 1)
+        # Without the key the retry is a new request, refused as a duplicate
+        self.assertFalse(self.client.post(url, {'notes': 'Tonight'}, content_type='application/json').json()['success'])
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ClaimStressTests(TransactionTestCase):
+    """Hundreds of concurrent claimers and approvers on one donation (needs a server database)"""
+
+    CLAIMERS = 200
+    APPROVERS = 20
+    UNITS = 50
+
+    def run_threads(self, target, args_list):
+        errors = []
+        barrier = threading.Barrier(len(args_list))
+
+        def run(*args):
+            try:
+                barrier.wait()
+                target(*args)
+            except ClaimError:
+                pass
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=args) for args in args_list]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_claims_never_over_allocate(self):
+        donor = CustomUser.objects.create(username='donor@example.com', full_name='Donor', role='donor_restaurant')
+        receivers = CustomUser.objects.bulk_create([
+            CustomUser(username=f'receiver{i}@example.com', full_name=f'Receiver {i}', role='receiver_ngo')
+            for i in range(self.CLAIMERS)
+        ])
+        donation = Donation.objects.create(
+            donor=donor, food_title='Thali', description='Fresh', quantity='50 plates', pickup_location='Pune',
+            expiry_date=timezone.localdate() + timedelta(days=1), units_available=self.UNITS,
+        )
+
+        # Every receiver claims twice at once; exactly one claim each may land
+        self.run_threads(
+            lambda receiver, units: claim_donation(Donation.objects.get(id=donation.id), receiver, units=units),
+            [(receiver, 1 + i % 3) for i, receiver in enumerate(receivers)] * 2,
+        )
+        self.assertEqual(Request.objects.filter(donation=donation).count(), self.CLAIMERS)
+
+        ids = list(Request.objects.filter(donation=donation).values_list('id', flat=True))
+        self.run_threads(
+            lambda request_id: approve_request(Request.objects.select_related('donation').get(id=request_id)),
+            [(request_id,) for request_id in ids[:self.APPROVERS * 3]],
+        )
+
+        donation.refresh_from_db()
+        approved_units = sum(
+            Request.objects.filter(donation=donation, status='approved').values_list('units', flat=True)
+        )
+        self.assertEqual(approved_units + donation.units_available, self.UNITS)
+        self.assertGreaterEqual(donation.units_available, 0)
+        self.assertFalse(
+            Request.objects.filter(donation=donation, status='pending', units__gt=donation.units_available).exists()
+        )
+
+        maintained = get_counter(donor).pending_requests
+        self.assertEqual(maintained, Request.objects.filter(donation=donation, status='pending').count())
+
+
+class NotificationBrokerTests(SimpleTestCase):
+    def test_publish_from_another_thread_reaches_subscriber(self):
+        broker = NotificationBroker()
+
+        async def scenario():
+            subscription = broker.subscribe(user_id=1)
+            other = broker.subscribe(user_id=2)
+            publisher = threading.Thread(target=broker.publish, args=(1, 'request_status', {'id': 5}))
+            publisher.start()
+            publisher.join()
+            event = await asyncio.wait_for(subscription.queue.get(), 1)
+            self.assertTrue(other.queue.empty())
+            broker.unsubscribe(other)
+            return event
+
+        event = asyncio.run(scenario())
+        self.assertEqual(event['type'], 'request_status')
+        self.assertEqual(event['data'], {'id': 5})
+
+    def test_stream_unsubscribes_when_closed(self):
+        broker = NotificationBroker()
+
+        async def scenario():
+            stream = event_stream(broker.subscribe(user_id=1))
+            self.assertEqual(await stream.__anext__(), 'retry: 5000\n\n')
+            self.assertEqual(broker.subscriber_count(), 1)
+            await stream.aclose()
+
+        asyncio.run(scenario())
+        self.assertEqual(broker.subscriber_count(), 0)
+
+    def test_stream_closes_itself_after_max_seconds(self):
+        broker = NotificationBroker()
+
+        async def scenario():
+            chunks = [chunk async for chunk in event_stream(broker.subscribe(user_id=1), max_seconds=0.05)]
+            return chunks
+
+        chunks = asyncio.run(asyncio.wait_for(scenario(), 5))
+        self.assertEqual(chunks[0], 'retry: 5000\n\n')
+        self.assertEqual(broker.subscriber_count(), 0)
+
+
+class NotificationStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.receiver = CustomUser.objects.create_user(
+            username='receiver@example.com', password='x', full_name='Receiver', role='receiver_ngo'
+        )
+        cls.donor = CustomUser.objects.create_user(
+            username='donor@example.com', password='x', full_name='Donor', role='donor_individual'
+        )
+        cls.donation = Donation.objects.create(
+            donor=cls.donor, food_title='Rice', description='Fresh', quantity='5',
+            pickup_location='Pune', expiry_date=timezone.localdate() + timedelta(days=1),
+        )
+
+    def test_wsgi_dashboards_poll_instead_of_streaming(self):
+        self.client.force_login(self.receiver)
+        response = self.client.get(reverse('receiver_dashboard'))
+        self.assertFalse(response.context['live_updates'])
+        self.assertNotContains(response, 'new EventSource')
+        self.assertContains(response, reverse('get_notifications'))
+
+        response = self.client.get(reverse('notification_stream'))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_asgi_stream_delivers_events_and_ends(self):
+        await self.async_client.aforce_login(self.receiver)
+        with mock.patch.object(events, 'MAX_STREAM_SECONDS', 0.2):
+            response = await self.async_client.get(reverse('notification_stream'))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+            chunks = []
+            async for chunk in response.streaming_content:
+                chunks.append(chunk.decode())
+                if len(chunks) == 1:
+                    events.broker.publish(self.receiver.pk, 'request_status', {'id': 7})
+        self.assertEqual(chunks[0], 'retry: 5000\n\n')
+        self.assertTrue(chunks[1].startswith('id: '))
+        self.assertIn('event: request_status\ndata: {"id": 7}\n\n', chunks[2])
+        self.assertEqual(events.broker.subscriber_count(), 0)
+
+    async def test_reconnect_replays_events_missed_since_last_event_id(self):
+        last_seen = timezone.now()
+        req = await Request.objects.acreate(donation=self.donation, receiver=self.receiver, status='approved')
+        await self.async_client.aforce_login(self.receiver)
+        with mock.patch.object(events, 'MAX_STREAM_SECONDS', 0.05):
+            response = await self.async_client.get(
+                reverse('notification_stream'), headers={'Last-Event-ID': last_seen.isoformat()},
+            )
+            chunks = [chunk.decode() async for chunk in response.streaming_content]
+        self.assertIn('event: request_statuses\n', chunks[2])
+        self.assertEqual([item['id'] for item in json.loads(chunks[2].split('data: ')[1])['requests']], [req.id])
+
+    def test_replay_follows_each_side_of_the_feed(self):
+        last_seen = timezone.now()
+        req = Request.objects.create(donation=self.donation, receiver=self.receiver)
+        cursor = timezone.now()
+        self.assertEqual(events.replay_events(self.donor, last_seen.isoformat(), cursor), [{
+            'id': cursor.isoformat(), 'type': 'request_created', 'data': events.request_created_payload(req),
+        }])
+        # Still pending, so nothing for the receiver yet
+        self.assertEqual(events.replay_events(self.receiver, last_seen.isoformat(), cursor), [])
+
+        req.status = 'approved'
+        req.save()
+        replay = events.replay_events(self.receiver, last_seen.isoformat(), cursor)
+        self.assertEqual(replay[0]['data'], {'requests': [events.request_status_payload(req)]})
+        self.assertEqual(events.replay_events(self.donor, last_seen.isoformat(), cursor), [])
+
+        later = (timezone.now() + timedelta(minutes=1)).isoformat()
+        for last_event_id in (later, None, 'garbage', '2026-13-45T99:00:00+00:00', '2026-01-01T00:00:00'):
+            self.assertEqual(events.replay_events(self.receiver, last_event_id, cursor), [])
@@ -10,9 +10,13 @@ urlpatterns = [
     path('donor/add-donation/', views.add_donation, name='add_donation'),
     path('donor/edit-donation/<int:donation_id>/', views.edit_donation, name='edit_donation'),
     path('donor/delete-donation/<int:donation_id>/', views.delete_donation, name='delete_donation'),
+    path('donor/import-donations/', views.bulk_import_donations, name='bulk_import_donations'),
     path('receiver/dashboard/', views.receiver_dashboard, name='receiver_dashboard'),
+    path('receiver/donations/', views.receiver_donations_page, name='receiver_donations_page'),
     path('request-donation/<int:donation_id>/', views.request_donation, name='request_donation'),
     path('update-request/<int:request_id>/', views.update_request_status, name='update_request_status'),
+    path('update-requests/', views.update_request_statuses, name='update_request_statuses'),
     path('notifications/', views.get_notifications, name='get_notifications'),
+    path('notifications/stream/', views.notification_stream, name='notification_stream'),
     path('mark-notifications-read/', views.mark_notifications_read, name='mark_notifications_read'),
 ]
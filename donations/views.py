@@ -1,13 +1,44 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
+from django.template.loader import render_to_string
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
-from django.views.decorators.http import require_POST
-from django.db import models
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
+from django.middleware.http import ConditionalGetMiddleware
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import decorator_from_middleware
+from django.db import models, transaction
+from users.decorators import idempotent
 from users.models import CustomUser
+from users.utils import geocode_address
+from subscriptions.usage import QuotaExceeded, consume
 from .models import Donation, Request
+from .cards import bump_card_version, drop_card_fragments
+from .claims import ClaimError, approve_request, claim_donation, decide_requests, reject_request
+from .counters import apply_deltas, bump_versions, get_counter, record_removed
+from .events import (
+    broker, event_stream, replay_events, request_created_payload, request_status_payload, streaming_supported,
+)
+from .images import reset_image_variants, schedule_image_processing, strip_metadata
+from .importer import FORMATS as IMPORT_FORMATS, DonationImportError, detect_format, import_donations
+from .notifications import NOTIFICATION_CURSOR_OVERLAP, ReceiverNotifications, changed_requests
+from .pagination import DEFAULT_ORDERING, keyset_page
+from .search import SEARCH_ORDERING, search_donations
+import codecs
 import json
+from collections import Counter
+
+# ETag from a hash of the body: saves the transfer, not the rendering
+conditional_content = decorator_from_middleware(ConditionalGetMiddleware)
+
+MAX_BULK_DECISIONS = 500
+
+# The Available Donations card counts matches up to this many and shows "N+" past it
+AVAILABLE_COUNT_CAP = 1000
 
 def home(request):
     return render(request, 'home.html')
@@ -76,6 +107,7 @@ def donor_dashboard(request):
     if not request.user.role.startswith('donor'):
         return redirect('receiver_dashboard')
     
+    # Owners still see their expired donations until they are archived
     donations = Donation.objects.filter(donor=request.user)
     pending_requests = Request.objects.filter(
         donation__donor=request.user,
@@ -85,7 +117,9 @@ def donor_dashboard(request):
     context = {
         'donations': donations,
         'pending_requests': pending_requests,
-        'notifications_count': pending_requests.count()
+        'notifications_count': get_counter(request.user).pending_requests,
+        'live_updates': streaming_supported(request),
+        'notifications_cursor': timezone.now().isoformat(),
     }
     return render(request, 'donor_dashboard.html', context)
 
@@ -95,41 +129,100 @@ def add_donation(request):
         return redirect('receiver_dashboard')
     
     if request.method == 'POST':
-        donation = Donation.objects.create(
-            donor=request.user,
-            food_title=request.POST.get('food_title'),
-            description=request.POST.get('description'),
-            quantity=request.POST.get('quantity'),
-            pickup_location=request.POST.get('pickup_location'),
-            expiry_date=request.POST.get('expiry_date'),
-            food_image=request.FILES.get('food_image'),
-            category=request.POST.get('category', 'other'),
-            pickup_time_start=request.POST.get('pickup_time_start') or None,
-            pickup_time_end=request.POST.get('pickup_time_end') or None
-        )
+        pickup_location = request.POST.get('pickup_location')
+        location = geocode_address(pickup_location) or {}
+        try:
+            with transaction.atomic():
+                consume(request.user, 'donations')
+                donation = Donation.objects.create(
+                    donor=request.user,
+                    food_title=request.POST.get('food_title'),
+                    description=request.POST.get('description'),
+                    quantity=request.POST.get('quantity'),
+                    pickup_location=pickup_location,
+                    pickup_latitude=location.get('latitude'),
+                    pickup_longitude=location.get('longitude'),
+                    expiry_date=request.POST.get('expiry_date'),
+                    food_image=strip_metadata(request.FILES.get('food_image')),
+                    category=request.POST.get('category', 'other'),
+                    pickup_time_start=request.POST.get('pickup_time_start') or None,
+                    pickup_time_end=request.POST.get('pickup_time_end') or None,
+                    units_available=request.POST.get('units_available') or None
+                )
+        except QuotaExceeded as exc:
+            messages.error(request, str(exc))
+            return render(request, 'add_donation.html')
+        if donation.food_image:
+            schedule_image_processing(donation.id)
         messages.success(request, 'Donation added successfully!')
         return redirect('donor_dashboard')
     
     return render(request, 'add_donation.html')
 
 @login_required
-def receiver_dashboard(request):
-    if not request.user.role.startswith('receiver'):
-        return redirect('donor_dashboard')
+@require_POST
+def bulk_import_donations(request):
+    """
+    Import many donations from a CSV or JSON Lines payload, sent either as the
+    raw request body or as a multipart upload named "file"
+    The body is read line by line, so large payloads are never held in memory
+    Pass ?partial=1 to keep valid rows when some rows fail validation
+    """
+    if not request.user.role.startswith('donor'):
+        return JsonResponse({'success': False, 'message': 'Only donors can import donations'})
     
-    donations = Donation.objects.all().select_related('donor')
+    upload = request.FILES.get('file')
+    if upload is not None:
+        stream, fmt = upload, detect_format(upload.content_type, upload.name)
+    else:
+        stream, fmt = request, detect_format(request.content_type)
+    fmt = request.GET.get('format') or fmt
+    if fmt not in IMPORT_FORMATS:
+        return JsonResponse({
+            'success': False,
+            'message': 'Send text/csv or application/x-ndjson, or pass ?format=csv|jsonl',
+        }, status=400)
+    
+    try:
+        created, errors = import_donations(
+            request.user,
+            codecs.iterdecode(stream, 'utf-8-sig'),
+            fmt,
+            partial=request.GET.get('partial') == '1',
+        )
+    except (DonationImportError, UnicodeDecodeError) as exc:
+        return JsonResponse({'success': False, 'message': str(exc)}, status=400)
+    except QuotaExceeded as exc:
+        return JsonResponse({'success': False, 'message': str(exc), 'created': 0, 'errors': []})
+    
+    if errors and not created:
+        message = f'Nothing imported: {len(errors)} rows have errors'
+    elif errors:
+        message = f'Imported {created} donations; {len(errors)} rows skipped'
+    else:
+        message = f'Imported {created} donations'
+    return JsonResponse({'success': not errors, 'message': message, 'created': created, 'errors': errors})
+
+def _filtered_donations(request):
+    """
+    Donations matching the receiver dashboard's search, category and expiry filters
+    Returns (queryset, ordering) where ordering is the keyset to paginate by
+    """
+    donations = Donation.active.filter(claimed_at__isnull=True).select_related('donor').annotate(
+        is_requested=models.Exists(
+            Request.objects.filter(donation=models.OuterRef('pk'), receiver=request.user)
+        )
+    )
     
     # Apply filters
     search_query = request.GET.get('search', '')
     category_filter = request.GET.get('category', '')
     expiry_filter = request.GET.get('expiry', '')
     
+    ordering = DEFAULT_ORDERING
     if search_query:
-        donations = donations.filter(
-            models.Q(food_title__icontains=search_query) |
-            models.Q(description__icontains=search_query) |
-            models.Q(pickup_location__icontains=search_query)
-        )
+        donations = search_donations(donations, search_query)
+        ordering = SEARCH_ORDERING
     
     if category_filter:
         donations = donations.filter(category=category_filter)
@@ -146,36 +239,63 @@ def receiver_dashboard(request):
             month_end = today + timedelta(days=30)
             donations = donations.filter(expiry_date__lte=month_end, expiry_date__gte=today)
     
-    my_requests = Request.objects.filter(receiver=request.user).select_related('donation')
-    
-    requested_donation_ids = my_requests.values_list('donation_id', flat=True)
-    
-    # Show rejected notifications always (even if read) + unread approved notifications
-    rejected_notifications = my_requests.filter(status='rejected').select_related('donation')
-    unread_approved_notifications = my_requests.filter(status='approved', is_read=False).select_related('donation')
+    return donations, ordering
+
+@login_required
+def receiver_dashboard(request):
+    if not request.user.role.startswith('receiver'):
+        return redirect('donor_dashboard')
     
-    # Combine both querysets for notifications
-    from itertools import chain
-    notifications = list(chain(rejected_notifications, unread_approved_notifications))
+    donations, ordering = _filtered_donations(request)
+    page, next_cursor = keyset_page(donations, ordering=ordering)
+    # A short first page is already the total; otherwise count, but stop at the cap
+    # so the card never costs the full scan keyset paging avoids
+    donations_count = len(page) if next_cursor is None else donations[:AVAILABLE_COUNT_CAP + 1].count()
     
-    # Get approved requests to show contact info
-    approved_requests = my_requests.filter(status='approved').select_related('donation__donor')
+    # All request states come from one query; approved requests carry donor contact info
+    my_requests = ReceiverNotifications(request.user)
+    notifications = my_requests.notifications
     
     context = {
-        'donations': donations,
-        'requested_donation_ids': list(requested_donation_ids),
+        'donations': page,
+        'donations_count': min(donations_count, AVAILABLE_COUNT_CAP),
+        'donations_count_capped': donations_count > AVAILABLE_COUNT_CAP,
+        'next_cursor': next_cursor,
+        'my_requests_count': my_requests.requested_count,
         'notifications': notifications,
         'notifications_count': len(notifications),
-        'approved_requests': approved_requests,
-        'search_query': search_query,
-        'category_filter': category_filter,
-        'expiry_filter': expiry_filter,
+        'approved_requests': my_requests.approved,
+        'search_query': request.GET.get('search', ''),
+        'category_filter': request.GET.get('category', ''),
+        'expiry_filter': request.GET.get('expiry', ''),
         'categories': Donation.CATEGORY_CHOICES,
+        'live_updates': streaming_supported(request),
+        'notifications_cursor': timezone.now().isoformat(),
     }
     return render(request, 'receiver_dashboard.html', context)
 
+@login_required
+@cache_control(private=True, no_cache=True)
+@conditional_content
+def receiver_donations_page(request):
+    if not request.user.role.startswith('receiver'):
+        return JsonResponse({'success': False, 'message': 'Only receivers can browse donations'})
+    
+    donations, ordering = _filtered_donations(request)
+    page, next_cursor = keyset_page(donations, cursor=request.GET.get('cursor'), ordering=ordering)
+    
+    html = render_to_string('receiver_donation_cards.html', {'donations': page}, request=request)
+    return JsonResponse({
+        'success': True,
+        'html': html,
+        'count': len(page),
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None,
+    })
+
 @login_required
 @require_POST
+@idempotent
 def request_donation(request, donation_id):
     if not request.user.role.startswith('receiver'):
         return JsonResponse({'success': False, 'message': 'Only receivers can request donations'})
@@ -183,65 +303,184 @@ def request_donation(request, donation_id):
     donation = get_object_or_404(Donation, id=donation_id)
     
     data = json.loads(request.body)
-    notes = data.get('notes', '')
-    
-    request_obj, created = Request.objects.get_or_create(
-        donation=donation,
-        receiver=request.user,
-        defaults={'notes': notes}
-    )
     
-    if created:
-        return JsonResponse({'success': True, 'message': 'Request sent successfully!'})
-    else:
-        return JsonResponse({'success': False, 'message': 'You have already requested this donation'})
+    try:
+        with transaction.atomic():
+            consume(request.user, 'requests')
+            claim_donation(donation, request.user, notes=data.get('notes', ''), units=data.get('units'))
+    except (ClaimError, QuotaExceeded) as exc:
+        return JsonResponse({'success': False, 'message': str(exc)})
+    return JsonResponse({'success': True, 'message': 'Request sent successfully!'})
 
 @login_required
 @require_POST
+@idempotent
 def update_request_status(request, request_id):
     if not request.user.role.startswith('donor'):
         return JsonResponse({'success': False, 'message': 'Only donors can update request status'})
     
-    request_obj = get_object_or_404(Request, id=request_id, donation__donor=request.user)
+    request_obj = get_object_or_404(
+        Request.objects.select_related('donation'), id=request_id, donation__donor=request.user
+    )
     
     data = json.loads(request.body)
     status = data.get('status')
     
-    if status in ['approved', 'rejected']:
-        request_obj.status = status
-        request_obj.save()
-        return JsonResponse({'success': True, 'message': f'Request {status} successfully!'})
+    if status not in ['approved', 'rejected']:
+        return JsonResponse({'success': False, 'message': 'Invalid status'})
+    
+    try:
+        if status == 'approved':
+            auto_rejected = approve_request(request_obj)
+        else:
+            reject_request(request_obj)
+            auto_rejected = []
+    except ClaimError as exc:
+        return JsonResponse({'success': False, 'message': str(exc)})
+    return JsonResponse({
+        'success': True,
+        'message': f'Request {status} successfully!',
+        'auto_rejected': [req.id for req in auto_rejected],
+    })
+
+@login_required
+@require_POST
+@idempotent
+def update_request_statuses(request):
+    """
+    Approve or reject many requests in one call
+    Body: {"ids": [...], "status": "approved" | "rejected"}, or
+    {"decisions": [{"id": ..., "status": ...}, ...]} to mix both
+    """
+    if not request.user.role.startswith('donor'):
+        return JsonResponse({'success': False, 'message': 'Only donors can update request status'})
     
-    return JsonResponse({'success': False, 'message': 'Invalid status'})
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Invalid JSON'}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'success': False, 'message': 'Expected a JSON object'}, status=400)
+    if 'decisions' in data:
+        items = data['decisions']
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            return JsonResponse({'success': False, 'message': 'decisions must be a list of objects'}, status=400)
+        pairs = [(item.get('id'), item.get('status')) for item in items]
+    else:
+        ids = data.get('ids', [])
+        if not isinstance(ids, list):
+            return JsonResponse({'success': False, 'message': 'ids must be a list'}, status=400)
+        pairs = [(request_id, data.get('status')) for request_id in ids]
+    
+    # bool is an int subclass; true/false are not request ids
+    if not all(isinstance(request_id, int) and not isinstance(request_id, bool) for request_id, _ in pairs):
+        return JsonResponse({'success': False, 'message': 'Request ids must be integers'}, status=400)
+    decisions = dict(pairs)
+    if not decisions:
+        return JsonResponse({'success': False, 'message': 'No requests selected'})
+    if len(decisions) > MAX_BULK_DECISIONS:
+        return JsonResponse({'success': False, 'message': f'At most {MAX_BULK_DECISIONS} requests per call'})
+    if any(status not in ('approved', 'rejected') for status in decisions.values()):
+        return JsonResponse({'success': False, 'message': 'Invalid status'})
+    
+    results, auto_rejected = decide_requests(request.user, decisions)
+    
+    counts = Counter(results.values())
+    message = ', '.join(f'{count} {outcome.replace("_", " ")}' for outcome, count in sorted(counts.items()))
+    return JsonResponse({
+        'success': bool(counts['approved'] or counts['rejected']),
+        'message': message,
+        'results': results,
+        'auto_rejected': [req.id for req in auto_rejected],
+    })
+
+def _notification_counter(request):
+    # Shared by the ETag and Last-Modified checks so the row is read once
+    if not hasattr(request, '_notification_counter'):
+        request._notification_counter = get_counter(request.user)
+    return request._notification_counter
+
+def _notifications_etag(request):
+    etag = f'{request.user.pk}.{_notification_counter(request).version}'
+    # Pages of one version differ from each other; deltas (?since) do not need this
+    page = request.GET.get('page')
+    return f'{etag}.{page}' if page else etag
+
+def _notifications_last_modified(request):
+    counter = _notification_counter(request)
+    return counter.updated_at if counter.version else None
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_notifications_etag, last_modified_func=_notifications_last_modified)
 def get_notifications(request):
-    if request.user.role.startswith('donor'):
-        notifications = Request.objects.filter(
-            donation__donor=request.user,
-            status='pending'
-        ).select_related('donation', 'receiver')
-        
-        data = [{
-            'id': req.id,
-            'receiver_name': req.receiver.full_name,
-            'donation_title': req.donation.food_title,
-            'status': req.status,
-            'created_at': req.created_at.strftime('%Y-%m-%d %H:%M')
-        } for req in notifications]
+    """
+    Notification list for the current user
+    Answers 304 while the user's notification version is unchanged. With
+    ?since=<cursor from a previous response> only requests changed after the
+    cursor are returned (donors also get requests that left 'pending', so they
+    can drop them); clients should merge the delta by id. The ETag ignores
+    ?since, so pollers send back the last ETag with the new cursor and keep
+    getting 304s until the version moves. Receivers get their answered
+    requests a page at a time; ?page=<next_page from a previous response>
+    fetches the next one
+    """
+    cursor = timezone.now()
+    since = parse_datetime(request.GET.get('since') or '')
+    donor = request.user.role.startswith('donor')
+    next_page = None
+    if since is not None:
+        # Overlap a little so rows whose transaction committed late are not missed
+        notifications = changed_requests(request.user, since - NOTIFICATION_CURSOR_OVERLAP)
+    elif donor:
+        notifications = (
+            Request.objects.filter(donation__donor=request.user, status='pending')
+            .select_related('donation', 'receiver')
+        )
     else:
-        notifications = Request.objects.filter(
-            receiver=request.user
-        ).exclude(status='pending').select_related('donation')
-        
-        data = [{
-            'id': req.id,
-            'donation_title': req.donation.food_title,
-            'status': req.status,
-            'updated_at': req.updated_at.strftime('%Y-%m-%d %H:%M')
-        } for req in notifications]
-    
-    return JsonResponse({'notifications': data, 'count': len(data)})
+        my_requests = ReceiverNotifications(request.user, cursor=request.GET.get('page'))
+        notifications, next_page = my_requests.decided, my_requests.next_cursor
+    
+    payload = request_created_payload if donor else request_status_payload
+    data = [payload(req) for req in notifications]
+    
+    return JsonResponse({
+        'notifications': data,
+        'count': len(data),
+        'delta': since is not None,
+        'cursor': cursor.isoformat(),
+        'next_page': next_page,
+    })
+
+
+async def notification_stream(request):
+    """
+    Server-Sent Events stream of request events for the logged-in user (ASGI only)
+    Resumes from the Last-Event-ID header, or ?since=<cursor> on the first connection
+    """
+    if not streaming_supported(request):
+        # Dashboards poll get_notifications instead of streaming under WSGI
+        return JsonResponse({'success': False, 'message': 'Live updates are not available on this server'}, status=404)
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'success': False, 'message': 'Login required'}, status=401)
+    
+    # Subscribe before reading the backlog so nothing published in between is missed;
+    # the browser resends the last id it saw as Last-Event-ID when it reconnects
+    subscription = broker.subscribe(user.pk)
+    cursor = timezone.now()
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('since')
+    try:
+        replay = await sync_to_async(replay_events)(user, last_event_id, cursor)
+    except Exception:
+        broker.unsubscribe(subscription)
+        raise
+    response = StreamingHttpResponse(
+        event_stream(subscription, cursor=cursor, replay=replay), content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @login_required
@@ -252,19 +491,33 @@ def edit_donation(request, donation_id):
     donation = get_object_or_404(Donation, id=donation_id, donor=request.user)
     
     if request.method == 'POST':
+        title_changed = request.POST.get('food_title') != donation.food_title
         donation.food_title = request.POST.get('food_title')
         donation.description = request.POST.get('description')
         donation.quantity = request.POST.get('quantity')
-        donation.pickup_location = request.POST.get('pickup_location')
+        pickup_location = request.POST.get('pickup_location')
+        if pickup_location != donation.pickup_location:
+            location = geocode_address(pickup_location) or {}
+            donation.pickup_latitude = location.get('latitude')
+            donation.pickup_longitude = location.get('longitude')
+        donation.pickup_location = pickup_location
         donation.expiry_date = request.POST.get('expiry_date')
         donation.category = request.POST.get('category', 'other')
         donation.pickup_time_start = request.POST.get('pickup_time_start') or None
         donation.pickup_time_end = request.POST.get('pickup_time_end') or None
         
-        if request.FILES.get('food_image'):
-            donation.food_image = request.FILES.get('food_image')
+        new_image = request.FILES.get('food_image')
+        if new_image:
+            donation.food_image = strip_metadata(new_image)
+            reset_image_variants(donation)
         
+        bump_card_version(donation)
         donation.save()
+        if title_changed:
+            # Notification lists show the title, so cached copies are now stale
+            bump_versions([donation.donor_id, *donation.requests.values_list('receiver_id', flat=True)])
+        if new_image:
+            schedule_image_processing(donation.id)
         messages.success(request, 'Donation updated successfully!')
         return redirect('donor_dashboard')
     
@@ -278,7 +531,13 @@ def delete_donation(request, donation_id):
         return JsonResponse({'success': False, 'message': 'Only donors can delete donations'})
     
     donation = get_object_or_404(Donation, id=donation_id, donor=request.user)
-    donation.delete()
+    with transaction.atomic():
+        record_removed(
+            dict(row, donor_id=donation.donor_id)
+            for row in donation.requests.values('receiver_id', 'status', 'is_read')
+        )
+        drop_card_fragments(donation)
+        donation.delete()
     
     return JsonResponse({'success': True, 'message': 'Donation deleted successfully!'})
 
@@ -289,9 +548,11 @@ def mark_notifications_read(request):
         return JsonResponse({'success': False, 'message': 'Invalid request'})
     
     # Mark only approved notifications as read (keep rejected visible)
-    Request.objects.filter(receiver=request.user, status='approved', is_read=False).update(is_read=True)
+    with transaction.atomic():
+        marked = Request.objects.filter(receiver=request.user, status='approved', is_read=False).update(is_read=True)
+        apply_deltas({request.user.pk: {'unread_approved': -marked}})
     
     # Count remaining unread notifications (only approved ones now)
-    unread_count = Request.objects.filter(receiver=request.user, status='approved', is_read=False).count()
+    unread_count = get_counter(request.user).unread_approved
     
     return JsonResponse({'success': True, 'message': 'Notifications marked as read', 'unread_count': unread_count})
@@ -66,6 +66,18 @@ DATABASES = {
     }
 }
 
+# Local memory by default; set CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# and CACHE_LOCATION to a directory to share rendered fragments between worker processes.
+# With a per-process cache, subscription changes reach other workers only when their
+# cached entitlements expire (subscriptions.entitlements.LOCAL_ENTITLEMENT_CACHE_SECONDS)
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='kindplate'),
+        'TIMEOUT': config('CACHE_TIMEOUT', default=300, cast=int),
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -96,6 +108,11 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
 AUTH_USER_MODEL = 'users.CustomUser'
+
+# Dotted path to a users.geocoding.GeocodingProvider; empty leaves donation coordinates unset.
+# users.geocoding.OfflineGeocodingProvider invents points near Pune, for demos only
+GEOCODING_PROVIDER = config('GEOCODING_PROVIDER', default='')
+GEOCODE_CACHE_SIZE = config('GEOCODE_CACHE_SIZE', default=1024, cast=int)
 LOGIN_URL = '/login/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
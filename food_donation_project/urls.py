@@ -5,6 +5,7 @@ from django.conf.urls.static import static
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('subscriptions/', include('subscriptions.urls')),
     path('', include('donations.urls')),
 ]
 
@@ -0,0 +1,129 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils import timezone
+
+from .models import SubscriptionPlan, UserSubscription
+
+TIER_RANK = {'free': 0, 'pro': 1, 'enterprise': 2}
+
+# Upper bound on how stale another process's copy of the plans can get
+PLAN_CACHE_SECONDS = 300
+
+# Upper bound on how long a resolved tier is reused; subscription writes evict it sooner
+ENTITLEMENT_CACHE_SECONDS = 600
+
+# The same bound when the default cache is per process (LocMemCache): the eviction
+# only reaches the process that saved the subscription, so other workers can keep
+# serving the old tier this long after an upgrade, downgrade or cancellation
+LOCAL_ENTITLEMENT_CACHE_SECONDS = 60
+
+_plans_lock = threading.Lock()
+_plans = None
+_plans_loaded_at = 0.0
+
+
+def get_plans():
+    """All plans by tier, loaded once per process (and again after a plan is saved)"""
+    global _plans, _plans_loaded_at
+    plans = _plans
+    if plans is not None and time.monotonic() - _plans_loaded_at < PLAN_CACHE_SECONDS:
+        return plans
+    with _plans_lock:
+        if _plans is None or time.monotonic() - _plans_loaded_at >= PLAN_CACHE_SECONDS:
+            _plans = {plan.tier: plan for plan in SubscriptionPlan.objects.all()}
+            _plans_loaded_at = time.monotonic()
+        return _plans
+
+
+def invalidate_plans():
+    global _plans
+    _plans = None
+
+
+def _cache_key(user_id):
+    return f'entitlements:{user_id}'
+
+
+class Entitlements:
+    """What a user's plan allows, valid until valid_until (end of the subscription or cache lifetime)"""
+
+    def __init__(self, tier, valid_until):
+        self.tier = tier
+        self.valid_until = valid_until
+
+    @property
+    def plan(self):
+        # Looked up on access so plan edits apply without touching per-user entries
+        return get_plans().get(self.tier)
+
+    def is_current(self):
+        return timezone.now() < self.valid_until
+
+    def has_feature(self, feature_name):
+        return bool(getattr(self.plan, f'has_{feature_name}', False))
+
+    def at_least(self, tier):
+        return TIER_RANK.get(self.tier, 0) >= TIER_RANK.get(tier, 0)
+
+    def limit(self, name, default=None):
+        """A numeric plan limit such as max_donations_per_month"""
+        return getattr(self.plan, name, default)
+
+
+def entitlement_cache_seconds():
+    """How long a resolved tier may be reused with the configured default cache"""
+    if isinstance(caches['default'], LocMemCache):
+        return LOCAL_ENTITLEMENT_CACHE_SECONDS
+    return ENTITLEMENT_CACHE_SECONDS
+
+
+def resolve_tier(user_id, now=None):
+    """
+    Read the user's subscription (one query) and return (tier, valid_until)
+    valid_until is when the answer may next change on its own: the end of an
+    active subscription or the start of one that has not begun yet
+    """
+    now = now or timezone.now()
+    horizon = now + timedelta(seconds=entitlement_cache_seconds())
+    subscription = (
+        UserSubscription.objects.filter(user_id=user_id)
+        .values('status', 'start_date', 'end_date', 'plan__tier').first()
+    )
+    if subscription is None or subscription['status'] != 'active':
+        return 'free', horizon
+    if now < subscription['start_date']:
+        return 'free', min(subscription['start_date'], horizon)
+    if now <= subscription['end_date']:
+        return subscription['plan__tier'], min(subscription['end_date'], horizon)
+    return 'free', horizon
+
+
+def get_entitlements(user):
+    """
+    The user's entitlements, memoised on the user object for the request and in
+    the shared cache across requests; no queries once warm
+    """
+    entitlements = getattr(user, '_entitlements', None)
+    if entitlements is not None and entitlements.is_current():
+        return entitlements
+
+    key = _cache_key(user.pk)
+    cached = cache.get(key)
+    now = timezone.now()
+    if cached is not None and now < cached[1]:
+        tier, valid_until = cached
+    else:
+        tier, valid_until = resolve_tier(user.pk, now)
+        cache.set(key, (tier, valid_until), timeout=max(1, int((valid_until - now).total_seconds())))
+
+    entitlements = Entitlements(tier, valid_until)
+    user._entitlements = entitlements
+    return entitlements
+
+
+def invalidate_entitlements(user_id):
+    cache.delete(_cache_key(user_id))
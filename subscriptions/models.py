@@ -112,3 +112,24 @@ class BillingHistory(models.Model):
     
     def __str__(self):
         return f"{self.user.full_name} - ₹{self.amount} - {self.transaction_type}"
+
+
+class UsageCounter(models.Model):
+    """
+    Per-user usage for one calendar month (see subscriptions.usage)
+    A new period simply starts a new row, so counters never need resetting
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='usage_counters')
+    period = models.DateField()
+    
+    donations = models.PositiveIntegerField(default=0)
+    requests = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        db_table = 'usage_counters'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'period'], name='unique_usage_period'),
+        ]
+    
+    def __str__(self):
+        return f"Usage for user #{self.user_id} in {self.period:%Y-%m}"
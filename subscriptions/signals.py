@@ -0,0 +1,20 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .entitlements import invalidate_entitlements, invalidate_plans
+from .models import SubscriptionPlan, UserSubscription
+
+
+@receiver([post_save, post_delete], sender=SubscriptionPlan)
+def reload_plans(sender, **kwargs):
+    invalidate_plans()
+    transaction.on_commit(invalidate_plans)
+
+
+@receiver([post_save, post_delete], sender=UserSubscription)
+def evict_entitlements(sender, instance, **kwargs):
+    user_id = instance.user_id
+    invalidate_entitlements(user_id)
+    # Again after commit, in case a concurrent request re-cached the old row meanwhile
+    transaction.on_commit(lambda: invalidate_entitlements(user_id))
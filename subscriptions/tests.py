@@ -1,3 +1,122 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from users.models import CustomUser
+from .entitlements import (
+    ENTITLEMENT_CACHE_SECONDS, LOCAL_ENTITLEMENT_CACHE_SECONDS, entitlement_cache_seconds, get_entitlements,
+    invalidate_plans,
+)
+from .models import SubscriptionPlan, UsageCounter, UserSubscription
+from .usage import QuotaExceeded, consume, current_period, usage_summary
+
+
+class EntitlementCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.free = SubscriptionPlan.objects.create(
+            tier='free', name='Free', description='', price_monthly=0, price_yearly=0,
+        )
+        cls.pro = SubscriptionPlan.objects.create(
+            tier='pro', name='Pro', description='', price_monthly=499, price_yearly=4999,
+            has_advanced_analytics=True,
+        )
+        cls.user = CustomUser.objects.create(username='donor@example.com', role='donor_restaurant')
+
+    def setUp(self):
+        cache.clear()
+        invalidate_plans()
+
+    def fresh_user(self):
+        # A new instance per "request", as the auth middleware would load
+        return CustomUser.objects.get(pk=self.user.pk)
+
+    def subscribe(self, **fields):
+        now = timezone.now()
+        values = {'status': 'active', 'start_date': now - timedelta(days=1), 'end_date': now + timedelta(days=30)}
+        values.update(fields)
+        return UserSubscription.objects.create(user=self.user, plan=self.pro, **values)
+
+    def test_warm_checks_run_no_queries(self):
+        self.subscribe()
+        self.assertTrue(self.fresh_user().has_feature('advanced_analytics'))
+
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertEqual(user.get_subscription_tier(), 'pro')
+            self.assertTrue(user.has_feature('advanced_analytics'))
+            self.assertFalse(user.has_feature('white_label'))
+
+    def test_subscription_changes_evict_the_cached_tier(self):
+        subscription = self.subscribe()
+        self.assertEqual(self.fresh_user().get_subscription_tier(), 'pro')
+
+        subscription.status = 'cancelled'
+        subscription.save()
+
+        self.assertEqual(self.fresh_user().get_subscription_tier(), 'free')
+
+    def test_plan_changes_apply_without_per_user_eviction(self):
+        self.subscribe()
+        self.assertFalse(self.fresh_user().has_feature('white_label'))
+
+        self.pro.has_white_label = True
+        self.pro.save()
+
+        self.assertTrue(self.fresh_user().has_feature('white_label'))
+
+    def test_cached_tier_expires_with_the_subscription(self):
+        self.subscribe(end_date=timezone.now() + timedelta(seconds=30))
+        entitlements = get_entitlements(self.fresh_user())
+        self.assertEqual(entitlements.tier, 'pro')
+        self.assertLessEqual(entitlements.valid_until, timezone.now() + timedelta(seconds=30))
+
+        UserSubscription.objects.filter(user=self.user).update(end_date=timezone.now() - timedelta(seconds=1))
+        # Simulate the cached entry running past the end of the subscription
+        cache.set(f'entitlements:{self.user.pk}', ('pro', timezone.now() - timedelta(seconds=1)))
+        self.assertEqual(self.fresh_user().get_subscription_tier(), 'free')
+
+
+    def test_per_process_cache_shortens_the_cached_tier(self):
+        self.subscribe()
+        now = timezone.now()
+        entitlements = get_entitlements(self.fresh_user())
+        self.assertLessEqual(entitlements.valid_until, now + timedelta(seconds=LOCAL_ENTITLEMENT_CACHE_SECONDS + 1))
+
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            self.assertEqual(entitlement_cache_seconds(), ENTITLEMENT_CACHE_SECONDS)
+
+
+class UsageQuotaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        SubscriptionPlan.objects.create(
+            tier='free', name='Free', description='', price_monthly=0, price_yearly=0,
+            max_donations_per_month=2, max_requests_per_month=-1,
+        )
+        cls.user = CustomUser.objects.create(username='donor@example.com', role='donor_individual')
+
+    def setUp(self):
+        cache.clear()
+        invalidate_plans()
+
+    def test_quota_is_enforced_per_period(self):
+        last_month = (current_period() - timedelta(days=1)).replace(day=1)
+        UsageCounter.objects.create(user=self.user, period=last_month, donations=2)
+
+        consume(self.user, 'donations')
+        with self.assertNumQueries(1):
+            consume(self.user, 'donations')
+        with self.assertRaises(QuotaExceeded):
+            consume(self.user, 'donations')
+
+        counter = UsageCounter.objects.get(user=self.user, period=current_period())
+        self.assertEqual(counter.donations, 2)
+
+    def test_negative_limit_means_unlimited(self):
+        for _ in range(5):
+            consume(self.user, 'requests')
+        requests = {item['metric']: item for item in usage_summary(self.user)['metrics']}['requests']
+        self.assertEqual((requests['used'], requests['limit'], requests['remaining']), (5, None, None))
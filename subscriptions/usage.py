@@ -0,0 +1,75 @@
+from django.db.models import F
+from django.utils import timezone
+
+from .entitlements import get_entitlements
+from .models import UsageCounter
+
+# Metered actions: counter field -> SubscriptionPlan limit field
+METRICS = {
+    'donations': 'max_donations_per_month',
+    'requests': 'max_requests_per_month',
+}
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, metric, limit):
+        self.metric = metric
+        self.limit = limit
+        super().__init__(f'Your plan allows {limit} {metric} per month. Upgrade to add more.')
+
+
+def current_period(now=None):
+    """First day of the current month in the project's time zone"""
+    return timezone.localdate(now).replace(day=1)
+
+
+def next_period(period):
+    if period.month == 12:
+        return period.replace(year=period.year + 1, month=1)
+    return period.replace(month=period.month + 1)
+
+
+def get_limit(user, metric):
+    """The user's monthly limit for metric, or None when unlimited"""
+    limit = get_entitlements(user).limit(METRICS[metric])
+    return limit if limit is not None and limit >= 0 else None
+
+
+def consume(user, metric, amount=1):
+    """
+    Count amount uses of metric against this month's quota with one conditional UPDATE
+    Raises QuotaExceeded (and counts nothing) if it would go over the limit
+    Call inside the transaction that performs the action so a rollback refunds it
+    """
+    limit = get_limit(user, metric)
+    period = current_period()
+    counters = UsageCounter.objects.filter(user_id=user.pk, period=period)
+    if limit is not None:
+        counters = counters.filter(**{f'{metric}__lte': limit - amount})
+
+    if counters.update(**{metric: F(metric) + amount}):
+        return
+    if limit is not None and amount > limit:
+        raise QuotaExceeded(metric, limit)
+    # First use this period (or over quota): make sure the row exists, then retry once
+    UsageCounter.objects.bulk_create([UsageCounter(user_id=user.pk, period=period)], ignore_conflicts=True)
+    if counters.update(**{metric: F(metric) + amount}):
+        return
+    raise QuotaExceeded(metric, limit)
+
+
+def usage_summary(user):
+    """This month's usage, limit and remaining allowance per metric"""
+    period = current_period()
+    counter = UsageCounter.objects.filter(user_id=user.pk, period=period).first()
+    summary = []
+    for metric in METRICS:
+        used = getattr(counter, metric, 0)
+        limit = get_limit(user, metric)
+        summary.append({
+            'metric': metric,
+            'used': used,
+            'limit': limit,
+            'remaining': None if limit is None else max(limit - used, 0),
+        })
+    return {'period': period, 'resets_on': next_period(period), 'metrics': summary}
@@ -1,3 +1,14 @@
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
 from django.shortcuts import render
 
-# Create your views here.
+from .usage import usage_summary
+
+
+@login_required
+def usage_view(request):
+    """This month's metered usage against the user's plan limits"""
+    summary = usage_summary(request.user)
+    if request.GET.get('format') == 'json':
+        return JsonResponse(summary)
+    return render(request, 'usage.html', {'usage': summary, 'tier': request.user.get_subscription_tier()})
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser
+from .models import APIKey, CustomUser, GeocodeCache, IdempotencyKey
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
@@ -20,3 +20,23 @@ class CustomUserAdmin(UserAdmin):
             'fields': ('role', 'full_name', 'phone_number')
         }),
     )
+
+@admin.register(GeocodeCache)
+class GeocodeCacheAdmin(admin.ModelAdmin):
+    list_display = ['normalized_address', 'latitude', 'longitude', 'provider', 'created_at']
+    list_filter = ['provider']
+    search_fields = ['normalized_address', 'formatted_address']
+    readonly_fields = ['address_key', 'created_at']
+
+@admin.register(APIKey)
+class APIKeyAdmin(admin.ModelAdmin):
+    list_display = ['name', 'prefix', 'user', 'created_at', 'last_used_at', 'revoked_at']
+    list_filter = ['revoked_at']
+    search_fields = ['name', 'prefix', 'user__email']
+    readonly_fields = ['prefix', 'key_hash', 'tokens', 'refilled_at', 'created_at', 'last_used_at']
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ['key', 'user', 'status_code', 'created_at', 'expires_at']
+    search_fields = ['key', 'user__email']
+    readonly_fields = ['request_hash', 'status_code', 'content_type', 'content', 'created_at', 'expires_at']
@@ -0,0 +1,162 @@
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Least
+from django.db.models.lookups import GreaterThanOrEqual
+from django.utils import timezone
+
+from subscriptions.entitlements import Entitlements
+from .models import APIKey, CustomUser
+
+KEY_PREFIX = 'kp_'
+
+# api_rate_limit is requests per this many seconds; it is also the burst size
+RATE_LIMIT_WINDOW_SECONDS = 60
+
+DEFAULT_RATE_LIMIT = 100
+
+# How long a verified key (and its owner's plan) is trusted without looking at the
+# database again. Revocation still applies at once: the rate-limit UPDATE skips revoked keys
+VERIFY_CACHE_SECONDS = 60
+VERIFY_CACHE_SIZE = 10000
+
+# How long an unknown key is refused without a lookup, and how many are remembered
+INVALID_CACHE_SECONDS = 5
+INVALID_CACHE_SIZE = 10000
+
+# Keys remembered as over their rate limit (shed without a database round trip)
+THROTTLE_CACHE_SIZE = 10000
+
+_lock = threading.Lock()
+_verified = OrderedDict()
+_invalid = OrderedDict()
+_throttled_until = OrderedDict()
+
+
+def _remember(cache, key_hash, value, size):
+    """Store value in an LRU cache, dropping the least recently stored entries past size; call with _lock held"""
+    cache[key_hash] = value
+    cache.move_to_end(key_hash)
+    while len(cache) > size:
+        cache.popitem(last=False)
+
+
+def hash_key(raw_key):
+    # Keys are 256-bit random tokens, so a fast hash is enough (no stretching needed)
+    return hashlib.sha256(raw_key.encode()).hexdigest()
+
+
+def create_key(user, name):
+    """Create a key for user; returns (APIKey, raw_key). The raw key is not stored"""
+    prefix = secrets.token_hex(4)
+    raw_key = f'{KEY_PREFIX}{prefix}_{secrets.token_urlsafe(32)}'
+    api_key = APIKey.objects.create(user=user, name=name, prefix=prefix, key_hash=hash_key(raw_key))
+    return api_key, raw_key
+
+
+def revoke_key(api_key):
+    APIKey.objects.filter(id=api_key.id, revoked_at__isnull=True).update(revoked_at=timezone.now())
+    with _lock:
+        _verified.pop(api_key.key_hash, None)
+
+
+def _snapshot(api_key):
+    """Plain values for the cache, so no model instance is shared between requests"""
+    user = api_key.user
+    entitlements = user.entitlements
+    return {
+        'deadline': time.monotonic() + VERIFY_CACHE_SECONDS,
+        'id': api_key.id,
+        'key_hash': api_key.key_hash,
+        'db': user._state.db,
+        'user': {field.attname: getattr(user, field.attname) for field in CustomUser._meta.concrete_fields},
+        'tier': entitlements.tier,
+        # Plan changes reach a cached key within VERIFY_CACHE_SECONDS
+        'valid_until': min(entitlements.valid_until, timezone.now() + timedelta(seconds=VERIFY_CACHE_SECONDS)),
+    }
+
+
+def key_owner(verified):
+    """A fresh instance of the key's owner for this request, with the cached entitlements"""
+    fields = verified['user']
+    user = CustomUser.from_db(verified['db'], list(fields), list(fields.values()))
+    user._entitlements = Entitlements(verified['tier'], verified['valid_until'])
+    return user
+
+
+def verify_key(raw_key):
+    """The cached state of the active key for raw_key (see _snapshot), or None"""
+    if not raw_key or not raw_key.startswith(KEY_PREFIX):
+        return None
+    key_hash = hash_key(raw_key)
+    now = time.monotonic()
+    with _lock:
+        verified = _verified.get(key_hash)
+        refused_until = _invalid.get(key_hash, 0)
+    if verified is not None and verified['deadline'] > now:
+        return verified
+    if refused_until > now:
+        return None
+
+    api_key = (
+        APIKey.objects.select_related('user')
+        .filter(key_hash=key_hash, revoked_at__isnull=True, user__is_active=True).first()
+    )
+    if api_key is None:
+        with _lock:
+            _remember(_invalid, key_hash, now + INVALID_CACHE_SECONDS, INVALID_CACHE_SIZE)
+        return None
+    verified = _snapshot(api_key)
+    with _lock:
+        _remember(_verified, key_hash, verified, VERIFY_CACHE_SIZE)
+    return verified
+
+
+def take_token(verified, rate_limit):
+    """
+    Spend one token from the bucket of the key verify_key returned (capacity rate_limit, refilled over
+    RATE_LIMIT_WINDOW_SECONDS) in a single conditional UPDATE
+    Returns 0 if the request may proceed, otherwise seconds until a token is due
+    (None if the key has been revoked)
+    """
+    now_monotonic = time.monotonic()
+    with _lock:
+        blocked_until = _throttled_until.get(verified['key_hash'], 0)
+    if blocked_until > now_monotonic:
+        # Shed without touching the database
+        return blocked_until - now_monotonic
+
+    if rate_limit <= 0:
+        # A plan with no API budget: refuse without touching the database
+        return float(RATE_LIMIT_WINDOW_SECONDS)
+    capacity = float(rate_limit)
+    per_second = capacity / RATE_LIMIT_WINDOW_SECONDS
+    now = time.time()
+    available = Least(
+        Value(capacity),
+        Coalesce(F('tokens'), Value(capacity))
+        + (Value(now) - Coalesce(F('refilled_at'), Value(now))) * Value(per_second),
+    )
+    spent = (
+        APIKey.objects.filter(id=verified['id'], revoked_at__isnull=True)
+        .filter(GreaterThanOrEqual(available, Value(1.0)))
+        .update(tokens=available - Value(1.0), refilled_at=Value(now), last_used_at=timezone.now())
+    )
+    if spent:
+        return 0
+
+    state = APIKey.objects.filter(id=verified['id']).values('tokens', 'refilled_at', 'revoked_at').first()
+    if state is None or state['revoked_at'] is not None:
+        with _lock:
+            _verified.pop(verified['key_hash'], None)
+        return None
+    tokens = min(capacity, (state['tokens'] or 0) + (now - (state['refilled_at'] or now)) * per_second)
+    wait = max((1 - tokens) / per_second, 0.001)
+    with _lock:
+        _remember(_throttled_until, verified['key_hash'], now_monotonic + wait, THROTTLE_CACHE_SIZE)
+    return wait
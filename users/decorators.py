@@ -1,8 +1,12 @@
+import math
 from functools import wraps
 from django.shortcuts import redirect
 from django.contrib import messages
 from django.http import JsonResponse
 
+from .api_keys import DEFAULT_RATE_LIMIT, RATE_LIMIT_WINDOW_SECONDS, key_owner, take_token, verify_key
+from . import idempotency
+
 def role_required(*allowed_roles):
     """Decorator to check if user has required role"""
     def decorator(view_func):
@@ -28,10 +32,7 @@ def subscription_required(tier='pro'):
             if not request.user.is_authenticated:
                 return redirect('login')
             
-            user_tier = request.user.get_subscription_tier()
-            tier_hierarchy = {'free': 0, 'pro': 1, 'enterprise': 2}
-            
-            if tier_hierarchy.get(user_tier, 0) < tier_hierarchy.get(tier, 0):
+            if not request.user.entitlements.at_least(tier):
                 messages.error(request, f'This feature requires {tier.title()} subscription.')
                 return redirect('subscription_plans')
             
@@ -58,7 +59,11 @@ def feature_required(feature_name):
 
 
 def api_key_required(view_func):
-    """Decorator for API authentication"""
+    """
+    Decorator for API authentication
+    Sets request.user to the key's owner and applies the owner's api_rate_limit
+    as a per-key token bucket
+    """
     @wraps(view_func)
     def wrapper(request, *args, **kwargs):
         api_key = request.headers.get('X-API-Key')
@@ -66,7 +71,61 @@ def api_key_required(view_func):
         if not api_key:
             return JsonResponse({'error': 'API key required'}, status=401)
         
-        # TODO: Validate API key from database
+        key = verify_key(api_key)
+        if key is None:
+            return JsonResponse({'error': 'Invalid API key'}, status=401)
+        
+        owner = key_owner(key)
+        if not owner.has_feature('api_access'):
+            return JsonResponse({'error': 'Your plan does not include API access'}, status=403)
+        
+        # A limit of 0 is a real limit; only a plan without one falls back to the default
+        rate_limit = owner.entitlements.limit('api_rate_limit')
+        if rate_limit is None:
+            rate_limit = DEFAULT_RATE_LIMIT
+        wait = take_token(key, rate_limit)
+        if wait is None:
+            return JsonResponse({'error': 'Invalid API key'}, status=401)
+        if wait:
+            response = JsonResponse({'error': 'Rate limit exceeded'}, status=429)
+            response['Retry-After'] = str(math.ceil(wait))
+            return response
+        
+        request.user = owner
+        response = view_func(request, *args, **kwargs)
+        response['X-RateLimit-Limit'] = f'{rate_limit};w={RATE_LIMIT_WINDOW_SECONDS}'
+        return response
+    return wrapper
+
+
+def idempotent(view_func):
+    """
+    Decorator for POST endpoints that clients may retry
+    A request carrying an Idempotency-Key header runs the view once per (user, key);
+    retries get the stored response back without running the view again
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(idempotency.HEADER)
+        if not key or not request.user.is_authenticated:
+            return view_func(request, *args, **kwargs)
+        
+        if len(key) > idempotency.MAX_KEY_LENGTH:
+            return JsonResponse({'success': False, 'message': f'{idempotency.HEADER} is too long'}, status=400)
+        
+        digest = idempotency.request_hash(request)
+        try:
+            stored = idempotency.begin(request.user, key, digest)
+        except idempotency.IdempotencyConflict as exc:
+            return JsonResponse({'success': False, 'message': str(exc)}, status=exc.status)
+        if stored is not None:
+            return idempotency.replay(stored)
         
-        return view_func(request, *args, **kwargs)
+        try:
+            response = view_func(request, *args, **kwargs)
+        except Exception:
+            idempotency.release(request.user, key)
+            raise
+        idempotency.finish(request.user, key, digest, response)
+        return response
     return wrapper
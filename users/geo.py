@@ -0,0 +1,72 @@
+from math import radians, cos, degrees
+
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import ASin, Cast, Cos, Least, Power, Radians, Sin, Sqrt
+
+from .utils import EARTH_RADIUS_KM
+
+
+def bounding_box(lat, lon, radius_km):
+    """
+    Lat/lon box that fully contains the circle of radius_km around (lat, lon)
+    Returns (min_lat, max_lat, min_lon, max_lon); the longitude pair is None
+    when the box reaches a pole or crosses the antimeridian
+    """
+    lat, lon, radius_km = float(lat), float(lon), float(radius_km)
+    # Same sphere as the haversine distances, so the box never cuts off a point they keep
+    dlat = degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+
+    # Near the poles every longitude is within reach
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        return min_lat, max_lat, None, None
+
+    # Widest longitude span is at the latitude edge closest to the pole
+    widest_lat = max(abs(min_lat), abs(max_lat))
+    dlon = degrees(radius_km / (EARTH_RADIUS_KM * cos(radians(widest_lat))))
+    min_lon, max_lon = lon - dlon, lon + dlon
+
+    if min_lon < -180.0 or max_lon > 180.0:
+        return min_lat, max_lat, None, None
+
+    return min_lat, max_lat, min_lon, max_lon
+
+
+def distance_expression(lat, lon, lat_field='latitude', lon_field='longitude'):
+    """
+    Haversine distance in kilometers from (lat, lon) to each row, as a DB expression
+    """
+    lat_rad, lon_rad = radians(float(lat)), radians(float(lon))
+    row_lat = Radians(Cast(F(lat_field), FloatField()))
+    row_lon = Radians(Cast(F(lon_field), FloatField()))
+
+    a = (
+        Power(Sin((row_lat - Value(lat_rad)) / 2), 2)
+        + Value(cos(lat_rad)) * Cos(row_lat) * Power(Sin((row_lon - Value(lon_rad)) / 2), 2)
+    )
+    return Value(2.0 * EARTH_RADIUS_KM) * ASin(Sqrt(Least(a, Value(1.0))))
+
+
+def within_bounding_box(queryset, lat, lon, radius_km, lat_field='latitude', lon_field='longitude'):
+    """
+    Restrict queryset to rows inside the bounding box so the (lat, lon) index is used
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+    queryset = queryset.filter(**{f'{lat_field}__range': (min_lat, max_lat)})
+    if min_lon is not None:
+        queryset = queryset.filter(**{f'{lon_field}__range': (min_lon, max_lon)})
+    return queryset
+
+
+def nearby_queryset(queryset, lat, lon, radius_km=10, lat_field='latitude', lon_field='longitude'):
+    """
+    Rows within radius_km of (lat, lon), annotated with distance_km and ordered nearest first
+    Slice the result for LIMIT/OFFSET; rows outside the bounding box are never loaded
+    """
+    queryset = within_bounding_box(queryset, lat, lon, radius_km, lat_field, lon_field)
+    return (
+        queryset
+        .annotate(distance_km=distance_expression(lat, lon, lat_field, lon_field))
+        .filter(distance_km__lte=float(radius_km))
+        .order_by('distance_km', 'pk')
+    )
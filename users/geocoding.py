@@ -0,0 +1,191 @@
+import hashlib
+import re
+import threading
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Pune city centre, the coordinates the original placeholder geocoder returned
+DEFAULT_CENTER = (Decimal('18.5204'), Decimal('73.8567'))
+
+COORDINATE_PLACES = Decimal('0.000001')
+
+
+def normalize_address(address):
+    """
+    Canonical form of an address so trivially different spellings share a cache entry
+    Lowercases, strips accents and punctuation, and collapses whitespace
+    """
+    text = unicodedata.normalize('NFKD', address or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return ' '.join(text.split())
+
+
+def address_key(address, provider_name):
+    """Fixed-length cache key for an address as resolved by one provider"""
+    return hashlib.sha256(f'{provider_name}\0{normalize_address(address)}'.encode()).hexdigest()
+
+
+class GeocodingProvider(ABC):
+    """
+    Interface for geocoding backends
+    Providers return dicts with latitude, longitude and formatted_address,
+    or None when an address cannot be resolved
+    """
+    name = 'base'
+
+    # Whether results are real enough to keep in the geocode caches
+    cacheable = True
+
+    @abstractmethod
+    def geocode(self, address):
+        """Resolve one address"""
+
+    def geocode_many(self, addresses):
+        """Resolve many addresses; override when the backend has a batch endpoint"""
+        return [self.geocode(address) for address in addresses]
+
+
+class OfflineGeocodingProvider(GeocodingProvider):
+    """
+    Deterministic stand-in for development and demos; never configure it in production
+    Places each address at a stable point within ~10 km of the default centre
+    The points are made up, so they are never written to the caches
+    """
+    name = 'offline'
+    cacheable = False
+
+    def geocode(self, address):
+        digest = hashlib.sha256(normalize_address(address).encode()).digest()
+        lat_offset = Decimal(int.from_bytes(digest[:4], 'big') % 180000 - 90000) / Decimal(1000000)
+        lon_offset = Decimal(int.from_bytes(digest[4:8], 'big') % 180000 - 90000) / Decimal(1000000)
+        return {
+            'latitude': (DEFAULT_CENTER[0] + lat_offset).quantize(COORDINATE_PLACES),
+            'longitude': (DEFAULT_CENTER[1] + lon_offset).quantize(COORDINATE_PLACES),
+            'formatted_address': address,
+        }
+
+
+class LRUCache:
+    """Small thread-safe LRU used in front of the geocode cache table"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_memory_cache = LRUCache(getattr(settings, 'GEOCODE_CACHE_SIZE', 1024))
+_provider = None
+_provider_loaded = False
+
+
+def get_provider():
+    """
+    The configured provider, or None when GEOCODING_PROVIDER is empty (the default)
+    Without a provider nothing is geocoded and coordinates stay empty, rather than
+    storing made-up points that radius search would treat as real
+    """
+    global _provider, _provider_loaded
+    if _provider is None and not _provider_loaded:
+        provider_path = getattr(settings, 'GEOCODING_PROVIDER', '')
+        _provider = import_string(provider_path)() if provider_path else None
+        _provider_loaded = True
+    return _provider
+
+
+def _as_result(entry):
+    return {
+        'latitude': entry.latitude,
+        'longitude': entry.longitude,
+        'formatted_address': entry.formatted_address,
+    }
+
+
+def geocode_addresses(addresses):
+    """
+    Geocode many addresses at once
+    Duplicates are collapsed, then each unique address is looked up in the
+    in-process LRU, the cache table (one query) and finally the provider (one batch)
+    Every result is None when no provider is configured
+    Cache entries are keyed by provider, so switching providers never reuses
+    another provider's answers
+    Returns a list of result dicts (or None) aligned with addresses
+    """
+    from .models import GeocodeCache
+
+    provider = get_provider()
+    if provider is None:
+        return [None] * len(addresses)
+    keys = [address_key(address, provider.name) for address in addresses]
+    results = {}
+    missing = {}
+    for key, address in zip(keys, addresses):
+        if key in results or key in missing:
+            continue
+        cached = _memory_cache.get(key) if provider.cacheable else None
+        if cached is not None:
+            results[key] = cached
+        else:
+            missing[key] = address
+
+    if missing and provider.cacheable:
+        for entry in GeocodeCache.objects.filter(address_key__in=list(missing)):
+            results[entry.address_key] = _as_result(entry)
+            _memory_cache.set(entry.address_key, results[entry.address_key])
+            del missing[entry.address_key]
+
+    if missing:
+        resolved = provider.geocode_many(list(missing.values()))
+        new_entries = []
+        for (key, address), result in zip(missing.items(), resolved):
+            if result is None:
+                continue
+            result = {
+                'latitude': Decimal(str(result['latitude'])).quantize(COORDINATE_PLACES),
+                'longitude': Decimal(str(result['longitude'])).quantize(COORDINATE_PLACES),
+                'formatted_address': result.get('formatted_address') or address,
+            }
+            results[key] = result
+            if not provider.cacheable:
+                continue
+            _memory_cache.set(key, result)
+            new_entries.append(GeocodeCache(
+                address_key=key,
+                normalized_address=normalize_address(address),
+                provider=provider.name,
+                **result,
+            ))
+        # Concurrent workers may resolve the same address; the unique key keeps one row
+        if new_entries:
+            GeocodeCache.objects.bulk_create(new_entries, ignore_conflicts=True)
+
+    return [results.get(key) for key in keys]
+
+
+def geocode(address):
+    """Geocode a single address through the caches"""
+    return geocode_addresses([address])[0]
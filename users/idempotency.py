@@ -0,0 +1,165 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+
+# How long a stored response is replayed; a key reused after this runs the view again
+IDEMPOTENCY_TTL_SECONDS = 24 * 60 * 60
+
+# How long a reservation holds the key while the view runs; a crashed request frees it after this
+IDEMPOTENCY_LEASE_SECONDS = 60
+
+MAX_KEY_LENGTH = 255
+
+# Completed responses kept in process so hot retries skip the database
+FRONT_CACHE_SIZE = 10000
+
+_lock = threading.Lock()
+_responses = OrderedDict()
+
+
+class IdempotencyConflict(Exception):
+    """The key cannot be used for this request; carries the HTTP status to answer with"""
+
+    def __init__(self, message, status):
+        self.status = status
+        super().__init__(message)
+
+
+def request_hash(request):
+    """Fingerprint of what the key was first used for, so a reused key with a different request is refused"""
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.path.encode(), request.body):
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _remember(user_id, key, stored):
+    with _lock:
+        _responses[(user_id, key)] = stored
+        _responses.move_to_end((user_id, key))
+        while len(_responses) > FRONT_CACHE_SIZE:
+            _responses.popitem(last=False)
+
+
+def _recall(user_id, key):
+    with _lock:
+        stored = _responses.get((user_id, key))
+        if stored is not None and stored['deadline'] <= time.monotonic():
+            del _responses[(user_id, key)]
+            return None
+        return stored
+
+
+def _stored(row):
+    remaining = (row['expires_at'] - timezone.now()).total_seconds()
+    return {
+        'deadline': time.monotonic() + remaining,
+        'request_hash': row['request_hash'],
+        'status_code': row['status_code'],
+        'content_type': row['content_type'],
+        'content': bytes(row['content']),
+    }
+
+
+def _check(stored, digest):
+    if stored['request_hash'] != digest:
+        raise IdempotencyConflict(f'This {HEADER} was already used for a different request', 422)
+    return stored
+
+
+def begin(user, key, digest):
+    """
+    Claim key for this request
+    Returns None if the view should run (the key is now reserved), or the stored
+    response to replay; raises IdempotencyConflict if the key is busy or was used
+    for a different request
+    """
+    stored = _recall(user.pk, key)
+    if stored is not None:
+        return _check(stored, digest)
+
+    for _ in range(2):
+        now = timezone.now()
+        lease = now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)
+        try:
+            # A plain INSERT reserves the key; concurrent retries hit the unique constraint
+            with transaction.atomic():
+                IdempotencyKey.objects.create(user=user, key=key, request_hash=digest, expires_at=lease)
+            return None
+        except IntegrityError:
+            pass
+
+        row = IdempotencyKey.objects.filter(user=user, key=key).values(
+            'id', 'request_hash', 'status_code', 'content_type', 'content', 'expires_at',
+        ).first()
+        if row is None:
+            continue
+        if row['expires_at'] <= now:
+            if row['status_code'] is None:
+                # The request holding the lease died without finishing; take the key over
+                # unless another retry got there first
+                if IdempotencyKey.objects.filter(
+                    id=row['id'], status_code__isnull=True, expires_at=row['expires_at'],
+                ).update(request_hash=digest, expires_at=lease):
+                    return None
+            else:
+                IdempotencyKey.objects.filter(id=row['id'], expires_at__lte=now).delete()
+            continue
+        if row['request_hash'] != digest:
+            raise IdempotencyConflict(f'This {HEADER} was already used for a different request', 422)
+        if row['status_code'] is None:
+            raise IdempotencyConflict(f'A request with this {HEADER} is still being processed', 409)
+        stored = _stored(row)
+        _remember(user.pk, key, stored)
+        return stored
+    raise IdempotencyConflict(f'A request with this {HEADER} is still being processed', 409)
+
+
+def finish(user, key, digest, response):
+    """
+    Store the view's response for replay for the full TTL; server errors release
+    the key so the client can retry
+    """
+    if response.streaming or response.status_code >= 500:
+        release(user, key)
+        return
+    content_type = response.get('Content-Type', '')
+    updated = IdempotencyKey.objects.filter(user=user, key=key, status_code__isnull=True).update(
+        status_code=response.status_code, content_type=content_type, content=response.content,
+        expires_at=timezone.now() + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+    )
+    if updated:
+        _remember(user.pk, key, {
+            'deadline': time.monotonic() + IDEMPOTENCY_TTL_SECONDS,
+            'request_hash': digest,
+            'status_code': response.status_code,
+            'content_type': content_type,
+            'content': response.content,
+        })
+
+
+def release(user, key):
+    IdempotencyKey.objects.filter(user=user, key=key, status_code__isnull=True).delete()
+
+
+def replay(stored):
+    response = HttpResponse(stored['content'], status=stored['status_code'], content_type=stored['content_type'])
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def purge_expired():
+    """Delete stored responses past their TTL; returns how many were removed"""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
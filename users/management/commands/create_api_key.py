@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.api_keys import create_key
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Create an API key for a user; the key is printed once and only its hash is stored'
+
+    def add_arguments(self, parser):
+        parser.add_argument('email')
+        parser.add_argument('--name', default='default', help='Label to tell keys apart')
+
+    def handle(self, *args, **options):
+        user = CustomUser.objects.filter(email=options['email']).first()
+        if user is None:
+            raise CommandError(f"No user with email {options['email']}")
+        api_key, raw_key = create_key(user, options['name'])
+        self.stdout.write(self.style.SUCCESS(f'Created key {api_key.prefix} for {user.email}'))
+        self.stdout.write(raw_key)
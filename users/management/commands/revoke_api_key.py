@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.api_keys import revoke_key
+from users.models import APIKey
+
+
+class Command(BaseCommand):
+    help = 'Revoke an API key by its prefix'
+
+    def add_arguments(self, parser):
+        parser.add_argument('prefix')
+
+    def handle(self, *args, **options):
+        api_key = APIKey.objects.filter(prefix=options['prefix']).first()
+        if api_key is None:
+            raise CommandError(f"No API key with prefix {options['prefix']}")
+        revoke_key(api_key)
+        self.stdout.write(self.style.SUCCESS(f'Revoked key {api_key.prefix}'))
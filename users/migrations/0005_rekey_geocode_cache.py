@@ -0,0 +1,20 @@
+# Generated by Django 5.0.1 on 2026-10-18 08:14
+
+from django.db import migrations
+
+
+def clear_geocode_cache(apps, schema_editor):
+    # Keys now include the provider, so existing rows can no longer be hit, and
+    # rows from the offline provider hold made-up coordinates
+    apps.get_model('users', 'GeocodeCache').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_geocode_cache, migrations.RunPython.noop),
+    ]
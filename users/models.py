@@ -38,20 +38,82 @@ class CustomUser(AbstractUser):
     def __str__(self):
         return f"{self.full_name} ({self.get_role_display()})"
     
+    @property
+    def entitlements(self):
+        """Resolved plan entitlements, cached (see subscriptions.entitlements)"""
+        from subscriptions.entitlements import get_entitlements
+        return get_entitlements(self)
+    
     def get_subscription_tier(self):
-        try:
-            if hasattr(self, 'active_subscription') and self.active_subscription:
-                if self.active_subscription.is_active():
-                    return self.active_subscription.plan.tier
-        except:
-            pass
-        return 'free'
+        return self.entitlements.tier
     
     def has_feature(self, feature_name):
-        tier = self.get_subscription_tier()
-        from subscriptions.models import SubscriptionPlan
-        try:
-            plan = SubscriptionPlan.objects.get(tier=tier)
-            return getattr(plan, f'has_{feature_name}', False)
-        except:
-            return False
+        return self.entitlements.has_feature(feature_name)
+
+
+class GeocodeCache(models.Model):
+    address_key = models.CharField(max_length=64, unique=True)
+    normalized_address = models.TextField()
+    
+    latitude = models.DecimalField(max_digits=9, decimal_places=6)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6)
+    formatted_address = models.TextField(blank=True)
+    provider = models.CharField(max_length=50)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'geocode_cache'
+    
+    def __str__(self):
+        return f"{self.normalized_address} ({self.latitude}, {self.longitude})"
+
+
+class APIKey(models.Model):
+    """
+    Partner API key; only a SHA-256 hash of the secret is stored (see users.api_keys)
+    tokens/refilled_at hold the key's rate-limit bucket so every worker process shares it
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='api_keys')
+    name = models.CharField(max_length=100)
+    prefix = models.CharField(max_length=12, unique=True)
+    key_hash = models.CharField(max_length=64, unique=True)
+    
+    tokens = models.FloatField(null=True, blank=True)
+    refilled_at = models.FloatField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(null=True, blank=True)
+    revoked_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'api_keys'
+    
+    def __str__(self):
+        return f"{self.name} ({self.prefix}…)"
+
+
+class IdempotencyKey(models.Model):
+    """
+    The stored response for a client's Idempotency-Key (see users.idempotency)
+    status_code is null while the first request is still running
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    content = models.BinaryField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    class Meta:
+        db_table = 'idempotency_keys'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id}:{self.key}"
@@ -1,3 +1,360 @@
-from django.test import TestCase
+import math
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.utils import timezone
+
+from subscriptions.entitlements import invalidate_plans
+from subscriptions.models import SubscriptionPlan, UserSubscription
+from . import api_keys, geocoding, idempotency
+from .api_keys import create_key, revoke_key
+from .decorators import api_key_required, idempotent
+from .models import APIKey, CustomUser, GeocodeCache, IdempotencyKey
+from .geo import bounding_box
+from .utils import find_nearby_items, haversine_distance, haversine_distances, haversine_matrix
+
+
+seen_users = []
+
+
+@api_key_required
+def whoami(request):
+    seen_users.append(request.user)
+    return JsonResponse({'user': request.user.pk})
+
+
+calls = []
+
+
+@idempotent
+def charge(request):
+    calls.append(request.body)
+    if request.GET.get('fail'):
+        return HttpResponse(status=503)
+    return JsonResponse({'charge': len(calls)}, status=201)
+
+
+class APIKeyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        plan = SubscriptionPlan.objects.create(
+            tier='enterprise', name='Enterprise', description='', price_monthly=999, price_yearly=9999,
+            api_rate_limit=3, has_api_access=True,
+        )
+        cls.user = CustomUser.objects.create(username='partner@example.com', role='donor_restaurant')
+        now = timezone.now()
+        UserSubscription.objects.create(
+            user=cls.user, plan=plan, status='active', start_date=now - timedelta(days=1),
+            end_date=now + timedelta(days=30),
+        )
+
+    def setUp(self):
+        cache.clear()
+        invalidate_plans()
+        seen_users.clear()
+        self.api_key, self.raw_key = create_key(self.user, 'partner')
+
+    def call(self, raw_key=None):
+        request = RequestFactory().get('/api/whoami/', HTTP_X_API_KEY=raw_key or self.raw_key)
+        return whoami(request)
+
+    def test_only_the_hash_is_stored(self):
+        self.assertFalse(APIKey.objects.filter(key_hash=self.raw_key).exists())
+        self.assertNotIn(self.raw_key, APIKey.objects.values_list('prefix', flat=True))
+        self.assertEqual(self.call('kp_deadbeef_wrong').status_code, 401)
+
+    def test_warm_request_costs_one_query(self):
+        self.assertEqual(self.call().status_code, 200)
+        with self.assertNumQueries(1):
+            response = self.call()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-RateLimit-Limit'], '3;w=60')
+
+    def test_bucket_empties_and_sheds_without_queries(self):
+        for _ in range(3):
+            self.assertEqual(self.call().status_code, 200)
+
+        response = self.call()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '20')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.call().status_code, 429)
+
+    def test_each_request_gets_its_own_user(self):
+        self.call()
+        seen_users[0].full_name = 'Changed by a view'
+        self.call()
+        first, second = seen_users
+        self.assertIsNot(first, second)
+        self.assertEqual((second.pk, second.full_name), (self.user.pk, self.user.full_name))
+        self.assertFalse(second._state.adding)
+        self.assertEqual(second.entitlements.tier, 'enterprise')
+
+    def test_unknown_keys_are_refused_from_memory(self):
+        self.assertEqual(self.call('kp_deadbeef_unknown').status_code, 401)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.call('kp_deadbeef_unknown').status_code, 401)
+
+    def test_zero_rate_limit_is_not_replaced_by_the_default(self):
+        SubscriptionPlan.objects.filter(tier='enterprise').update(api_rate_limit=0)
+        invalidate_plans()
+        response = self.call()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertIsNone(APIKey.objects.get(id=self.api_key.id).refilled_at)
+
+    def test_key_caches_stay_bounded(self):
+        other, raw = create_key(self.user, 'second')
+        with mock.patch.multiple(api_keys, VERIFY_CACHE_SIZE=1, THROTTLE_CACHE_SIZE=1):
+            for key in (self.raw_key, raw):
+                for _ in range(4):
+                    self.call(key)
+            self.assertEqual(list(api_keys._verified), [other.key_hash])
+            self.assertEqual(list(api_keys._throttled_until), [other.key_hash])
+
+        # The evicted key is looked up again, and its bucket is still empty
+        self.assertEqual(self.call().status_code, 429)
+
+    def test_revoked_key_is_refused_even_when_cached(self):
+        self.assertEqual(self.call().status_code, 200)
+        # Revoked by another process: this one still has the key cached
+        APIKey.objects.filter(id=self.api_key.id).update(revoked_at=timezone.now())
+        self.assertEqual(self.call().status_code, 401)
+
+        other, raw = create_key(self.user, 'second')
+        self.assertEqual(self.call(raw).status_code, 200)
+        revoke_key(other)
+        self.assertEqual(self.call(raw).status_code, 401)
+
+
+class IdempotencyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='receiver@example.com', role='receiver_ngo')
+
+    def setUp(self):
+        calls.clear()
+        idempotency._responses.clear()
+
+    def call(self, key='pay-1', body='{"amount": 50}', path='/wallet/pay/'):
+        request = RequestFactory().post(path, body, content_type='application/json', HTTP_IDEMPOTENCY_KEY=key)
+        request.user = self.user
+        return charge(request)
+
+    def test_retries_replay_without_running_the_view(self):
+        first = self.call()
+        self.assertEqual((first.status_code, len(calls)), (201, 1))
+
+        idempotency._responses.clear()
+        # From the table: the refused INSERT and one SELECT (plus savepoint queries)
+        with self.assertNumQueries(5):
+            retry = self.call()
+        with self.assertNumQueries(0):
+            self.call()
+        self.assertEqual((retry.status_code, retry.content, len(calls)), (201, first.content, 1))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+
+        self.assertEqual(self.call('pay-2').content, b'{"charge": 2}')
+
+    def test_reused_key_with_a_different_request_is_refused(self):
+        self.call()
+        self.assertEqual(self.call(body='{"amount": 500}').status_code, 422)
+        self.assertEqual(self.call(path='/wallet/recharge/').status_code, 422)
+        self.assertEqual(len(calls), 1)
+
+    def test_in_flight_key_answers_conflict(self):
+        self.assertIsNone(idempotency.begin(self.user, 'pay-1', 'other'))
+        self.assertEqual(self.call().status_code, 422)
+        IdempotencyKey.objects.filter(key='pay-1').update(request_hash=idempotency.request_hash(
+            RequestFactory().post('/wallet/pay/', '{"amount": 50}', content_type='application/json')
+        ))
+        self.assertEqual(self.call().status_code, 409)
+        self.assertEqual(calls, [])
+
+    def test_crashed_request_frees_the_key_after_its_lease(self):
+        # The worker reserved the key and died before finishing
+        digest = idempotency.request_hash(
+            RequestFactory().post('/wallet/pay/', '{"amount": 50}', content_type='application/json')
+        )
+        self.assertIsNone(idempotency.begin(self.user, 'pay-1', digest))
+        reserved = IdempotencyKey.objects.get(key='pay-1')
+        self.assertLessEqual(
+            reserved.expires_at, timezone.now() + timedelta(seconds=idempotency.IDEMPOTENCY_LEASE_SECONDS),
+        )
+        self.assertEqual(self.call().status_code, 409)
+
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        retry = self.call()
+        self.assertEqual((retry.status_code, len(calls)), (201, 1))
+        stored = IdempotencyKey.objects.get(key='pay-1')
+        self.assertEqual(stored.status_code, 201)
+        self.assertGreater(stored.expires_at, timezone.now() + timedelta(hours=23))
+
+        idempotency._responses.clear()
+        self.assertEqual(self.call().content, retry.content)
+        self.assertEqual(len(calls), 1)
+
+    def test_server_errors_and_expired_keys_run_again(self):
+        request = RequestFactory().post('/wallet/pay/?fail=1', '{}', content_type='application/json',
+                                        HTTP_IDEMPOTENCY_KEY='pay-1')
+        request.user = self.user
+        self.assertEqual(charge(request).status_code, 503)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        self.call()
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        idempotency._responses.clear()
+        self.assertEqual(idempotency.purge_expired(), 1)
+        self.assertEqual(self.call().content, b'{"charge": 3}')
+
+
+class CountingProvider(geocoding.GeocodingProvider):
+    name = 'counting'
+
+    def __init__(self):
+        self.batches = []
+
+    def geocode(self, address):
+        return None if 'nowhere' in address.lower() else {'latitude': 18.5, 'longitude': 73.8}
+
+    def geocode_many(self, addresses):
+        self.batches.append(list(addresses))
+        return super().geocode_many(addresses)
+
+
+class GeocodingTests(TestCase):
+    def setUp(self):
+        self.provider = CountingProvider()
+        geocoding._provider = self.provider
+        geocoding._memory_cache.clear()
+        self.addCleanup(setattr, geocoding, '_provider', None)
+        self.addCleanup(geocoding._memory_cache.clear)
+
+    def test_provider_is_abstract(self):
+        with self.assertRaises(TypeError):
+            geocoding.GeocodingProvider()
+
+    def test_lru_evicts_the_least_recently_used(self):
+        cache = geocoding.LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+    def test_batch_resolves_each_address_once_then_serves_from_caches(self):
+        addresses = ['FC Road, Pune', 'fc road  pune', 'Baner, Pune', 'Nowhere land']
+        results = geocoding.geocode_addresses(addresses)
+
+        self.assertEqual(self.provider.batches, [['FC Road, Pune', 'Baner, Pune', 'Nowhere land']])
+        self.assertEqual(results[0], results[1])
+        self.assertIsNone(results[3])
+        self.assertEqual(GeocodeCache.objects.filter(provider='counting').count(), 2)
+
+        geocoding._memory_cache.clear()
+        # Misses go to the table in one query; only the unresolvable address reaches the provider
+        with self.assertNumQueries(1):
+            again = geocoding.geocode_addresses(addresses)
+        self.assertEqual(again, results)
+        self.assertEqual(self.provider.batches[-1], ['Nowhere land'])
+
+        with self.assertNumQueries(0):
+            geocoding.geocode_addresses(addresses[:3])
+
+    def test_nothing_is_geocoded_without_a_provider(self):
+        geocoding._provider = None
+        self.addCleanup(setattr, geocoding, '_provider_loaded', geocoding._provider_loaded)
+        geocoding._provider_loaded = False
+        with self.settings(GEOCODING_PROVIDER=''), self.assertNumQueries(0):
+            self.assertEqual(geocoding.geocode_addresses(['FC Road, Pune', 'Baner']), [None, None])
+        self.assertIsNone(geocoding.get_provider())
+
+    def test_offline_results_are_not_cached(self):
+        geocoding._provider = geocoding.OfflineGeocodingProvider()
+        first = geocoding.geocode('FC Road, Pune')
+        self.assertIsNotNone(first)
+        self.assertFalse(GeocodeCache.objects.exists())
+
+        # A real provider configured later does not see the made-up point
+        geocoding._provider = self.provider
+        self.assertEqual(geocoding.geocode('FC Road, Pune')['latitude'], Decimal('18.500000'))
+        self.assertEqual(len(self.provider.batches), 1)
+        self.assertNotEqual(
+            geocoding.address_key('FC Road, Pune', 'offline'), geocoding.address_key('FC Road, Pune', 'counting'),
+        )
+
+
+class HaversineTests(SimpleTestCase):
+    # Pune, Mumbai, Delhi and a point with no coordinates
+    LATS = [Decimal('18.520400'), 19.076, '28.6139', None]
+    LONS = [Decimal('73.856700'), 72.8777, '77.2090', None]
+
+    def test_batch_distances_match_the_scalar_formula(self):
+        distances = haversine_distances(18.5204, 73.8567, self.LATS, self.LONS)
+        for lat, lon, distance in zip(self.LATS[:3], self.LONS[:3], distances):
+            self.assertEqual(Decimal(str(round(distance, 2))), haversine_distance(18.5204, 73.8567, lat, lon))
+        self.assertEqual(distances[0], 0.0)
+        self.assertAlmostEqual(distances[1], 119.0, delta=2)
+        self.assertTrue(math.isnan(distances[3]))
+
+    def test_matrix_rows_match_one_to_many_distances(self):
+        matrix = haversine_matrix(self.LATS[:3], self.LONS[:3], self.LATS, self.LONS)
+        self.assertEqual(matrix.shape, (3, 4))
+        for row, (lat, lon) in enumerate(zip(self.LATS[:3], self.LONS[:3])):
+            expected = haversine_distances(lat, lon, self.LATS, self.LONS)
+            self.assertTrue((abs(matrix[row] - expected)[:3] < 1e-9).all())
+            self.assertTrue(math.isnan(matrix[row][3]))
+
+
+class NearbySearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        points = [
+            ('shivajinagar', '18.530800', '73.847500'),
+            ('kothrud', '18.507400', '73.807700'),
+            ('hadapsar', '18.508900', '73.925900'),
+            ('lonavala', '18.754600', '73.405700'),
+            ('mumbai', '19.076000', '72.877700'),
+        ]
+        CustomUser.objects.bulk_create([
+            CustomUser(username=f'{name}@example.com', role='receiver_ngo', latitude=lat, longitude=lon)
+            for name, lat, lon in points
+        ] + [CustomUser(username='nowhere@example.com', role='receiver_ngo')])
+
+    def test_database_search_matches_the_in_memory_search(self):
+        users = CustomUser.objects.all()
+        for radius, limit, offset in ((10, None, 0), (60, None, 0), (200, 2, 1)):
+            with self.subTest(radius=radius, limit=limit, offset=offset):
+                in_db = find_nearby_items(18.5204, 73.8567, users, radius, limit=limit, offset=offset)
+                in_memory = find_nearby_items(18.5204, 73.8567, list(users), radius, limit=limit, offset=offset)
+                self.assertEqual(
+                    [(user.username, user.distance) for user in in_db],
+                    [(user.username, user.distance) for user in in_memory],
+                )
+        # 9.994 km due north: kept by the haversine check, so the box must not drop it
+        north = CustomUser.objects.create(
+            username='north@example.com', role='receiver_ngo',
+            latitude=Decimal('18.610280'), longitude=Decimal('73.856700'),
+        )
+        self.assertIn(north, find_nearby_items(18.5204, 73.8567, users, 10))
+        north.delete()
+        names = [user.username for user in find_nearby_items(18.5204, 73.8567, users, 10)]
+        self.assertEqual(names, ['shivajinagar@example.com', 'kothrud@example.com', 'hadapsar@example.com'])
+
+    def test_bounding_box_contains_the_circle(self):
+        min_lat, max_lat, min_lon, max_lon = bounding_box(18.5204, 73.8567, 10)
+        # Points just inside the radius due north and south stay inside the box
+        for direction in (1, -1):
+            lat = 18.5204 + direction * math.degrees(9.99 / 6371)
+            self.assertLess(haversine_distance(18.5204, 73.8567, lat, 73.8567), 10)
+            self.assertTrue(min_lat <= lat <= max_lat)
+        # 10 km of longitude is wider than 10 km of latitude away from the equator
+        self.assertGreater(max_lon - 73.8567, max_lat - 18.5204)
+        # Boxes over a pole or across the antimeridian drop the longitude filter
+        self.assertEqual(bounding_box(89.99, 0, 10)[2:], (None, None))
+        self.assertEqual(bounding_box(0, 179.99, 10)[2:], (None, None))
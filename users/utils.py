@@ -1,75 +1,151 @@
 from math import radians, cos, sin, asin, sqrt
 from decimal import Decimal
 
+import numpy as np
+from django.db.models import QuerySet
+
+EARTH_RADIUS_KM = 6371
+
+
 def haversine_distance(lat1, lon1, lat2, lon2):
     """
-    Calculate the great circle distance between two points 
+    Calculate the great circle distance between two points
     on the earth (specified in decimal degrees)
     Returns distance in kilometers
     """
     lat1, lon1, lat2, lon2 = map(float, [lat1, lon1, lat2, lon2])
-    
+
     lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-    
+
     dlon = lon2 - lon1
     dlat = lat2 - lat1
     a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
     c = 2 * asin(sqrt(a))
-    r = 6371
-    
-    return Decimal(str(round(c * r, 2)))
+
+    return to_decimal_km(c * EARTH_RADIUS_KM)
+
+
+def to_decimal_km(distance):
+    """
+    Convert a float distance to the 2-place Decimal used by models and templates
+    """
+    return Decimal(str(round(float(distance), 2)))
+
+
+def to_float_array(values):
+    """
+    Convert a sequence of coordinates (Decimal, float or None) to a float array
+    Missing coordinates become NaN so they drop out of any radius comparison
+    """
+    return np.fromiter(
+        (np.nan if value is None else float(value) for value in values),
+        dtype=np.float64,
+    )
+
+
+def haversine_distances(lat, lon, lats, lons):
+    """
+    Distances in kilometers from one origin to many points in a single NumPy pass
+    Returns a float array aligned with lats/lons (NaN where coordinates are missing)
+    """
+    lat, lon = radians(float(lat)), radians(float(lon))
+    lats = np.radians(to_float_array(lats))
+    lons = np.radians(to_float_array(lons))
+
+    a = np.sin((lats - lat) / 2) ** 2 + cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_matrix(lats1, lons1, lats2, lons2):
+    """
+    Pairwise distances in kilometers between two sets of points
+    Returns a float array of shape (len(lats1), len(lats2))
+    """
+    lats1 = np.radians(to_float_array(lats1))[:, np.newaxis]
+    lons1 = np.radians(to_float_array(lons1))[:, np.newaxis]
+    lats2 = np.radians(to_float_array(lats2))[np.newaxis, :]
+    lons2 = np.radians(to_float_array(lons2))[np.newaxis, :]
+
+    a = np.sin((lats2 - lats1) / 2) ** 2 + np.cos(lats1) * np.cos(lats2) * np.sin((lons2 - lons1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
 
 
 def geocode_address(address):
     """
     Convert address to latitude and longitude
-    This is a placeholder - integrate with Google Maps Geocoding API or similar
+    Goes through the geocode cache; see users.geocoding for the provider setup
+    Returns None when the provider cannot resolve the address
     """
-    # TODO: Integrate with actual geocoding service
-    # For now, return dummy coordinates
-    return {
-        'latitude': Decimal('18.5204'),
-        'longitude': Decimal('73.8567'),
-        'formatted_address': address
-    }
+    from .geocoding import geocode
 
+    return geocode(address)
 
-def find_nearby_items(user_lat, user_lon, queryset, radius_km=10):
+
+def find_nearby_items(user_lat, user_lon, queryset, radius_km=10,
+                      lat_field='latitude', lon_field='longitude', limit=None, offset=0):
     """
     Filter queryset to find items within radius
-    Assumes queryset has latitude and longitude fields
+    Assumes queryset items have lat_field and lon_field attributes
+    QuerySets are filtered and ordered in the database; other iterables in Python
     """
+    if isinstance(queryset, QuerySet):
+        from .geo import nearby_queryset
+
+        nearby = nearby_queryset(queryset, user_lat, user_lon, radius_km, lat_field, lon_field)
+        nearby = nearby[offset:offset + limit] if limit is not None else nearby[offset:]
+        items = list(nearby)
+        for item in items:
+            item.distance = to_decimal_km(item.distance_km)
+        return items
+
+    items = list(queryset)
+    if not items:
+        return []
+
+    distances = haversine_distances(
+        user_lat, user_lon,
+        [getattr(item, lat_field) for item in items],
+        [getattr(item, lon_field) for item in items],
+    )
+
+    # NaN distances (missing coordinates) compare False and are dropped here
+    within = np.flatnonzero(distances <= float(radius_km))
+    within = within[np.argsort(distances[within], kind='stable')]
+
+    within = within[offset:offset + limit] if limit is not None else within[offset:]
+
     nearby_items = []
-    
-    for item in queryset:
-        if item.latitude and item.longitude:
-            distance = haversine_distance(user_lat, user_lon, item.latitude, item.longitude)
-            if distance <= radius_km:
-                item.distance = distance
-                nearby_items.append(item)
-    
-    return sorted(nearby_items, key=lambda x: x.distance)
+    for index in within:
+        item = items[index]
+        item.distance = to_decimal_km(distances[index])
+        nearby_items.append(item)
+
+    return nearby_items
 
 
-def find_nearest_volunteer(pickup_lat, pickup_lon, available_volunteers):
+def find_nearest_volunteer(pickup_lat, pickup_lon, available_volunteers=None):
     """
     Find the nearest available volunteer
+    Without a list of candidates the volunteer spatial index is used, which also
+    respects each volunteer's service radius
     """
-    if not available_volunteers:
+    if available_volunteers is None:
+        from volunteers.spatial_index import find_nearest_available_volunteers
+
+        nearest = find_nearest_available_volunteers(pickup_lat, pickup_lon, k=1)
+        return nearest[0] if nearest else None
+
+    volunteers = list(available_volunteers) if available_volunteers else []
+    if not volunteers:
         return None
-    
-    volunteers_with_distance = []
-    
-    for volunteer in available_volunteers:
-        if volunteer.current_latitude and volunteer.current_longitude:
-            distance = haversine_distance(
-                pickup_lat, pickup_lon,
-                volunteer.current_latitude, volunteer.current_longitude
-            )
-            volunteers_with_distance.append((volunteer, distance))
-    
-    if volunteers_with_distance:
-        volunteers_with_distance.sort(key=lambda x: x[1])
-        return volunteers_with_distance[0][0]
-    
-    return None
+
+    distances = haversine_distances(
+        pickup_lat, pickup_lon,
+        [volunteer.current_latitude for volunteer in volunteers],
+        [volunteer.current_longitude for volunteer in volunteers],
+    )
+
+    if np.isnan(distances).all():
+        return None
+
+    return volunteers[int(np.nanargmin(distances))]
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import VolunteerProfile, VolunteerEarnings
+from .models import PayoutRun, VolunteerEarnings, VolunteerPayout, VolunteerProfile
 
 @admin.register(VolunteerProfile)
 class VolunteerProfileAdmin(admin.ModelAdmin):
@@ -12,7 +12,19 @@ class VolunteerProfileAdmin(admin.ModelAdmin):
 
 @admin.register(VolunteerEarnings)
 class VolunteerEarningsAdmin(admin.ModelAdmin):
-    list_display = ['volunteer', 'delivery', 'amount', 'net_earnings', 'status', 'created_at']
+    list_display = ['volunteer', 'delivery', 'amount', 'net_earnings', 'status', 'payout_date', 'created_at']
     list_filter = ['status']
+    readonly_fields = ['payout_run']
     search_fields = ['volunteer__user__username']
     date_hierarchy = 'created_at'
+
+@admin.register(PayoutRun)
+class PayoutRunAdmin(admin.ModelAdmin):
+    list_display = ['reference', 'settled_until', 'volunteer_count', 'earnings_count', 'total_amount', 'created_at']
+    search_fields = ['reference']
+    readonly_fields = ['settled_until', 'volunteer_count', 'earnings_count', 'total_amount']
+
+@admin.register(VolunteerPayout)
+class VolunteerPayoutAdmin(admin.ModelAdmin):
+    list_display = ['volunteer', 'run', 'amount', 'earnings_count', 'created_at']
+    search_fields = ['volunteer__user__username', 'run__reference']
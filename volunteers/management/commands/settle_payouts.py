@@ -0,0 +1,32 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from volunteers.payouts import settle_payouts
+
+
+class Command(BaseCommand):
+    help = 'Pay out pending volunteer earnings up to the start of a day, one payout per volunteer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=datetime.fromisoformat, default=None,
+                            help='Settle earnings created before this day starts (default: today)')
+        parser.add_argument('--reference', default=None,
+                            help='Settlement reference (default: payout-<date>); re-running one is a no-op')
+
+    def handle(self, *args, **options):
+        day = options['date'].date() if options['date'] else timezone.localdate()
+        until = timezone.make_aware(datetime.combine(day, time.min))
+        reference = options['reference'] or f'payout-{day.isoformat()}'
+
+        run, created = settle_payouts(reference, until)
+        if not created:
+            self.stdout.write(self.style.WARNING(
+                f'{reference} was already settled: {run.earnings_count} earnings, ₹{run.total_amount}'
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'{reference}: paid ₹{run.total_amount} to {run.volunteer_count} volunteers '
+            f'for {run.earnings_count} earnings'
+        ))
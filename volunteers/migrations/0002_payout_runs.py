@@ -0,0 +1,67 @@
+# Generated by Django 5.0.1 on 2026-10-18 07:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('deliveries', '0003_initial'),
+        ('volunteers', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayoutRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(max_length=100, unique=True)),
+                ('settled_until', models.DateTimeField()),
+                ('volunteer_count', models.IntegerField(default=0)),
+                ('earnings_count', models.IntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'payout_runs',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='VolunteerPayout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('earnings_count', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'volunteer_payouts',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='volunteerearnings',
+            name='payout_run',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='earnings', to='volunteers.payoutrun'),
+        ),
+        migrations.AddIndex(
+            model_name='volunteerearnings',
+            index=models.Index(fields=['status', 'created_at'], name='volunteer_e_status_7406a4_idx'),
+        ),
+        migrations.AddField(
+            model_name='volunteerpayout',
+            name='run',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payouts', to='volunteers.payoutrun'),
+        ),
+        migrations.AddField(
+            model_name='volunteerpayout',
+            name='volunteer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payouts', to='volunteers.volunteerprofile'),
+        ),
+        migrations.AddConstraint(
+            model_name='volunteerpayout',
+            constraint=models.UniqueConstraint(fields=('run', 'volunteer'), name='unique_payout_per_run'),
+        ),
+    ]
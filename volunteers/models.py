@@ -61,7 +61,7 @@ class VolunteerProfile(models.Model):
         self.current_latitude = lat
         self.current_longitude = lng
         self.last_location_update = timezone.now()
-        self.save()
+        self.save(update_fields=['current_latitude', 'current_longitude', 'last_location_update', 'updated_at'])
     
     def calculate_success_rate(self):
         if self.total_deliveries == 0:
@@ -79,12 +79,56 @@ class VolunteerEarnings(models.Model):
     
     status = models.CharField(max_length=20, default='pending')
     payout_date = models.DateTimeField(null=True, blank=True)
+    payout_run = models.ForeignKey('PayoutRun', on_delete=models.PROTECT, null=True, blank=True,
+                                   related_name='earnings')
     
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         db_table = 'volunteer_earnings'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
     
     def __str__(self):
         return f"{self.volunteer.user.full_name} - ₹{self.net_earnings}"
+
+
+class PayoutRun(models.Model):
+    """One settlement of pending earnings; reference makes re-running the same settlement a no-op"""
+    reference = models.CharField(max_length=100, unique=True)
+    settled_until = models.DateTimeField()
+    
+    volunteer_count = models.IntegerField(default=0)
+    earnings_count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'payout_runs'
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.reference} - ₹{self.total_amount}"
+
+
+class VolunteerPayout(models.Model):
+    run = models.ForeignKey(PayoutRun, on_delete=models.CASCADE, related_name='payouts')
+    volunteer = models.ForeignKey(VolunteerProfile, on_delete=models.CASCADE, related_name='payouts')
+    
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    earnings_count = models.IntegerField()
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'volunteer_payouts'
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'volunteer'], name='unique_payout_per_run'),
+        ]
+    
+    def __str__(self):
+        return f"{self.volunteer.user.full_name} - ₹{self.amount} ({self.run.reference})"
@@ -0,0 +1,72 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from .models import PayoutRun, VolunteerEarnings, VolunteerPayout, VolunteerProfile
+
+PAYOUT_BATCH_SIZE = 1000
+
+
+def record_earning(volunteer, delivery, amount, platform_commission=0):
+    """Create a pending earning and add it to the volunteer's pending_payout and total_earnings"""
+    amount = Decimal(str(amount))
+    platform_commission = Decimal(str(platform_commission))
+    net_earnings = amount - platform_commission
+    with transaction.atomic():
+        earning = VolunteerEarnings.objects.create(
+            volunteer=volunteer, delivery=delivery, amount=amount,
+            platform_commission=platform_commission, net_earnings=net_earnings,
+        )
+        VolunteerProfile.objects.filter(id=volunteer.id).update(
+            pending_payout=F('pending_payout') + net_earnings,
+            total_earnings=F('total_earnings') + net_earnings,
+        )
+    return earning
+
+
+def settle_payouts(reference, until=None):
+    """
+    Pay out every pending earning created before until, in one transaction:
+    one UPDATE marks the earnings paid, one INSERT batch writes a payout per
+    volunteer and one UPDATE takes the amounts off pending_payout
+    A settlement is identified by reference; running it again returns the
+    existing run without paying anything twice
+    Returns (PayoutRun, created)
+    """
+    until = until or timezone.now()
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                run = PayoutRun.objects.create(reference=reference, settled_until=until)
+        except IntegrityError:
+            # Already settled (or being settled right now; the unique index makes us wait for it)
+            return PayoutRun.objects.get(reference=reference), False
+
+        # The status filter is re-checked under the row locks, so earnings claimed
+        # by a concurrent run are skipped rather than paid twice
+        VolunteerEarnings.objects.filter(status='pending', created_at__lt=until).update(
+            status='paid', payout_date=timezone.now(), payout_run=run,
+        )
+        totals = (
+            VolunteerEarnings.objects.filter(payout_run=run).order_by()
+            .values('volunteer_id').annotate(amount=Sum('net_earnings'), count=Count('id'))
+        )
+        payouts = [
+            VolunteerPayout(run=run, volunteer_id=row['volunteer_id'], amount=row['amount'],
+                            earnings_count=row['count'])
+            for row in totals
+        ]
+        VolunteerPayout.objects.bulk_create(payouts, batch_size=PAYOUT_BATCH_SIZE)
+
+        paid = VolunteerPayout.objects.filter(run=run, volunteer_id=OuterRef('id')).order_by().values('amount')
+        VolunteerProfile.objects.filter(
+            id__in=VolunteerPayout.objects.filter(run=run).values('volunteer_id'),
+        ).update(pending_payout=F('pending_payout') - Subquery(paid))
+
+        run.volunteer_count = len(payouts)
+        run.earnings_count = sum(payout.earnings_count for payout in payouts)
+        run.total_amount = sum((payout.amount for payout in payouts), Decimal('0.00'))
+        run.save(update_fields=['volunteer_count', 'earnings_count', 'total_amount'])
+    return run, True
@@ -0,0 +1,17 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import VolunteerProfile
+from .spatial_index import volunteer_index
+
+
+@receiver(post_save, sender=VolunteerProfile)
+def index_volunteer_on_save(sender, instance, **kwargs):
+    transaction.on_commit(lambda: volunteer_index.update(instance))
+
+
+@receiver(post_delete, sender=VolunteerProfile)
+def unindex_volunteer_on_delete(sender, instance, **kwargs):
+    profile_id = instance.pk
+    transaction.on_commit(lambda: volunteer_index.remove(profile_id))
@@ -0,0 +1,231 @@
+import threading
+import time
+from collections import defaultdict
+from math import floor, radians
+
+import numpy as np
+
+from users.geo import bounding_box
+from users.utils import EARTH_RADIUS_KM, haversine_distances
+
+# Grid cell size in degrees (~5.5 km of latitude)
+CELL_SIZE_DEG = 0.05
+CELL_SIZE_KM = radians(CELL_SIZE_DEG) * EARTH_RADIUS_KM
+
+# The database-side twin of is_indexable
+AVAILABLE_FILTER = {
+    'status': 'available',
+    'is_available': True,
+    'current_latitude__isnull': False,
+    'current_longitude__isnull': False,
+}
+
+# Signals only reach the process that saved the profile; other processes,
+# bulk updates and raw SQL are picked up by reloading the index this often
+INDEX_MAX_AGE_SECONDS = 60
+
+# Index lookups retried after dropping stale hits before settling for fewer results
+MAX_LOOKUPS = 3
+
+
+def _cell(lat, lon):
+    return floor(lat / CELL_SIZE_DEG), floor(lon / CELL_SIZE_DEG)
+
+
+def is_indexable(profile):
+    """A volunteer is indexed only while online, available and located"""
+    return (
+        profile.status == 'available'
+        and profile.is_available
+        and profile.current_latitude is not None
+        and profile.current_longitude is not None
+    )
+
+
+class VolunteerIndex:
+    """
+    Per-process grid index of available volunteers
+    Kept current by the profile signals in this process and reloaded from the
+    database every INDEX_MAX_AGE_SECONDS for changes made elsewhere
+    Each entry keeps the volunteer's service radius so lookups only return
+    volunteers willing to travel to the queried point
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._cells = defaultdict(set)
+        self._max_radius_km = 0.0
+        self._loaded_at = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def rebuild(self, queryset=None):
+        """Reload the whole index from the database"""
+        from .models import VolunteerProfile
+
+        if queryset is None:
+            queryset = VolunteerProfile.objects.filter(**AVAILABLE_FILTER)
+        rows = queryset.values_list('id', 'current_latitude', 'current_longitude', 'service_radius_km')
+
+        with self._lock:
+            self._entries = {}
+            self._cells = defaultdict(set)
+            for profile_id, lat, lon, radius_km in rows:
+                self._insert(profile_id, float(lat), float(lon), float(radius_km))
+            self._max_radius_km = max((entry[2] for entry in self._entries.values()), default=0.0)
+            self._loaded_at = time.monotonic()
+
+    def ensure_loaded(self):
+        """Build the index on first use and reload it once it is INDEX_MAX_AGE_SECONDS old"""
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at >= INDEX_MAX_AGE_SECONDS:
+            self.rebuild()
+
+    def update(self, profile):
+        """Insert, move or drop one volunteer according to its current state"""
+        if not is_indexable(profile):
+            self.remove(profile.pk)
+            return
+
+        lat, lon = float(profile.current_latitude), float(profile.current_longitude)
+        radius_km = float(profile.service_radius_km)
+        with self._lock:
+            self._discard(profile.pk)
+            self._insert(profile.pk, lat, lon, radius_km)
+            self._max_radius_km = max(self._max_radius_km, radius_km)
+
+    def remove(self, profile_id):
+        with self._lock:
+            self._discard(profile_id)
+
+    def within_radius(self, lat, lon, radius_km=None):
+        """
+        Volunteers whose service radius covers (lat, lon), optionally capped at radius_km
+        Returns a list of (profile_id, distance_km) sorted nearest first
+        """
+        ids, distances = self._candidates(lat, lon, radius_km)
+        order = np.argsort(distances, kind='stable')
+        return [(ids[i], float(distances[i])) for i in order]
+
+    def nearest(self, lat, lon, k=1, radius_km=None):
+        """The k nearest volunteers that can serve (lat, lon), as (profile_id, distance_km)"""
+        # Widen the searched area ring by ring until the k-th match is provably the k-th nearest
+        self.ensure_loaded()
+        limit_km = self._max_radius_km if radius_km is None else min(self._max_radius_km, float(radius_km))
+        search_km = CELL_SIZE_KM
+        while True:
+            ids, distances = self._candidates(lat, lon, radius_km, search_km)
+            if search_km >= limit_km:
+                break
+            if len(ids) >= k and np.partition(distances, k - 1)[k - 1] <= search_km:
+                break
+            search_km *= 2
+
+        if len(ids) > k:
+            top = np.argpartition(distances, k - 1)[:k]
+        else:
+            top = np.arange(len(ids))
+        top = top[np.argsort(distances[top], kind='stable')]
+        return [(ids[i], float(distances[i])) for i in top]
+
+    def _candidates(self, lat, lon, radius_km, search_km=None):
+        self.ensure_loaded()
+        lat, lon = float(lat), float(lon)
+
+        with self._lock:
+            if search_km is None or search_km > self._max_radius_km:
+                search_km = self._max_radius_km
+            if radius_km is not None:
+                search_km = min(search_km, float(radius_km))
+
+            min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, search_km)
+            if min_lon is None:
+                ids = list(self._entries)
+            else:
+                (lat_lo, lon_lo), (lat_hi, lon_hi) = _cell(min_lat, min_lon), _cell(max_lat, max_lon)
+                ids = [
+                    profile_id
+                    for cell_lat in range(lat_lo, lat_hi + 1)
+                    for cell_lon in range(lon_lo, lon_hi + 1)
+                    for profile_id in self._cells.get((cell_lat, cell_lon), ())
+                ]
+            entries = [self._entries[profile_id] for profile_id in ids]
+
+        if not entries:
+            return [], np.empty(0)
+
+        lats, lons, radii = np.array(entries, dtype=np.float64).T
+        distances = haversine_distances(lat, lon, lats, lons)
+
+        mask = distances <= radii
+        if radius_km is not None:
+            mask &= distances <= float(radius_km)
+
+        keep = np.flatnonzero(mask)
+        return [ids[i] for i in keep], distances[keep]
+
+    def _insert(self, profile_id, lat, lon, radius_km):
+        self._entries[profile_id] = (lat, lon, radius_km)
+        self._cells[_cell(lat, lon)].add(profile_id)
+
+    def _discard(self, profile_id):
+        entry = self._entries.pop(profile_id, None)
+        if entry is None:
+            return
+        cell = _cell(entry[0], entry[1])
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(profile_id)
+            if not members:
+                del self._cells[cell]
+
+
+volunteer_index = VolunteerIndex()
+
+
+def find_nearest_available_volunteers(lat, lon, k=1, radius_km=None):
+    """
+    Nearest available VolunteerProfiles for a pickup point, using the in-process index
+    Hits are re-checked against the database; ones that are no longer available
+    (changed by another process or a bulk update) are dropped from the index
+    Each returned profile carries a Decimal `distance` like users.utils.find_nearby_items
+    """
+    from users.utils import to_decimal_km
+    from .models import VolunteerProfile
+
+    for _ in range(MAX_LOOKUPS):
+        matches = volunteer_index.nearest(lat, lon, k=k, radius_km=radius_km)
+        profiles = (
+            VolunteerProfile.objects.select_related('user').filter(**AVAILABLE_FILTER)
+            .in_bulk([pk for pk, _ in matches])
+        )
+        stale = [pk for pk, _ in matches if pk not in profiles]
+        if not stale:
+            break
+        for pk in stale:
+            volunteer_index.remove(pk)
+
+    nearest = []
+    for profile_id, distance in matches:
+        profile = profiles.get(profile_id)
+        if profile is not None and is_indexable(profile):
+            profile.distance = to_decimal_km(distance)
+            nearest.append(profile)
+    return nearest
+
+
+def volunteers_covering(points):
+    """
+    Available VolunteerProfiles whose service radius covers at least one of the
+    (lat, lon) points, found through the index and re-checked in the database
+    """
+    from .models import VolunteerProfile
+
+    ids = set()
+    for lat, lon in points:
+        ids.update(pk for pk, _ in volunteer_index.within_radius(lat, lon))
+    if not ids:
+        return VolunteerProfile.objects.none()
+    return VolunteerProfile.objects.filter(id__in=ids, **AVAILABLE_FILTER)
@@ -1,3 +1,134 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
 from django.test import TestCase
+from django.utils import timezone
+
+from deliveries.models import Delivery
+from donations.models import Donation
+from users.models import CustomUser
+from users.utils import find_nearest_volunteer
+from .models import PayoutRun, VolunteerEarnings, VolunteerPayout, VolunteerProfile
+from .payouts import record_earning, settle_payouts
+from . import spatial_index
+from .spatial_index import find_nearest_available_volunteers, volunteer_index, volunteers_covering
+
+
+class SpatialIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Roughly 1, 3 and 8 km north of the pickup point
+        cls.profiles = [
+            VolunteerProfile.objects.create(
+                user=CustomUser.objects.create(username=f'rider{i}@example.com', full_name=f'Rider {i}', role='volunteer'),
+                vehicle_type='bike', status='available', is_available=True, service_radius_km=radius,
+                current_latitude=18.52 + offset, current_longitude=73.85,
+            )
+            for i, (offset, radius) in enumerate([(0.009, 10), (0.027, 10), (0.072, 5)])
+        ]
+
+    def setUp(self):
+        volunteer_index.rebuild()
+
+    def test_nearest_follows_distance_and_service_radius(self):
+        nearest = find_nearest_available_volunteers(18.52, 73.85, k=3)
+        # The third volunteer is 8 km away but only serves 5 km
+        self.assertEqual([profile.id for profile in nearest], [self.profiles[0].id, self.profiles[1].id])
+        self.assertAlmostEqual(float(nearest[0].distance), 1.0, delta=0.05)
+        self.assertEqual(find_nearest_volunteer(18.52, 73.85), nearest[0])
+
+    def test_stale_entries_are_rechecked_and_dropped(self):
+        # A bulk update skips the signals, so the index still lists the volunteer
+        VolunteerProfile.objects.filter(id=self.profiles[0].id).update(status='busy', is_available=False)
+
+        with self.assertNumQueries(2):
+            nearest = find_nearest_available_volunteers(18.52, 73.85)
+        self.assertEqual([profile.id for profile in nearest], [self.profiles[1].id])
+        self.assertEqual(volunteer_index.nearest(18.52, 73.85)[0][0], self.profiles[1].id)
+        self.assertNotIn(self.profiles[0].id, {pk for pk, _ in volunteer_index.within_radius(18.52, 73.85)})
+
+    def test_volunteers_made_available_elsewhere_are_found_after_reload(self):
+        newcomer = VolunteerProfile.objects.create(
+            user=CustomUser.objects.create(username='rider9@example.com', full_name='Rider 9', role='volunteer'),
+            vehicle_type='bike', status='offline', is_available=False,
+            current_latitude=18.52, current_longitude=73.85,
+        )
+        # Another process (or a bulk update) brings the volunteer online; no signal reaches this index
+        VolunteerProfile.objects.filter(id=newcomer.id).update(status='available', is_available=True)
+        self.assertNotIn(newcomer.id, {pk for pk, _ in volunteer_index.within_radius(18.52, 73.85)})
+
+        # As if the index had reached its maximum age
+        with mock.patch.object(spatial_index, 'INDEX_MAX_AGE_SECONDS', 0):
+            nearest = find_nearest_available_volunteers(18.52, 73.85)
+        self.assertEqual([profile.id for profile in nearest], [newcomer.id])
+
+    def test_covering_only_returns_volunteers_in_reach(self):
+        far_away = [(19.07, 72.87)]
+        self.assertEqual(list(volunteers_covering(far_away)), [])
+        covering = volunteers_covering([(18.52, 73.85), (18.60, 73.85)])
+        self.assertEqual({profile.id for profile in covering}, {profile.id for profile in self.profiles})
+
+
+class PayoutSettlementTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        donor = CustomUser.objects.create(username='donor@example.com', full_name='Donor', role='donor_restaurant')
+        receiver = CustomUser.objects.create(username='ngo@example.com', full_name='NGO', role='receiver_ngo')
+        donation = Donation.objects.create(
+            donor=donor, food_title='Thali', description='Fresh', quantity='10 plates', pickup_location='Pune',
+            expiry_date=timezone.localdate() + timedelta(days=1),
+        )
+        cls.delivery = Delivery.objects.create(
+            donation=donation, receiver=receiver, pickup_latitude=18.52, pickup_longitude=73.85,
+            pickup_address='Pune', delivery_latitude=18.53, delivery_longitude=73.86, delivery_address='Pune',
+        )
+        cls.volunteers = [
+            VolunteerProfile.objects.create(
+                user=CustomUser.objects.create(username=f'rider{i}@example.com', full_name=f'Rider {i}', role='volunteer'),
+                vehicle_type='bike',
+            )
+            for i in range(2)
+        ]
+
+    def test_settlement_pays_each_volunteer_once(self):
+        first, second = self.volunteers
+        for amount in (50, 30):
+            record_earning(first, self.delivery, amount, platform_commission=5)
+        record_earning(second, self.delivery, 40)
+
+        # Seven statements however many earnings there are, plus three savepoint queries
+        with self.assertNumQueries(10):
+            run, created = settle_payouts('payout-test', timezone.now() + timedelta(seconds=1))
+        self.assertTrue(created)
+        self.assertEqual((run.volunteer_count, run.earnings_count, run.total_amount), (2, 3, Decimal('110.00')))
+        self.assertEqual(
+            dict(VolunteerPayout.objects.filter(run=run).values_list('volunteer_id', 'amount')),
+            {first.id: Decimal('70.00'), second.id: Decimal('40.00')},
+        )
+        self.assertFalse(VolunteerEarnings.objects.filter(status='pending').exists())
+        self.assertFalse(VolunteerEarnings.objects.filter(payout_date__isnull=True).exists())
+
+        first.refresh_from_db()
+        self.assertEqual((first.pending_payout, first.total_earnings), (Decimal('0.00'), Decimal('70.00')))
+
+        # Re-running the same settlement, or a later one with nothing pending, pays nothing
+        again, created = settle_payouts('payout-test')
+        self.assertEqual((again.id, created), (run.id, False))
+        later, created = settle_payouts('payout-later')
+        self.assertTrue(created)
+        self.assertEqual((later.volunteer_count, later.total_amount), (0, Decimal('0.00')))
+        self.assertEqual(VolunteerPayout.objects.count(), 2)
+
+    def test_earnings_after_the_cutoff_stay_pending(self):
+        volunteer = self.volunteers[0]
+        old = record_earning(volunteer, self.delivery, 25)
+        VolunteerEarnings.objects.filter(id=old.id).update(created_at=timezone.now() - timedelta(days=1))
+        record_earning(volunteer, self.delivery, 10)
+
+        settle_payouts('payout-yesterday', timezone.now() - timedelta(hours=1))
 
-# Create your tests here.
+        volunteer.refresh_from_db()
+        self.assertEqual(volunteer.pending_payout, Decimal('10.00'))
+        self.assertEqual(VolunteerEarnings.objects.get(status='pending').net_earnings, Decimal('10.00'))
+        self.assertEqual(PayoutRun.objects.get().total_amount, Decimal('25.00'))
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Wallet, Transaction
+from .models import Wallet, Transaction, WalletSnapshot
 
 @admin.register(Wallet)
 class WalletAdmin(admin.ModelAdmin):
@@ -15,3 +15,9 @@ class TransactionAdmin(admin.ModelAdmin):
     search_fields = ['wallet__user__username', 'transaction_id']
     date_hierarchy = 'created_at'
     readonly_fields = ['balance_before', 'balance_after']
+
+@admin.register(WalletSnapshot)
+class WalletSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['wallet', 'last_transaction_id', 'balance', 'transaction_count', 'created_at']
+    search_fields = ['wallet__user__username']
+    readonly_fields = ['last_transaction_id', 'balance', 'total_recharged', 'total_spent', 'transaction_count']
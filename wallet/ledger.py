@@ -0,0 +1,121 @@
+import uuid
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Transaction, Wallet
+
+CREDIT_TYPES = ('recharge', 'refund', 'bonus')
+DEBIT_TYPES = ('delivery_payment',)
+
+CENT = Decimal('0.01')
+
+
+class LedgerError(Exception):
+    """A wallet movement that cannot go through; the message is shown to the user"""
+
+
+class InsufficientBalance(LedgerError):
+    pass
+
+
+def _amount(amount):
+    try:
+        amount = Decimal(str(amount)).quantize(CENT)
+    except (InvalidOperation, ValueError):
+        raise LedgerError('Amount must be a number')
+    if amount <= 0:
+        raise LedgerError('Amount must be greater than zero')
+    return amount
+
+
+def _new_transaction_id():
+    return f'TXN{uuid.uuid4().hex.upper()}'
+
+
+def _post(wallet, amount, transaction_type, sign, description, reference_id, payment_method):
+    """
+    Move amount in or out of the wallet with one conditional UPDATE and record it
+    The UPDATE holds the wallet's row lock until commit, so the balance read back
+    right after it is exactly this movement's balance_after
+    """
+    wallet_id = wallet.pk if isinstance(wallet, Wallet) else wallet
+    amount = _amount(amount)
+    wallets = Wallet.objects.filter(id=wallet_id, is_active=True)
+    if sign > 0:
+        changes = {'balance': F('balance') + amount, 'total_recharged': F('total_recharged') + amount}
+    else:
+        wallets = wallets.filter(balance__gte=amount)
+        changes = {'balance': F('balance') - amount, 'total_spent': F('total_spent') + amount}
+
+    with transaction.atomic():
+        if not wallets.update(updated_at=timezone.now(), **changes):
+            if not Wallet.objects.filter(id=wallet_id, is_active=True).exists():
+                raise LedgerError('This wallet is not active')
+            raise InsufficientBalance('Insufficient wallet balance')
+
+        state = Wallet.objects.filter(id=wallet_id).values(
+            'balance', 'total_recharged', 'total_spent', 'updated_at',
+        ).get()
+        balance_after = state['balance']
+        entry = Transaction.objects.create(
+            wallet_id=wallet_id,
+            transaction_type=transaction_type,
+            amount=amount,
+            status='completed',
+            transaction_id=_new_transaction_id(),
+            payment_method=payment_method,
+            description=description,
+            reference_id=reference_id,
+            balance_before=balance_after - sign * amount,
+            balance_after=balance_after,
+        )
+
+    if isinstance(wallet, Wallet):
+        for field, value in state.items():
+            setattr(wallet, field, value)
+    return entry
+
+
+def credit(wallet, amount, transaction_type='recharge', description='', reference_id='', payment_method='demo'):
+    """Add amount to wallet (a Wallet or its id); returns the completed Transaction"""
+    if transaction_type not in CREDIT_TYPES:
+        raise LedgerError(f'{transaction_type} is not a credit')
+    return _post(wallet, amount, transaction_type, 1, description, reference_id, payment_method)
+
+
+def debit(wallet, amount, transaction_type='delivery_payment', description='', reference_id='', payment_method='wallet'):
+    """
+    Take amount out of wallet only if the balance covers it
+    Returns the completed Transaction or raises InsufficientBalance
+    """
+    if transaction_type not in DEBIT_TYPES:
+        raise LedgerError(f'{transaction_type} is not a debit')
+    return _post(wallet, amount, transaction_type, -1, description, reference_id, payment_method)
+
+
+def verify_ledger(wallet_id, opening_balance=Decimal('0.00')):
+    """
+    Replay a wallet's transactions in id order and return the problems found:
+    entries whose balance_before does not follow the previous balance_after, or
+    whose before/after do not differ by the amount, and a final balance mismatch
+    """
+    problems = []
+    balance = opening_balance
+    entries = (
+        Transaction.objects.filter(wallet_id=wallet_id, status='completed')
+        .order_by('id').values_list('id', 'transaction_type', 'amount', 'balance_before', 'balance_after')
+    )
+    for entry_id, transaction_type, amount, before, after in entries.iterator(chunk_size=2000):
+        sign = 1 if transaction_type in CREDIT_TYPES else -1
+        if before != balance:
+            problems.append(f'transaction {entry_id}: balance_before {before}, expected {balance}')
+        if after - before != sign * amount:
+            problems.append(f'transaction {entry_id}: moves {after - before}, expected {sign * amount}')
+        balance = after
+    stored = Wallet.objects.filter(id=wallet_id).values_list('balance', flat=True).get()
+    if stored != balance:
+        problems.append(f'wallet balance {stored}, ledger says {balance}')
+    return problems
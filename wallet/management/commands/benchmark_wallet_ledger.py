@@ -0,0 +1,97 @@
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from users.models import CustomUser
+from wallet.ledger import InsufficientBalance, credit, debit, verify_ledger
+from wallet.models import Transaction, Wallet
+
+
+class Command(BaseCommand):
+    help = 'Hammer one wallet with concurrent ledger debits and credits and check that no update was lost'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--operations', type=int, default=100, help='Ledger calls per thread')
+        parser.add_argument('--amount', type=Decimal, default=Decimal('1.00'))
+        parser.add_argument('--opening-balance', type=Decimal, default=Decimal('500.00'),
+                            help='Low enough that some debits are refused')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark user and wallet')
+
+    def handle(self, *args, **options):
+        threads, operations, amount = options['threads'], options['operations'], options['amount']
+        opening = options['opening_balance'].quantize(Decimal('0.01'))
+        user = CustomUser.objects.create(
+            username=f'ledger-benchmark-{uuid.uuid4().hex[:12]}@example.com',
+            full_name='Ledger benchmark', role='volunteer',
+        )
+        wallet = Wallet.objects.create(user=user)
+        if opening:
+            credit(wallet, opening, 'bonus', description='Opening balance')
+
+        counts = {'credits': 0, 'debits': 0, 'refused': 0}
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(threads)
+
+        def worker(index):
+            done = {'credits': 0, 'debits': 0, 'refused': 0}
+            try:
+                barrier.wait()
+                for i in range(operations):
+                    # Three debits per credit, so the balance runs down and the guard is exercised
+                    if (index + i) % 4 == 0:
+                        credit(wallet.id, amount, 'refund')
+                        done['credits'] += 1
+                    else:
+                        try:
+                            debit(wallet.id, amount)
+                            done['debits'] += 1
+                        except InsufficientBalance:
+                            done['refused'] += 1
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+                with lock:
+                    for key, value in done.items():
+                        counts[key] += value
+
+        workers = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        wallet.refresh_from_db()
+        expected = opening + (counts['credits'] - counts['debits']) * amount
+        recorded = Transaction.objects.filter(wallet=wallet).count() - (1 if opening else 0)
+        problems = verify_ledger(wallet.id)
+        if wallet.balance != expected:
+            problems.append(f'balance {wallet.balance}, expected {expected} from successful calls')
+        if recorded != counts['credits'] + counts['debits']:
+            problems.append(f'{recorded} transactions for {counts["credits"] + counts["debits"]} successful calls')
+        if wallet.balance < 0:
+            problems.append(f'balance went negative: {wallet.balance}')
+
+        total = threads * operations
+        self.stdout.write(f'{threads} threads x {operations} operations on {connection.vendor}')
+        self.stdout.write(f'{total} calls in {elapsed:.2f} s ({total / elapsed:.0f}/s)')
+        self.stdout.write(f'{counts["credits"]} credits, {counts["debits"]} debits, '
+                          f'{counts["refused"]} refused, final balance {wallet.balance}')
+
+        if not options['keep']:
+            user.delete()
+        if errors:
+            raise CommandError(f'{len(errors)} workers failed, first: {errors[0]!r}')
+        if problems:
+            for problem in problems[:20]:
+                self.stderr.write(problem)
+            raise CommandError(f'Ledger check failed with {len(problems)} problems')
+        self.stdout.write(self.style.SUCCESS('No lost updates: balance and ledger agree'))
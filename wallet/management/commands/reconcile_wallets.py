@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from wallet.reconcile import TRANSACTION_CHUNK_SIZE, WALLET_BATCH_SIZE, reconcile_wallets
+
+
+class Command(BaseCommand):
+    help = 'Check wallet balances and totals against the transaction ledger, replaying from the last snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Reconcile this many wallet id ranges in parallel')
+        parser.add_argument('--snapshot', action='store_true',
+                            help='Record a new snapshot for every wallet that moved and reconciled cleanly')
+        parser.add_argument('--batch-size', type=int, default=WALLET_BATCH_SIZE)
+        parser.add_argument('--chunk-size', type=int, default=TRANSACTION_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        for option in ('workers', 'batch_size', 'chunk_size'):
+            if options[option] < 1:
+                raise CommandError(f'--{option.replace("_", "-")} must be at least 1')
+        report = reconcile_wallets(
+            workers=options['workers'], snapshot=options['snapshot'],
+            batch_size=options['batch_size'], chunk_size=options['chunk_size'],
+        )
+        for drift in report['drift']:
+            where = f' at transaction {drift["transaction_id"]}' if drift['transaction_id'] else ''
+            self.stdout.write(
+                f'Wallet {drift["wallet_id"]}: {drift["field"]} is {drift["stored"]}, '
+                f'ledger says {drift["ledger"]}{where}'
+            )
+        self.stdout.write(
+            f'Reconciled {report["wallets"]} wallets over {report["transactions"]} new transactions '
+            f'({report["snapshots"]} snapshots written)'
+        )
+        if report['drift']:
+            raise CommandError(f'{len(report["drift"])} discrepancies found')
+        self.stdout.write(self.style.SUCCESS('Wallets match the ledger'))
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.1 on 2026-10-18 07:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wallet', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_transaction_id', models.BigIntegerField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('total_recharged', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('total_spent', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('transaction_count', models.PositiveBigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'wallet_snapshots',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['wallet', 'id'], name='wallet_txn_wallet_id_idx'),
+        ),
+        migrations.AddField(
+            model_name='walletsnapshot',
+            name='wallet',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='wallet.wallet'),
+        ),
+        migrations.AddConstraint(
+            model_name='walletsnapshot',
+            constraint=models.UniqueConstraint(fields=('wallet', 'last_transaction_id'), name='unique_wallet_snapshot'),
+        ),
+    ]
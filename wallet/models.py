@@ -19,18 +19,18 @@ class Wallet(models.Model):
     def __str__(self):
         return f"{self.user.full_name} - ₹{self.balance}"
     
-    def add_balance(self, amount):
-        self.balance += Decimal(str(amount))
-        self.total_recharged += Decimal(str(amount))
-        self.save()
-    
-    def deduct_balance(self, amount):
-        if self.balance >= Decimal(str(amount)):
-            self.balance -= Decimal(str(amount))
-            self.total_spent += Decimal(str(amount))
-            self.save()
-            return True
-        return False
+    def add_balance(self, amount, transaction_type='recharge', **details):
+        """Credit the wallet through the ledger; returns the Transaction"""
+        from .ledger import credit
+        return credit(self, amount, transaction_type, **details)
+    
+    def deduct_balance(self, amount, transaction_type='delivery_payment', **details):
+        """Debit the wallet through the ledger; returns the Transaction, or None if the balance is too low"""
+        from .ledger import InsufficientBalance, debit
+        try:
+            return debit(self, amount, transaction_type, **details)
+        except InsufficientBalance:
+            return None
     
     def has_sufficient_balance(self, amount):
         return self.balance >= Decimal(str(amount))
@@ -73,7 +73,31 @@ class Transaction(models.Model):
         indexes = [
             models.Index(fields=['wallet', 'status']),
             models.Index(fields=['transaction_id']),
+            # Reconciliation streams each wallet's entries in id order from a snapshot
+            models.Index(fields=['wallet', 'id'], name='wallet_txn_wallet_id_idx'),
         ]
     
     def __str__(self):
         return f"{self.wallet.user.full_name} - {self.transaction_type} - ₹{self.amount}"
+
+
+class WalletSnapshot(models.Model):
+    """Ledger-derived wallet state as of last_transaction_id; reconciliation replays from here"""
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='snapshots')
+    last_transaction_id = models.BigIntegerField()
+    
+    balance = models.DecimalField(max_digits=10, decimal_places=2)
+    total_recharged = models.DecimalField(max_digits=10, decimal_places=2)
+    total_spent = models.DecimalField(max_digits=10, decimal_places=2)
+    transaction_count = models.PositiveBigIntegerField()
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'wallet_snapshots'
+        constraints = [
+            models.UniqueConstraint(fields=['wallet', 'last_transaction_id'], name='unique_wallet_snapshot'),
+        ]
+    
+    def __str__(self):
+        return f"Wallet {self.wallet_id} @ {self.last_transaction_id} - ₹{self.balance}"
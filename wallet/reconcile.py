@@ -0,0 +1,191 @@
+import logging
+import operator
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from functools import reduce
+
+from django.db import connection
+from django.db.models import Max, Min, OuterRef, Q, Subquery
+
+from .ledger import CREDIT_TYPES
+from .models import Transaction, Wallet, WalletSnapshot
+
+logger = logging.getLogger(__name__)
+
+# Wallets reconciled together; bounds the per-worker state to this many running totals
+WALLET_BATCH_SIZE = 1000
+
+# Rows fetched per round trip from the server-side cursor
+TRANSACTION_CHUNK_SIZE = 5000
+
+# Wallets whose ledger ranges are OR'd into one replay statement
+REPLAY_GROUP_SIZE = 100
+
+ZERO = Decimal('0.00')
+
+FIELDS = ('balance', 'total_recharged', 'total_spent')
+
+
+def wallet_id_ranges(workers):
+    """Split the wallet id space into up to workers contiguous (low, high) ranges"""
+    if workers < 1:
+        raise ValueError('workers must be at least 1')
+    bounds = Wallet.objects.aggregate(low=Min('id'), high=Max('id'))
+    low, high = bounds['low'], bounds['high']
+    if high is None:
+        return []
+    step = max((high - low + 1 + workers - 1) // workers, 1)
+    return [(start, min(start + step - 1, high)) for start in range(low, high + 1, step)]
+
+
+def _opening_states(wallet_ids):
+    """Each wallet's latest snapshot as a running state, or a zero state from the start of its ledger"""
+    latest = (
+        WalletSnapshot.objects.filter(wallet_id=OuterRef('wallet_id'))
+        .order_by('-last_transaction_id').values('id')[:1]
+    )
+    snapshots = WalletSnapshot.objects.filter(
+        wallet_id__in=wallet_ids, id=Subquery(latest),
+    ).values('wallet_id', 'last_transaction_id', 'transaction_count', *FIELDS)
+    states = {
+        wallet_id: {
+            'since': 0, 'last': 0, 'count': 0, 'new': 0, 'break': None, 'snapshotted': False,
+            'balance': ZERO, 'total_recharged': ZERO, 'total_spent': ZERO,
+        }
+        for wallet_id in wallet_ids
+    }
+    for snapshot in snapshots:
+        state = states[snapshot['wallet_id']]
+        state.update({field: snapshot[field] for field in FIELDS})
+        state['since'] = state['last'] = snapshot['last_transaction_id']
+        state['count'] = snapshot['transaction_count']
+        state['snapshotted'] = True
+    return states
+
+
+def _replay(states, wallets, chunk_size):
+    """
+    Stream each wallet's completed entries after its snapshot, up to the last entry
+    seen when the wallet row was read (later ones belong to the next run)
+    Wallets with nothing new are not read at all
+    """
+    ranges = [
+        Q(wallet_id=wallet_id, id__gt=state['since'], id__lte=wallets[wallet_id]['last_transaction_id'])
+        for wallet_id, state in sorted(states.items())
+        if wallets[wallet_id]['last_transaction_id'] > state['since']
+    ]
+    replayed = 0
+    for start in range(0, len(ranges), REPLAY_GROUP_SIZE):
+        entries = (
+            Transaction.objects.filter(reduce(operator.or_, ranges[start:start + REPLAY_GROUP_SIZE]), status='completed')
+            .order_by('wallet_id', 'id')
+            .values_list('wallet_id', 'id', 'transaction_type', 'amount', 'balance_before', 'balance_after')
+        )
+        for wallet_id, entry_id, transaction_type, amount, before, after in entries.iterator(chunk_size=chunk_size):
+            state = states[wallet_id]
+            if transaction_type in CREDIT_TYPES:
+                state['total_recharged'] += amount
+                moved = amount
+            else:
+                state['total_spent'] += amount
+                moved = -amount
+            if state['break'] is None and (before != state['balance'] or after != before + moved):
+                state['break'] = (entry_id, before, after, state['balance'])
+            state['balance'] += moved
+            state['last'] = entry_id
+            state['count'] += 1
+            state['new'] += 1
+            replayed += 1
+    return replayed
+
+
+def _check(wallet_id, state, wallet):
+    drift = []
+    for field in FIELDS:
+        if wallet[field] != state[field]:
+            drift.append({
+                'wallet_id': wallet_id, 'field': field, 'stored': wallet[field], 'ledger': state[field],
+                'transaction_id': None,
+            })
+    if state['break'] is not None:
+        entry_id, before, after, expected = state['break']
+        drift.append({
+            'wallet_id': wallet_id, 'field': 'balance_before', 'stored': before, 'ledger': expected,
+            'transaction_id': entry_id,
+        })
+    return drift
+
+
+def reconcile_range(low, high, snapshot=False, batch_size=WALLET_BATCH_SIZE, chunk_size=TRANSACTION_CHUNK_SIZE):
+    """
+    Reconcile wallets with low <= id <= high against their ledger, batch by batch
+    Memory stays bounded by batch_size wallets whatever the ledger size
+    With snapshot, record a new snapshot for every wallet without drift that moved
+    or has none yet, so the next run starts from there
+    """
+    last_entry = (
+        Transaction.objects.filter(wallet_id=OuterRef('id'), status='completed')
+        .order_by('-id').values('id')[:1]
+    )
+    report = {'wallets': 0, 'transactions': 0, 'snapshots': 0, 'drift': []}
+    cursor = low - 1
+    while True:
+        # One statement, so each wallet's columns and its last entry id are read at the same instant
+        batch = list(
+            Wallet.objects.filter(id__gt=cursor, id__lte=high).order_by('id')
+            .annotate(last_transaction_id=Subquery(last_entry))
+            .values('id', 'last_transaction_id', *FIELDS)[:batch_size]
+        )
+        if not batch:
+            break
+        cursor = batch[-1]['id']
+        wallets = {wallet['id']: wallet for wallet in batch}
+        for wallet in batch:
+            wallet['last_transaction_id'] = wallet['last_transaction_id'] or 0
+
+        states = _opening_states(list(wallets))
+        report['transactions'] += _replay(states, wallets, chunk_size)
+        report['wallets'] += len(batch)
+
+        snapshots = []
+        for wallet_id, state in states.items():
+            drift = _check(wallet_id, state, wallets[wallet_id])
+            report['drift'].extend(drift)
+            if snapshot and not drift and (state['new'] or not state['snapshotted']):
+                snapshots.append(WalletSnapshot(
+                    wallet_id=wallet_id, last_transaction_id=state['last'], transaction_count=state['count'],
+                    **{field: state[field] for field in FIELDS},
+                ))
+        if snapshots:
+            WalletSnapshot.objects.bulk_create(snapshots, ignore_conflicts=True)
+            report['snapshots'] += len(snapshots)
+    return report
+
+
+def _reconcile_range(args):
+    try:
+        return reconcile_range(*args)
+    finally:
+        # Worker threads get their own connection; close it with the worker
+        connection.close()
+
+
+def reconcile_wallets(workers=1, snapshot=False, batch_size=WALLET_BATCH_SIZE, chunk_size=TRANSACTION_CHUNK_SIZE):
+    """Reconcile every wallet, one wallet id range per worker thread; returns the merged report"""
+    ranges = wallet_id_ranges(workers)
+    report = {'wallets': 0, 'transactions': 0, 'snapshots': 0, 'drift': []}
+    if not ranges:
+        return report
+    jobs = [(low, high, snapshot, batch_size, chunk_size) for low, high in ranges]
+    if workers <= 1:
+        results = [reconcile_range(*job) for job in jobs]
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='wallet-reconcile') as executor:
+            results = list(executor.map(_reconcile_range, jobs))
+    for result in results:
+        for key in ('wallets', 'transactions', 'snapshots'):
+            report[key] += result[key]
+        report['drift'].extend(result['drift'])
+    if report['drift']:
+        logger.warning('Wallet reconciliation found %d discrepancies', len(report['drift']))
+    return report
@@ -1,3 +1,191 @@
-from django.test import TestCase
+import threading
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+
+from users.models import CustomUser
+from .ledger import InsufficientBalance, LedgerError, credit, debit, verify_ledger
+from .models import Transaction, Wallet, WalletSnapshot
+from .reconcile import reconcile_wallets, wallet_id_ranges
+
+
+class LedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='volunteer@example.com', full_name='Volunteer', role='volunteer')
+
+    def setUp(self):
+        self.wallet = Wallet.objects.create(user=self.user)
+
+    def test_credit_and_debit_record_balances(self):
+        first = credit(self.wallet, '100.50')
+        second = debit(self.wallet, 40)
+
+        self.assertEqual((first.balance_before, first.balance_after), (Decimal('0.00'), Decimal('100.50')))
+        self.assertEqual((second.balance_before, second.balance_after), (Decimal('100.50'), Decimal('60.50')))
+        self.assertEqual(second.status, 'completed')
+        self.wallet.refresh_from_db()
+        self.assertEqual(
+            (self.wallet.balance, self.wallet.total_recharged, self.wallet.total_spent),
+            (Decimal('60.50'), Decimal('100.50'), Decimal('40.00')),
+        )
+        self.assertEqual(verify_ledger(self.wallet.id), [])
+
+    def test_debit_never_overdraws(self):
+        credit(self.wallet, 10)
+        with self.assertRaises(InsufficientBalance):
+            debit(self.wallet, '10.01')
+        self.assertIsNone(self.wallet.deduct_balance(11))
+        self.assertEqual(Transaction.objects.filter(wallet=self.wallet).count(), 1)
+        self.assertEqual(Wallet.objects.get(id=self.wallet.id).balance, Decimal('10.00'))
+
+    def test_stale_instance_does_not_clobber_the_balance(self):
+        stale = Wallet.objects.get(id=self.wallet.id)
+        self.wallet.add_balance(50)
+        # The old read-modify-save would have written 20 over the 50
+        stale.add_balance(20)
+        self.assertEqual(stale.balance, Decimal('70.00'))
+        self.assertEqual(Wallet.objects.get(id=self.wallet.id).balance, Decimal('70.00'))
+
+    def test_invalid_movements_are_refused(self):
+        for amount in (0, -5, 'ten'):
+            with self.assertRaises(LedgerError):
+                credit(self.wallet, amount)
+        with self.assertRaises(LedgerError):
+            debit(self.wallet, 5, 'recharge')
+        Wallet.objects.filter(id=self.wallet.id).update(is_active=False)
+        with self.assertRaisesMessage(LedgerError, 'not active'):
+            credit(self.wallet, 5)
+
+
+class ReconciliationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = CustomUser.objects.bulk_create([
+            CustomUser(username=f'volunteer{i}@example.com', full_name=f'Volunteer {i}', role='volunteer')
+            for i in range(3)
+        ])
+
+    def setUp(self):
+        self.wallets = [Wallet.objects.create(user=user) for user in self.users]
+        for wallet in self.wallets:
+            credit(wallet, 100)
+            debit(wallet, 30)
+
+    def test_snapshots_limit_the_replay_to_new_entries(self):
+        report = reconcile_wallets(snapshot=True, batch_size=2, chunk_size=1)
+        self.assertEqual((report['wallets'], report['transactions'], report['snapshots']), (3, 6, 3))
+        self.assertEqual(report['drift'], [])
+        snapshot = WalletSnapshot.objects.get(wallet=self.wallets[0])
+        self.assertEqual((snapshot.balance, snapshot.transaction_count), (Decimal('70.00'), 2))
+
+        credit(self.wallets[1], 5, 'refund')
+        report = reconcile_wallets(snapshot=True)
+        self.assertEqual((report['transactions'], report['snapshots']), (1, 1))
+        self.assertEqual(report['drift'], [])
+        self.assertEqual(WalletSnapshot.objects.filter(wallet=self.wallets[1]).latest('id').balance, Decimal('75.00'))
+
+    def test_second_run_reads_only_new_entries(self):
+        idle = Wallet.objects.create(
+            user=CustomUser.objects.create(username='idle@example.com', full_name='Idle', role='volunteer'),
+        )
+        report = reconcile_wallets(snapshot=True)
+        # The wallet with no entries is snapshotted too, so it is never replayed again
+        self.assertEqual(report['snapshots'], 4)
+        self.assertTrue(WalletSnapshot.objects.filter(wallet=idle, last_transaction_id=0).exists())
+
+        with CaptureQueriesContext(connection) as idle_run:
+            self.assertEqual(reconcile_wallets(snapshot=True)['snapshots'], 0)
+        self.assertEqual(self.replay_rows(idle_run), [])
+
+        credit(self.wallets[2], 5, 'refund')
+        with CaptureQueriesContext(connection) as queries:
+            report = reconcile_wallets(snapshot=True)
+        self.assertEqual((report['transactions'], report['snapshots'], report['drift']), (1, 1, []))
+        self.assertEqual(self.replay_rows(queries), [1])
+
+    def replay_rows(self, queries):
+        """Rows each replay statement read from the ledger"""
+        counts = []
+        for query in queries.captured_queries:
+            if query['sql'].startswith('SELECT "wallet_transactions"'):
+                with connection.cursor() as cursor:
+                    cursor.execute(query['sql'])
+                    counts.append(len(cursor.fetchall()))
+        return counts
+
+    def test_drift_is_reported_and_not_snapshotted(self):
+        reconcile_wallets(snapshot=True)
+        Wallet.objects.filter(id=self.wallets[2].id).update(balance=Decimal('999.00'))
+        entry = debit(self.wallets[0], 10)
+        Transaction.objects.filter(id=entry.id).update(balance_before=Decimal('1.00'))
+
+        report = reconcile_wallets(snapshot=True)
+        drift = {(item['wallet_id'], item['field']) for item in report['drift']}
+        self.assertEqual(drift, {(self.wallets[2].id, 'balance'), (self.wallets[0].id, 'balance_before')})
+        self.assertEqual(report['snapshots'], 0)
+
+    def test_id_ranges_cover_every_wallet(self):
+        ranges = wallet_id_ranges(2)
+        self.assertEqual(ranges[0][0], self.wallets[0].id)
+        self.assertEqual(ranges[-1][1], self.wallets[-1].id)
+        self.assertEqual(sum(high - low + 1 for low, high in ranges), 3)
+
+    def test_command_refuses_zero_workers(self):
+        for option in ('workers', 'batch_size', 'chunk_size'):
+            with self.assertRaisesMessage(CommandError, 'must be at least 1'):
+                call_command('reconcile_wallets', **{option: 0})
+        with self.assertRaises(ValueError):
+            wallet_id_ranges(0)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class LedgerStressTests(TransactionTestCase):
+    """Many threads debiting and crediting one wallet at once (needs a server database)"""
+
+    THREADS = 50
+    OPERATIONS = 20
+
+    def test_concurrent_movements_lose_no_updates(self):
+        user = CustomUser.objects.create(username='volunteer@example.com', full_name='Volunteer', role='volunteer')
+        wallet = Wallet.objects.create(user=user)
+        credit(wallet, 100, 'bonus')
+        done = {'credit': 0, 'debit': 0}
+        errors = []
+        lock = threading.Lock()
+        barrier = threading.Barrier(self.THREADS)
+
+        def run(index):
+            try:
+                barrier.wait()
+                for i in range(self.OPERATIONS):
+                    try:
+                        if (index + i) % 4 == 0:
+                            credit(wallet.id, 1, 'refund')
+                            kind = 'credit'
+                        else:
+                            debit(wallet.id, 1)
+                            kind = 'debit'
+                    except InsufficientBalance:
+                        continue
+                    with lock:
+                        done[kind] += 1
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(index,)) for index in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        wallet.refresh_from_db()
+        self.assertEqual(wallet.balance, Decimal(100 + done['credit'] - done['debit']))
+        self.assertEqual(Transaction.objects.filter(wallet=wallet).count(), 1 + done['credit'] + done['debit'])
+        self.assertEqual(verify_ledger(wallet.id), [])